@@ -40,6 +40,7 @@ class DBPostProcess(object):
         use_dilation=False,
         score_mode="fast",
         box_type="quad",
+        vectorized=False,
         **kwargs,
     ):
         self.thresh = thresh
@@ -49,6 +50,7 @@ class DBPostProcess(object):
         self.min_size = 3
         self.score_mode = score_mode
         self.box_type = box_type
+        self.vectorized = vectorized
         assert score_mode in [
             "slow",
             "fast",
@@ -157,6 +159,191 @@ class DBPostProcess(object):
             scores.append(score)
         return np.array(boxes, dtype="int32"), scores
 
+    def boxes_from_components(self, pred, _bitmap, dest_width, dest_height):
+        """
+        Vectorized boxes_from_bitmap for large maps with many text regions.
+        Every connected component of the bitmap is one candidate. Scores come
+        from bincounts over the label image (score_mode slow) or over the
+        pixels of all min-area rects at once (score_mode fast) instead of a
+        mask per box. Rects are unclipped in closed form: offsetting a w x h
+        rectangle by d gives a (w + 2d) x (h + 2d) min-area rect with the
+        same center and angle.
+        Holes inside a component do not produce boxes of their own.
+        _bitmap: single map with shape (H, W), binarized as {0, 1}
+        """
+        bitmap = np.asarray(_bitmap).astype(np.uint8)
+        height, width = bitmap.shape
+
+        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(
+            bitmap, connectivity=8
+        )
+        num_labels = min(num_labels, self.max_candidates + 1)
+        candidates = np.arange(1, num_labels)
+        # the short side of the min-area rect is never longer than the bbox
+        candidates = candidates[
+            (stats[candidates, cv2.CC_STAT_WIDTH] >= self.min_size)
+            & (stats[candidates, cv2.CC_STAT_HEIGHT] >= self.min_size)
+        ]
+        if self.score_mode == "slow":
+            text_pixels = np.flatnonzero(bitmap)
+            score_sum = np.bincount(
+                labels.ravel()[text_pixels],
+                weights=pred.ravel()[text_pixels],
+                minlength=num_labels,
+            )[:num_labels]
+            area = stats[:num_labels, cv2.CC_STAT_AREA]
+            scores = (score_sum / np.maximum(area, 1))[candidates]
+            candidates = candidates[scores >= self.box_thresh]
+            scores = scores[scores >= self.box_thresh]
+        if len(candidates) == 0:
+            return np.zeros((0, 4, 2), dtype="int32"), []
+
+        centers, sizes, angles = self.component_rects(
+            bitmap, labels, candidates, num_labels
+        )
+        valid = sizes.min(axis=1) >= self.min_size
+        if self.score_mode == "fast":
+            scores = np.zeros(len(candidates))
+            scores[valid] = self.rect_scores(
+                pred, self.box_points(centers[valid], sizes[valid], angles[valid])
+            )
+        valid &= scores >= self.box_thresh
+
+        distance = (
+            sizes[:, 0]
+            * sizes[:, 1]
+            * self.unclip_ratio
+            / np.maximum(2 * (sizes[:, 0] + sizes[:, 1]), 1e-6)
+        )
+        sizes = sizes + 2 * distance[:, None]
+        valid &= sizes.min(axis=1) >= self.min_size + 2
+        boxes = self.box_points(centers[valid], sizes[valid], angles[valid])
+        scores = scores[valid]
+
+        boxes[:, :, 0] = np.clip(
+            np.round(boxes[:, :, 0] / width * dest_width), 0, dest_width
+        )
+        boxes[:, :, 1] = np.clip(
+            np.round(boxes[:, :, 1] / height * dest_height), 0, dest_height
+        )
+        return boxes.astype("int32"), scores.tolist()
+
+    def component_rects(self, bitmap, labels, candidates, num_labels):
+        """
+        Min-area rects (centers, sizes, angles) of the candidate components.
+        Only border pixels are passed to minAreaRect, the hull of a
+        component has no point inside it.
+        """
+        border = bitmap & ~cv2.erode(
+            bitmap,
+            np.ones((3, 3), np.uint8),
+            borderType=cv2.BORDER_CONSTANT,
+            borderValue=0,
+        )
+        border_pixels = np.flatnonzero(border)
+        ys, xs = np.divmod(border_pixels, bitmap.shape[1])
+        point_labels = labels.ravel()[border_pixels]
+        is_candidate = np.zeros(num_labels + 1, dtype=bool)
+        is_candidate[candidates] = True
+        keep = is_candidate[np.minimum(point_labels, num_labels)]
+        point_labels = point_labels[keep]
+        order = np.argsort(point_labels, kind="stable")
+        points = np.stack([xs[keep], ys[keep]], axis=1).astype(np.int32)[order]
+        splits = np.cumsum(np.bincount(point_labels, minlength=num_labels))
+        rects = [
+            cv2.minAreaRect(points[splits[label - 1] : splits[label]])
+            for label in candidates
+        ]
+        centers = np.array([rect[0] for rect in rects], dtype=np.float64)
+        sizes = np.array([rect[1] for rect in rects], dtype=np.float64)
+        angles = np.array([rect[2] for rect in rects], dtype=np.float64)
+        return centers, sizes, angles
+
+    def rect_scores(self, bitmap, boxes):
+        """
+        box_score_fast for N boxes at once. Each row of a box covers one
+        span of pixels, found by intersecting the row with the four edges,
+        and the span sums come from the integral image of the bitmap.
+        """
+        h, w = bitmap.shape[:2]
+        if len(boxes) == 0:
+            return np.zeros((0,))
+        boxes = boxes.astype("int32").astype(np.float64)
+        xmin = np.clip(np.floor(boxes[:, :, 0].min(axis=1)), 0, w - 1)
+        xmax = np.clip(np.ceil(boxes[:, :, 0].max(axis=1)), 0, w - 1)
+        ymin = np.clip(np.floor(boxes[:, :, 1].min(axis=1)), 0, h - 1).astype(np.int64)
+        ymax = np.clip(np.ceil(boxes[:, :, 1].max(axis=1)), 0, h - 1).astype(np.int64)
+        heights = ymax - ymin + 1
+        row_box = np.repeat(np.arange(len(boxes)), heights)
+        py = ymin[row_box] + (
+            np.arange(heights.sum()) - np.repeat(np.cumsum(heights) - heights, heights)
+        )
+
+        # a pixel is inside when it is at most half a pixel outside of every
+        # edge, which keeps the border pixels like fillPoly does
+        lower = xmin[row_box].copy()
+        upper = xmax[row_box].copy()
+        edges = np.roll(boxes, -1, axis=1) - boxes
+        norm = np.maximum(np.sqrt((edges**2).sum(axis=2)), 1e-6)
+        for k in range(4):
+            ex, ey = edges[row_box, k, 0], edges[row_box, k, 1]
+            x0, y0 = boxes[row_box, k, 0], boxes[row_box, k, 1]
+            coef = -ey / norm[row_box, k]
+            const = (ex * (py - y0) + ey * x0) / norm[row_box, k] + 0.5
+            with np.errstate(divide="ignore", invalid="ignore"):
+                bound = -const / coef
+            lower = np.where(coef > 0, np.maximum(lower, bound), lower)
+            upper = np.where(coef < 0, np.minimum(upper, bound), upper)
+            upper = np.where((coef == 0) & (const < 0), -1, upper)
+        lower = np.ceil(lower).astype(np.int64)
+        upper = np.floor(upper).astype(np.int64)
+        count = np.maximum(upper - lower + 1, 0)
+
+        integral = cv2.integral(
+            np.ascontiguousarray(bitmap, dtype=np.float32), sdepth=cv2.CV_64F
+        )
+        upper = np.maximum(upper, lower - 1) + 1
+        lower = np.minimum(lower, w)
+        span_sum = (
+            integral[py + 1, upper]
+            - integral[py, upper]
+            - integral[py + 1, lower]
+            + integral[py, lower]
+        )
+        score_sum = np.bincount(row_box, weights=span_sum, minlength=len(boxes))
+        area = np.bincount(row_box, weights=count, minlength=len(boxes))
+        return score_sum / np.maximum(area, 1)
+
+    def box_points(self, centers, sizes, angles):
+        """
+        cv2.boxPoints for N rects at once, ordered like get_mini_boxes:
+        top-left, top-right, bottom-right, bottom-left.
+        """
+        rad = angles * np.pi / 180.0
+        b = np.cos(rad) * 0.5
+        a = np.sin(rad) * 0.5
+        w, h = sizes[:, 0], sizes[:, 1]
+        cx, cy = centers[:, 0], centers[:, 1]
+        pts = np.empty((len(centers), 4, 2), dtype=np.float64)
+        pts[:, 0, 0] = cx - a * h - b * w
+        pts[:, 0, 1] = cy + b * h - a * w
+        pts[:, 1, 0] = cx + a * h - b * w
+        pts[:, 1, 1] = cy - b * h - a * w
+        pts[:, 2] = 2 * centers - pts[:, 0]
+        pts[:, 3] = 2 * centers - pts[:, 1]
+        pts = pts.astype(np.float32)
+
+        rows = np.arange(len(pts))[:, None]
+        pts = pts[rows, np.argsort(pts[:, :, 0], axis=1, kind="stable")]
+        left_swap = pts[:, 1, 1] <= pts[:, 0, 1]
+        right_swap = pts[:, 3, 1] <= pts[:, 2, 1]
+        index = np.empty((len(pts), 4), dtype=np.int64)
+        index[:, 0] = np.where(left_swap, 1, 0)
+        index[:, 3] = np.where(left_swap, 0, 1)
+        index[:, 1] = np.where(right_swap, 3, 2)
+        index[:, 2] = np.where(right_swap, 2, 3)
+        return pts[rows, index]
+
     def unclip(self, box, unclip_ratio):
         poly = Polygon(box)
         distance = poly.area * unclip_ratio / poly.length
@@ -245,6 +432,10 @@ class DBPostProcess(object):
                 boxes, scores = self.polygons_from_bitmap(
                     pred[batch_index], mask, src_w, src_h
                 )
+            elif self.box_type == "quad" and self.vectorized:
+                boxes, scores = self.boxes_from_components(
+                    pred[batch_index], mask, src_w, src_h
+                )
             elif self.box_type == "quad":
                 boxes, scores = self.boxes_from_bitmap(
                     pred[batch_index], mask, src_w, src_h
@@ -252,7 +443,7 @@ class DBPostProcess(object):
             else:
                 raise ValueError("box_type can only be one of ['quad', 'poly']")
 
-            boxes_batch.append({"points": boxes})
+            boxes_batch.append({"points": boxes, "scores": scores})
         return boxes_batch
 
 
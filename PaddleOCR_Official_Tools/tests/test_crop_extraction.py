@@ -0,0 +1,79 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+
+from tools.infer.utility import (
+    get_perspective_transforms,
+    get_rotate_crop_image,
+    get_rotate_crop_images,
+)
+
+
+def _boxes():
+    rng = np.random.default_rng(0)
+    boxes = []
+    # axis-aligned, around the 1.5 ratio where crops get rotated
+    for width, height in [(91, 61), (61, 91), (60, 90), (40, 59), (40, 60), (40, 61), (200, 30), (30, 200)]:
+        boxes.append([[10, 10], [10 + width, 10], [10 + width, 10 + height], [10, 10 + height]])
+    # random rotated quads
+    for _ in range(30):
+        center = rng.uniform(100, 300, 2)
+        size = rng.uniform([10, 10], [150, 150])
+        angle = rng.uniform(-0.6, 0.6)
+        rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+        corners = (np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]]) * size / 2) @ rotation.T
+        boxes.append(center + corners + rng.uniform(-2, 2, (4, 2)))
+    return np.array(boxes, dtype=np.float32)
+
+
+@pytest.fixture
+def image():
+    rng = np.random.default_rng(1)
+    image = rng.integers(0, 255, (400, 400, 3), dtype=np.uint8)
+    # smooth, so crops warped at slightly different transforms stay close
+    return cv2.GaussianBlur(image, (15, 15), 5)
+
+
+def test_perspective_transforms_match_opencv():
+    boxes = _boxes()
+    dst = np.array([[0, 0], [50, 0], [50, 20], [0, 20]], dtype=np.float32)
+    transforms = get_perspective_transforms(boxes, np.repeat(dst[None], len(boxes), axis=0))
+    for box, M in zip(boxes, transforms):
+        np.testing.assert_allclose(M, cv2.getPerspectiveTransform(box, dst), rtol=1e-6, atol=1e-8)
+
+
+def test_batched_crops_match_get_rotate_crop_image(image):
+    boxes = _boxes()
+    crops = get_rotate_crop_images(image, boxes)
+    assert len(crops) == len(boxes)
+    for box, crop in zip(boxes, crops):
+        expected = get_rotate_crop_image(image, box.copy())
+        assert crop.shape == expected.shape
+        assert np.abs(crop.astype(np.int16) - expected).max() <= 1
+
+
+@pytest.mark.parametrize("target_height", [32, 48])
+def test_crops_at_target_height_match_resized_crops(image, target_height):
+    boxes = _boxes()
+    crops = get_rotate_crop_images(image, boxes, target_height=target_height)
+    for box, crop in zip(boxes, crops):
+        expected = get_rotate_crop_image(image, box.copy())
+        # same orientation, at the recognizer's height
+        assert crop.shape[0] == target_height
+        ratio = expected.shape[1] / expected.shape[0]
+        assert abs(crop.shape[1] - ratio * target_height) <= 1
+        resized = cv2.resize(expected, (crop.shape[1], crop.shape[0]), interpolation=cv2.INTER_AREA)
+        assert np.abs(crop.astype(np.int16) - resized).mean() < 8
+
+
+def test_box_near_the_ratio_keeps_its_orientation(image):
+    # 91x61 is below the 1.5 ratio, 48x32 after scaling is exactly 1.5
+    box = np.array([[10, 10], [71, 10], [71, 101], [10, 101]], dtype=np.float32)
+    assert get_rotate_crop_image(image, box.copy()).shape[:2] == (91, 61)
+    assert get_rotate_crop_images(image, [box], target_height=48)[0].shape[:2] == (48, 32)
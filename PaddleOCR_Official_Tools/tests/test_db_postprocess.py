@@ -0,0 +1,125 @@
+import glob
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+from shapely.geometry import Polygon
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+
+from ppocr.postprocess.db_postprocess import DBPostProcess
+
+REPO_ROOT = os.path.abspath(os.path.join(current_dir, "..", ".."))
+ICDAR_VAL_DIR = os.path.join(
+    REPO_ROOT, "Rumsey_Map_OCR_Data/rumsey/icdar24-val-png/val_images"
+)
+DET_MODEL_DIR = os.path.join(REPO_ROOT, "inference/ch_PP-OCRv4_det_infer")
+
+
+def _text_map(num_boxes=1500, shape=(1500, 2000), seed=0):
+    """
+    Blurred probability map of randomly placed, rotated labels; one label
+    in five is too faint to pass box_thresh.
+    """
+    rng = np.random.RandomState(seed)
+    prob = np.zeros(shape, dtype=np.float32)
+    for _ in range(num_boxes):
+        center = (rng.uniform(0, shape[1]), rng.uniform(0, shape[0]))
+        size = (rng.uniform(6, 60), rng.uniform(4, 16))
+        points = cv2.boxPoints((center, size, rng.uniform(-30, 30)))
+        score = rng.uniform(0.35, 0.5) if rng.rand() < 0.2 else rng.uniform(0.75, 1.0)
+        cv2.fillPoly(prob, [points.astype(np.int32)], float(score))
+    return cv2.GaussianBlur(prob, (5, 5), 1.5)
+
+
+def _match_ratio(boxes, ref_boxes, iou_thresh=0.7):
+    """Fraction of boxes overlapping one of ref_boxes with IoU >= iou_thresh."""
+    if len(boxes) == 0:
+        return 1.0 if len(ref_boxes) == 0 else 0.0
+    ref_polys = [Polygon(box) for box in ref_boxes]
+    matched = 0
+    for box in boxes:
+        poly = Polygon(box)
+        for ref_poly in ref_polys:
+            if not poly.intersects(ref_poly):
+                continue
+            if poly.intersection(ref_poly).area / poly.union(ref_poly).area >= iou_thresh:
+                matched += 1
+                break
+    return matched / len(boxes)
+
+
+def _assert_parity(maps, shape_list, score_mode, min_ratio):
+    params = dict(thresh=0.3, box_thresh=0.6, unclip_ratio=1.5, score_mode=score_mode)
+    ref = DBPostProcess(**params)({"maps": maps}, shape_list)
+    res = DBPostProcess(vectorized=True, **params)({"maps": maps}, shape_list)
+    for ref_img, res_img in zip(ref, res):
+        assert res_img["points"].dtype == np.int32
+        assert len(res_img["points"]) == len(res_img["scores"])
+        assert _match_ratio(res_img["points"], ref_img["points"]) >= min_ratio
+        assert _match_ratio(ref_img["points"], res_img["points"]) >= min_ratio
+
+
+@pytest.mark.parametrize("score_mode", ["fast", "slow"])
+def test_vectorized_matches_contour_boxes(score_mode):
+    prob = _text_map()
+    shape_list = np.array([[prob.shape[0] * 2, prob.shape[1] * 2, 0.5, 0.5]])
+    # only boxes scored right at box_thresh may differ
+    _assert_parity(prob[None, None], shape_list, score_mode, min_ratio=0.95)
+
+
+def test_box_points_order_matches_get_mini_boxes():
+    post_process = DBPostProcess(vectorized=True)
+    rng = np.random.RandomState(1)
+    rects = [
+        ((rng.uniform(0, 500), rng.uniform(0, 500)), tuple(rng.uniform(2, 80, 2)), a)
+        for a in rng.uniform(-90, 90, 200)
+    ] + [((100.0, 100.0), (40.0, 10.0), a) for a in (-90.0, -45.0, 0.0, 45.0, 90.0)]
+    boxes = post_process.box_points(
+        np.array([rect[0] for rect in rects]),
+        np.array([rect[1] for rect in rects]),
+        np.array([rect[2] for rect in rects]),
+    )
+    for rect, box in zip(rects, boxes):
+        ref_box, _ = post_process.get_mini_boxes(
+            cv2.boxPoints(rect).reshape(-1, 1, 2)
+        )
+        np.testing.assert_allclose(box, np.array(ref_box), atol=1e-3)
+
+
+def test_vectorized_empty_map():
+    maps = np.zeros((1, 1, 64, 64), dtype=np.float32)
+    result = DBPostProcess(vectorized=True)({"maps": maps}, np.array([[64, 64, 1, 1]]))
+    assert result[0]["points"].shape == (0, 4, 2)
+    assert result[0]["scores"] == []
+
+
+@pytest.mark.skipif(
+    not (os.path.isdir(ICDAR_VAL_DIR) and os.path.isdir(DET_MODEL_DIR)),
+    reason="ICDAR val images or detection model not available",
+)
+def test_vectorized_parity_on_icdar_val():
+    from tools.infer import utility
+    from tools.infer.predict_det import TextDetector
+
+    args = utility.init_args().parse_args([])
+    args.det_model_dir = DET_MODEL_DIR
+    args.use_gpu = False
+    detector = TextDetector(args)
+
+    captured = []
+    postprocess_op = detector.postprocess_op
+
+    def capture(preds, shape_list):
+        captured.append((preds["maps"], shape_list))
+        return postprocess_op(preds, shape_list)
+
+    detector.postprocess_op = capture
+    for image_file in sorted(glob.glob(os.path.join(ICDAR_VAL_DIR, "*.png")))[:5]:
+        detector.predict(cv2.imread(image_file))
+    assert captured
+    for maps, shape_list in captured:
+        _assert_parity(maps, shape_list, args.det_db_score_mode, min_ratio=0.95)
@@ -0,0 +1,153 @@
+import glob
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+
+from tools.infer import utility
+from tools.infer.predict_det import TextDetector
+
+REPO_ROOT = os.path.abspath(os.path.join(current_dir, "..", ".."))
+ICDAR_VAL_DIR = os.path.join(
+    REPO_ROOT, "Rumsey_Map_OCR_Data/rumsey/icdar24-val-png/val_images"
+)
+DET_MODEL_DIR = os.path.join(REPO_ROOT, "inference/ch_PP-OCRv4_det_infer")
+
+
+class FakePredictor(object):
+    """
+    Stands in for the DB model: the text probability of a pixel is a 3x3
+    average of its darkness, zero padded like a convolution, so the map
+    near the image borders depends on what lies beyond them.
+    """
+
+    def __init__(self):
+        self.input = None
+        self.outputs = None
+        self.batch_sizes = []
+
+    def copy_from_cpu(self, norm_img_batch):
+        self.input = norm_img_batch
+
+    def run(self):
+        self.batch_sizes.append(len(self.input))
+        padded = np.pad(self.input[:, 0], ((0, 0), (1, 1), (1, 1)))
+        height, width = self.input.shape[2:]
+        mean = sum(
+            padded[:, y : y + height, x : x + width] for y in range(3) for x in range(3)
+        ) / 9
+        self.outputs = [(1 / (1 + np.exp(4 * mean)))[:, None].astype(np.float32)]
+
+
+class FakeOutput(object):
+    def __init__(self, predictor, index):
+        self.predictor = predictor
+        self.index = index
+
+    def copy_to_cpu(self):
+        return self.predictor.outputs[self.index]
+
+
+def _detector(monkeypatch, **params):
+    predictor = FakePredictor()
+    monkeypatch.setattr(
+        utility,
+        "create_predictor",
+        lambda args, mode, logger: (predictor, predictor, [FakeOutput(predictor, 0)], None),
+    )
+    args = utility.init_args().parse_args([])
+    args.use_gpu = False
+    for name, value in params.items():
+        setattr(args, name, value)
+    return TextDetector(args), predictor
+
+
+def _page(height, width, rects):
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    for x0, y0, x1, y1 in rects:
+        img[y0:y1, x0:x1] = 20
+    return img
+
+
+# words away from and against the right and bottom borders, where the
+# smaller images of a batch are zero padded
+PAGES = [
+    _page(200, 300, [(20, 20, 120, 40), (180, 170, 300, 200)]),
+    _page(90, 460, [(10, 50, 200, 70), (300, 0, 460, 30)]),
+    _page(330, 170, [(0, 300, 90, 330), (40, 100, 150, 125)]),
+]
+
+
+def _assert_same(batch, single):
+    (batch_boxes, batch_scores), (boxes, scores) = batch, single
+    assert len(boxes) > 0
+    np.testing.assert_array_equal(batch_boxes, boxes)
+    np.testing.assert_allclose(batch_scores, scores, rtol=1e-6)
+
+
+@pytest.mark.parametrize("det_batch_num", [1, 2, 3])
+def test_predict_batch_matches_predict(monkeypatch, det_batch_num):
+    detector, predictor = _detector(monkeypatch, det_batch_num=det_batch_num)
+    singles = [detector.predict(page, return_scores=True)[:2] for page in PAGES]
+    predictor.batch_sizes = []
+
+    boxes_list, scores_list, _ = detector.predict_batch(PAGES, return_scores=True)
+    assert predictor.batch_sizes == [
+        min(det_batch_num, len(PAGES) - i) for i in range(0, len(PAGES), det_batch_num)
+    ]
+    assert len(boxes_list) == len(scores_list) == len(PAGES)
+    for batch, single in zip(zip(boxes_list, scores_list), singles):
+        _assert_same(batch, single)
+
+
+def test_predict_batch_skips_rejected_images(monkeypatch):
+    detector, predictor = _detector(monkeypatch, det_batch_num=3)
+    # the preprocessing may give up on an image (here the wide one)
+    preprocess_op = detector.preprocess_op
+    detector.preprocess_op = [
+        lambda data: None if data["image"].shape[1] > 400 else data
+    ] + preprocess_op
+
+    assert detector.predict(PAGES[1], return_scores=True)[:2] == (None, None)
+    singles = [detector.predict(page, return_scores=True)[:2] for page in PAGES[::2]]
+    boxes_list, scores_list, _ = detector.predict_batch(PAGES, return_scores=True)
+    assert boxes_list[1] is None and scores_list[1] is None
+    for index, single in zip([0, 2], singles):
+        _assert_same((boxes_list[index], scores_list[index]), single)
+
+    # a batch of rejected images does not reach the predictor
+    predictor.batch_sizes = []
+    assert detector.predict_batch([PAGES[1]] * 2, return_scores=True)[:2] == (
+        [None, None],
+        [None, None],
+    )
+    assert predictor.batch_sizes == []
+
+
+@pytest.mark.skipif(
+    not (os.path.isdir(ICDAR_VAL_DIR) and os.path.isdir(DET_MODEL_DIR)),
+    reason="ICDAR val images or detection model not available",
+)
+def test_predict_batch_matches_predict_on_icdar_val():
+    # deeper layers see the zero padding of the smaller images as input, so
+    # the real model may move a border box by a pixel
+    args = utility.init_args().parse_args([])
+    args.det_model_dir = DET_MODEL_DIR
+    args.use_gpu = False
+    args.det_batch_num = 4
+    detector = TextDetector(args)
+    images = [
+        cv2.imread(image_file)
+        for image_file in sorted(glob.glob(os.path.join(ICDAR_VAL_DIR, "*.png")))[:4]
+    ]
+    boxes_list, scores_list, _ = detector.predict_batch(images, return_scores=True)
+    for image, batch_boxes, batch_scores in zip(images, boxes_list, scores_list):
+        boxes, scores, _ = detector.predict(image, return_scores=True)
+        assert len(batch_boxes) == len(boxes)
+        np.testing.assert_allclose(batch_boxes, boxes, atol=2)
+        np.testing.assert_allclose(batch_scores, scores, atol=0.02)
@@ -0,0 +1,149 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+
+from tools.infer.predict_det import DetCache
+from tools.infer.predict_system import TextSystem
+
+
+def _args(tmp_path, **params):
+    model_dir = tmp_path / "det_model"
+    if not model_dir.exists():
+        model_dir.mkdir()
+        (model_dir / "inference.pdiparams").write_bytes(b"weights")
+    args = SimpleNamespace(
+        det_cache_dir=str(tmp_path / "cache"),
+        det_model_dir=str(model_dir),
+        det_algorithm="DB",
+        det_limit_side_len=960,
+        det_box_type="quad",
+        det_db_thresh=0.3,
+        det_db_box_thresh=0.6,
+        det_db_unclip_ratio=1.5,
+        use_tiled_det=False,
+        use_pyramid_det=False,
+    )
+    for name, value in params.items():
+        setattr(args, name, value)
+    return args
+
+
+@pytest.fixture
+def img():
+    return np.random.default_rng(0).integers(0, 255, (64, 96, 3), dtype=np.uint8)
+
+
+QUADS = np.array([[[0, 0], [10, 0], [10, 5], [0, 5]], [[20, 0], [40, 0], [40, 8], [20, 8]]], dtype=np.float32)
+
+
+def test_miss_then_hit(tmp_path, img):
+    cache = DetCache(_args(tmp_path))
+    key = cache.key(img)
+    assert cache.get(key) is None
+    cache.put(key, list(QUADS), [0.9, 0.7])
+
+    points, scores = DetCache(_args(tmp_path)).get(key)
+    np.testing.assert_array_equal(points, QUADS)
+    np.testing.assert_allclose(scores, [0.9, 0.7])
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # another image, or the same one sliced differently, is another entry
+    assert cache.get(cache.key(img[:, ::-1])) is None
+    assert cache.get(cache.key(img, {"horizontal_stride": 300})) is None
+
+
+@pytest.mark.parametrize(
+    "change",
+    [{"det_db_box_thresh": 0.5}, {"det_db_unclip_ratio": 2.0}, {"det_limit_side_len": 1280}, {"use_tiled_det": True}],
+)
+def test_settings_change_invalidates(tmp_path, img, change):
+    cache = DetCache(_args(tmp_path))
+    cache.put(cache.key(img), QUADS, [0.9, 0.7])
+    other = DetCache(_args(tmp_path, **change))
+    assert other.get(other.key(img)) is None
+
+
+def test_model_change_invalidates(tmp_path, img):
+    cache = DetCache(_args(tmp_path))
+    cache.put(cache.key(img), QUADS, [0.9, 0.7])
+    (tmp_path / "det_model" / "inference.pdiparams").write_bytes(b"finetuned weights")
+    other = DetCache(_args(tmp_path))
+    assert other.get(other.key(img)) is None
+
+
+def test_polygons_of_different_lengths(tmp_path, img):
+    cache = DetCache(_args(tmp_path, det_box_type="poly"))
+    polys = [
+        np.array([[0, 0], [10, 0], [12, 4], [10, 8], [0, 8]], dtype=np.float32),
+        np.array([[20, 0], [40, 0], [40, 8], [20, 8]], dtype=np.float32),
+        np.array([[50, 0], [60, 0], [64, 3], [62, 6], [60, 9], [50, 9]], dtype=np.float32),
+    ]
+    key = cache.key(img)
+    cache.put(key, polys, [0.9, 0.8, 0.7])
+    points, scores = cache.get(key)
+    assert len(points) == 3
+    for got, expected in zip(points, polys):
+        np.testing.assert_array_equal(got, expected)
+    np.testing.assert_allclose(scores, [0.9, 0.8, 0.7])
+
+
+class FakeDetector:
+    def __init__(self, boxes):
+        self.boxes = boxes
+        self.calls = 0
+
+    def __call__(self, img, return_scores=False):
+        self.calls += 1
+        return self.boxes, np.linspace(0.9, 0.7, len(self.boxes)).astype(np.float32), 0.1
+
+
+def _text_system(tmp_path, boxes, det_box_type="quad"):
+    text_sys = object.__new__(TextSystem)
+    text_sys.args = _args(tmp_path, det_box_type=det_box_type)
+    text_sys.text_detector = FakeDetector(boxes)
+    text_sys.det_cache = DetCache(text_sys.args)
+    text_sys.text_recognizer = SimpleNamespace(rec_cache=None)
+    return text_sys
+
+
+@pytest.mark.parametrize(
+    "det_box_type, boxes",
+    [
+        ("quad", QUADS),
+        ("poly", [
+            np.array([[0, 0], [10, 0], [12, 4], [10, 8], [0, 8]], dtype=np.float32),
+            np.array([[20, 20], [40, 20], [40, 28], [20, 28]], dtype=np.float32),
+        ]),
+    ],
+)
+def test_text_system_skips_the_detector_on_a_hit(tmp_path, img, det_box_type, boxes):
+    text_sys = _text_system(tmp_path, boxes, det_box_type)
+    dt_boxes, dt_scores, _ = text_sys.detect(img)
+    assert (text_sys.det_cache.last_hits, text_sys.det_cache.last_misses) == (0, 1)
+
+    cached_boxes, cached_scores, elapse = text_sys.detect(img)
+    assert text_sys.text_detector.calls == 1
+    assert (text_sys.det_cache.last_hits, text_sys.det_cache.last_misses) == (1, 0)
+    assert elapse == 0
+    assert len(cached_boxes) == len(dt_boxes)
+    for got, expected in zip(cached_boxes, dt_boxes):
+        np.testing.assert_array_equal(got, expected)
+    np.testing.assert_allclose(cached_scores, dt_scores)
+
+
+def test_caches_disabled(tmp_path, img):
+    text_sys = _text_system(tmp_path, QUADS)
+    cache = text_sys.det_cache
+    with text_sys.caches_disabled():
+        assert text_sys.det_cache is None
+        text_sys.detect(img)
+    assert text_sys.det_cache is cache
+    assert cache.misses == 0
+    text_sys.detect(img)
+    assert text_sys.text_detector.calls == 2
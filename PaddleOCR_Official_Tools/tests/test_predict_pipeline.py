@@ -0,0 +1,116 @@
+import os
+import sys
+import threading
+import types
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+
+from tools.infer import predict_pipeline
+from tools.infer.predict_pipeline import StreamingPipeline, TextPipeline
+
+
+class FakeTextSystem:
+    """Finds one box per image and recognizes it as the image's pixel value."""
+
+    deferred = []
+
+    def detect(self, img):
+        return [np.zeros((4, 2), dtype=np.float32)], np.ones(1, dtype=np.float32), 0.0
+
+    def crop(self, img, dt_boxes):
+        return [img[:1, :1]]
+
+    def recognize(self, dt_boxes, img_crop_list, time_dict=None, dt_scores=None, key=None):
+        if int(img_crop_list[0][0, 0, 0]) == 13:
+            raise ValueError("unreadable crop")
+        rec_res = [(str(int(crop[0, 0, 0])), 1.0) for crop in img_crop_list]
+        return dt_boxes, rec_res, dt_scores
+
+
+def test_streaming_pipeline_keeps_input_order_with_bounded_queues():
+    max_in_flight = []
+    in_flight = []
+    lock = threading.Lock()
+
+    def enter(job):
+        with lock:
+            in_flight.append(job["i"])
+            max_in_flight.append(len(in_flight))
+        return job
+
+    def leave(job):
+        with lock:
+            in_flight.remove(job["i"])
+        job["out"] = job["i"] * 2
+        return job
+
+    pipeline = StreamingPipeline([("enter", enter), ("leave", leave)], queue_size=2)
+    jobs = [job["out"] for job in pipeline({"i": i} for i in range(50))]
+
+    assert jobs == [i * 2 for i in range(50)]
+    # enter can only run ahead of leave by the capacity of the queue between them
+    assert max(max_in_flight) <= 2 + 2
+    stats = pipeline.stats()
+    assert stats["enter"]["processed"] == stats["leave"]["processed"] == 50
+    assert stats["leave"]["max_queue_depth"] <= 2
+
+
+def test_text_pipeline_matches_the_images_and_isolates_failures():
+    images = {"map_{}.png".format(v): np.full((8, 8, 3), v, dtype=np.uint8) for v in range(20)}
+    pipeline = TextPipeline(types.SimpleNamespace(pipeline_queue_size=3, page_num=0), text_sys=FakeTextSystem())
+    # decode keeps job["img"] when it is already set
+    jobs = ({"image_file": name, "img": img} for name, img in images.items())
+
+    results = list(pipeline.pipeline(jobs))
+
+    assert [job["image_file"] for job in results] == list(images)
+    for job in results:
+        value = int(job["image_file"][4:-4])
+        if value == 13:
+            assert job["error"].startswith("rec: ")
+        else:
+            assert job.get("error") is None
+            assert job["rec_res"] == [(str(value), 1.0)]
+    assert pipeline.stats()["rec"]["failed"] == 1
+
+
+def test_text_pipeline_reports_unreadable_files(tmp_path):
+    pipeline = TextPipeline(types.SimpleNamespace(pipeline_queue_size=2, page_num=0), text_sys=FakeTextSystem())
+    missing = str(tmp_path / "missing.png")
+
+    results = list(pipeline([missing]))
+
+    assert results == [(missing, None, None, None)]
+
+
+def test_text_pipeline_reads_every_page_of_a_pdf(monkeypatch):
+    pages = {
+        "atlas.pdf": [np.full((8, 8, 3), v, dtype=np.uint8) for v in (1, 2, 3)],
+        "sheet.pdf": [np.full((8, 8, 3), 4, dtype=np.uint8)],
+    }
+
+    def check_and_read(image_file):
+        if image_file not in pages:
+            raise RuntimeError("cannot open {}".format(image_file))
+        return pages[image_file], False, True
+
+    monkeypatch.setattr(predict_pipeline, "check_and_read", check_and_read)
+    pipeline = TextPipeline(types.SimpleNamespace(pipeline_queue_size=2, page_num=0), text_sys=FakeTextSystem())
+
+    results = [
+        (name, rec_res) for name, _, rec_res, _ in pipeline(["atlas.pdf", "broken.pdf", "sheet.pdf"])
+    ]
+
+    assert results == [
+        ("atlas.pdf_0", [("1", 1.0)]),
+        ("atlas.pdf_1", [("2", 1.0)]),
+        ("atlas.pdf_2", [("3", 1.0)]),
+        ("broken.pdf", None),
+        ("sheet.pdf", [("4", 1.0)]),
+    ]
+    # page_num keeps the first pages only
+    pipeline.page_num = 2
+    assert [name for name, _, _, _ in pipeline(["atlas.pdf"])] == ["atlas.pdf_0", "atlas.pdf_1"]
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+
+from tools.infer.reading_order import line_ids, reading_order
+
+
+def _rect(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+def test_reading_order_lines_then_x():
+    boxes = np.array(
+        [
+            _rect(300, 102, 400, 122),  # line 2, right
+            _rect(0, 0, 100, 20),  # line 1, left
+            _rect(0, 98, 100, 118),  # line 2, left
+            _rect(200, 4, 300, 24),  # line 1, right
+        ],
+        dtype=np.float32,
+    )
+    order = reading_order(boxes)
+    assert order.tolist() == [1, 3, 2, 0]
+    np.testing.assert_array_equal(line_ids(boxes), [1, 0, 1, 0])
+
+
+def test_line_tolerance_scales_with_box_height():
+    # 12 px apart: the same line for 60 px high labels, not for 8 px ones
+    big = np.array([_rect(100, 0, 200, 60), _rect(0, 12, 90, 72)])
+    small = np.array([_rect(100, 0, 200, 8), _rect(0, 12, 90, 20)])
+    assert reading_order(big).tolist() == [1, 0]
+    assert reading_order(small).tolist() == [0, 1]
+
+
+def test_reading_order_is_a_permutation():
+    rng = np.random.RandomState(0)
+    xy = rng.uniform(0, 2000, (500, 2))
+    size = rng.uniform(5, 40, (500, 2))
+    boxes = np.array([_rect(x, y, x + w, y + h) for (x, y), (w, h) in zip(xy, size)])
+    order = reading_order(boxes)
+    assert sorted(order.tolist()) == list(range(500))
+    lines = line_ids(boxes)[order]
+    assert (np.diff(lines) >= 0).all()
+
+
+def test_reading_order_polygons_and_empty():
+    polys = [np.array(_rect(50, 0, 90, 10)), np.array([[0, 0], [40, 0], [40, 5], [20, 10], [0, 10]])]
+    assert reading_order(polys).tolist() == [1, 0]
+    assert reading_order([]).shape == (0,)
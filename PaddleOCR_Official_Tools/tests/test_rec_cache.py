@@ -0,0 +1,86 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+
+from tools.infer import predict_rec
+from tools.infer.predict_rec import RecCache, TextRecognizer
+
+
+def _recognizer(width_buckets=()):
+    """A TextRecognizer with only what resizing needs (no model)."""
+    recognizer = TextRecognizer.__new__(TextRecognizer)
+    recognizer.rec_image_shape = [3, 48, 320]
+    recognizer.rec_algorithm = "SVTR_LCNet"
+    recognizer.rec_width_buckets = list(width_buckets)
+    recognizer.use_onnx = False
+    return recognizer
+
+
+@pytest.mark.parametrize("width_buckets", [(), (320, 480, 640, 960)])
+def test_resized_crops_normalize_like_the_originals(width_buckets):
+    recognizer = _recognizer(width_buckets)
+    rng = np.random.default_rng(0)
+    crops = [
+        rng.integers(0, 255, size=(rng.integers(10, 80), rng.integers(5, 900), 3), dtype=np.uint8)
+        for _ in range(40)
+    ]
+    max_wh_ratio = max(320 / 48, max(c.shape[1] / c.shape[0] for c in crops))
+    for crop in crops:
+        resized = recognizer.resize_rec_img(crop)
+        np.testing.assert_array_equal(
+            recognizer.resize_norm_img(crop, max_wh_ratio, resized=resized),
+            recognizer.resize_norm_img(crop, max_wh_ratio),
+        )
+
+
+def test_rec_cache_merges_the_files_of_every_process(tmp_path, monkeypatch):
+    cache_path = str(tmp_path / "rec_cache.json")
+    crops = [np.full((48, 10 * (i + 1), 3), i, dtype=np.uint8) for i in range(4)]
+
+    # two pool workers of one run, started together, recognizing different crops
+    workers = [RecCache(100, "digest", cache_path=cache_path) for _ in range(2)]
+    for pid, worker, numbers in ((101, workers[0], [0, 1]), (102, workers[1], [2, 3])):
+        monkeypatch.setattr(predict_rec.os, "getpid", lambda: pid)
+        for i in numbers:
+            worker.put(worker.key(crops[i]), ("text{}".format(i), 0.9))
+        worker.save()
+    assert len(list(tmp_path.glob("rec_cache.json.*.part"))) == 2
+
+    # the next run sees the results of both workers
+    cache = RecCache(100, "digest", cache_path=cache_path)
+    assert [cache.get(cache.key(crop))[0] for crop in crops] == [
+        "text0", "text1", "text2", "text3"
+    ]
+    assert list(tmp_path.glob("rec_cache.json.*.part")) == []
+
+    # another model does not reuse them
+    assert RecCache(100, "other", cache_path=cache_path).entries == {}
+
+
+def test_rec_cache_saves_append_only_the_new_entries(tmp_path):
+    cache_path = str(tmp_path / "rec_cache.json")
+    part_path = "{}.{}.part".format(cache_path, os.getpid())
+    crops = [np.full((48, 10 * (i + 1), 3), i, dtype=np.uint8) for i in range(3)]
+
+    cache = RecCache(100, "digest", cache_path=cache_path)
+    cache.put(cache.key(crops[0]), ("text0", 0.9))
+    cache.put(cache.key(crops[1]), ("text1", 0.9))
+    cache.save()
+    cache.save()  # nothing new
+    cache.put(cache.key(crops[2]), ("text2", 0.9))
+    cache.save()
+    with open(part_path, encoding="utf-8") as f:
+        lines = f.readlines()
+    # the digest line, then every entry once
+    assert len(lines) == 4
+
+    # a process killed in the middle of a save loses only the line it was writing
+    with open(part_path, "a", encoding="utf-8") as f:
+        f.write('["abc", ["te')
+    cache = RecCache(100, "digest", cache_path=cache_path)
+    assert [cache.get(cache.key(crop))[0] for crop in crops] == ["text0", "text1", "text2"]
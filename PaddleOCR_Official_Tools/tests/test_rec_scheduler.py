@@ -0,0 +1,64 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+
+from tools.infer.predict_rec import RecScheduler
+
+
+class FakeRecognizer:
+    """Recognizes a crop as its pixel value and records the batch sizes."""
+
+    def __init__(self, rec_batch_num):
+        self.rec_batch_num = rec_batch_num
+        self.calls = []
+
+    def __call__(self, img_list):
+        self.calls.append(len(img_list))
+        return [(str(int(img[0, 0, 0])), 1.0) for img in img_list], 0.1
+
+
+def _crops(values):
+    return [np.full((8, 8 * (v % 5 + 1), 3), v, dtype=np.uint8) for v in values]
+
+
+@pytest.fixture
+def images():
+    return {
+        "map_a": _crops([1, 2, 3]),
+        "map_b": _crops([]),
+        "map_c": _crops([10, 11, 12, 13, 14, 15, 16]),
+        "map_d": _crops([20, 21]),
+    }
+
+
+def test_rec_scheduler_routes_results(images):
+    recognizer = FakeRecognizer(rec_batch_num=4)
+    scheduler = RecScheduler(recognizer, pool_size=8)
+    results = {}
+    for key, img_crop_list in images.items():
+        for done_key, rec_res, _ in scheduler.add(key, img_crop_list):
+            results[done_key] = rec_res
+    for done_key, rec_res, _ in scheduler.flush():
+        results[done_key] = rec_res
+
+    assert set(results) == set(images)
+    for key, img_crop_list in images.items():
+        expected = [str(int(img[0, 0, 0])) for img in img_crop_list]
+        assert [text for text, _ in results[key]] == expected
+
+
+def test_rec_scheduler_only_runs_full_batches_before_flush(images):
+    recognizer = FakeRecognizer(rec_batch_num=4)
+    scheduler = RecScheduler(recognizer, pool_size=8)
+    for key, img_crop_list in images.items():
+        scheduler.add(key, img_crop_list)
+    assert all(num % 4 == 0 for num in recognizer.calls)
+    scheduler.flush()
+    assert sum(recognizer.calls) == 12
+    assert scheduler.stats["crops"] == 12
+    assert scheduler.stats["full_batches"] == 3
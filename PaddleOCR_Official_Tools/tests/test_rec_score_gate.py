@@ -0,0 +1,162 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+
+from tools.infer.predict_system import TextSystem, sorted_boxes, sorted_boxes_index
+
+
+class FakeDetector:
+    """Four stacked boxes with fixed detection scores."""
+
+    scores = np.array([0.9, 0.3, 0.8, 0.5], dtype=np.float32)
+
+    def __call__(self, img, return_scores=False):
+        boxes = np.array(
+            [[[0, y], [50, y], [50, y + 10], [0, y + 10]] for y in (0, 20, 40, 60)],
+            dtype=np.float32,
+        )
+        return boxes, self.scores.copy(), 0.1
+
+
+class FakeRecognizer:
+    """Recognizes a crop as `tag` followed by the top of its box."""
+
+    rec_cache = None
+    rec_batch_num = 2
+
+    def __init__(self, tag):
+        self.tag = tag
+        self.num_crops = 0
+        self.calls = 0
+
+    def __call__(self, img_list):
+        self.calls += 1
+        self.num_crops += len(img_list)
+        return [("{}{}".format(self.tag, int(y)), 0.9) for y in img_list], 0.01
+
+
+def _text_system(policy, gate):
+    text_sys = object.__new__(TextSystem)
+    text_sys.args = SimpleNamespace(
+        use_tiled_det=False,
+        use_pyramid_det=False,
+        det_box_type="poly",
+        save_crop_res=False,
+        rec_pool_size=4,
+    )
+    text_sys.text_detector = FakeDetector()
+    text_sys.det_cache = None
+    text_sys.text_recognizer = FakeRecognizer("main")
+    text_sys.gate_recognizer = FakeRecognizer("cheap")
+    text_sys.rec_score_gate = gate
+    text_sys.rec_gate_policy = policy
+    text_sys.gate_stats = {"boxes": 0, "skipped": 0, "deferred": 0, "cheap": 0}
+    text_sys.deferred = []
+    text_sys.use_angle_cls = False
+    text_sys.drop_score = 0.5
+    # a crop is the top of its box, enough for the fake recognizer
+    text_sys.crop = lambda img, dt_boxes: [box[0][1] for box in dt_boxes]
+    return text_sys
+
+
+@pytest.fixture
+def img():
+    return np.zeros((100, 100, 3), dtype=np.uint8)
+
+
+def test_sorted_boxes_index_matches_sorted_boxes():
+    rng = np.random.RandomState(0)
+    dt_boxes = rng.randint(0, 500, (50, 4, 2)).astype(np.float32)
+    dt_boxes[:, 0, 1] = rng.randint(0, 40, 50)
+    order = sorted_boxes_index(dt_boxes)
+    assert sorted(order) == list(range(50))
+    for box, idx in zip(sorted_boxes(dt_boxes), order):
+        assert (box == dt_boxes[idx]).all()
+
+
+def test_det_scores_follow_the_boxes(img):
+    text_sys = _text_system("skip", 0)
+    dt_boxes, rec_res, dt_scores, _ = text_sys(img, return_det_scores=True)
+    assert [text for text, _ in rec_res] == ["main0", "main20", "main40", "main60"]
+    np.testing.assert_allclose(dt_scores, FakeDetector.scores)
+
+
+def test_gate_skip(img):
+    text_sys = _text_system("skip", 0.6)
+    dt_boxes, rec_res, dt_scores, time_dict = text_sys(img, return_det_scores=True)
+    assert [text for text, _ in rec_res] == ["main0", "main40"]
+    np.testing.assert_allclose(dt_scores, [0.9, 0.8])
+    assert time_dict["rec_gated"] == 2
+    assert text_sys.text_recognizer.num_crops == 2
+    assert text_sys.gate_stats["skipped"] == 2
+
+
+def test_gate_defer(img):
+    text_sys = _text_system("defer", 0.6)
+    _, rec_res, _ = text_sys(img, key="map_a")
+    assert [text for text, _ in rec_res] == ["main0", "main40"]
+    deferred = list(text_sys.recognize_deferred())
+    assert len(deferred) == 1
+    key, dt_boxes, rec_res, dt_scores = deferred[0]
+    assert key == "map_a"
+    assert [text for text, _ in rec_res] == ["main20", "main60"]
+    np.testing.assert_allclose(dt_scores, [0.3, 0.5])
+    assert text_sys.deferred == []
+
+
+def test_merge_deferred_restores_every_image(img):
+    text_sys = _text_system("defer", 0.6)
+    results = {}
+    for key in ("map_a", "map_b"):
+        dt_boxes, rec_res, dt_scores, _ = text_sys(img, return_det_scores=True, key=key)
+        results[key] = (dt_boxes, rec_res, dt_scores)
+    num_crops = text_sys.text_recognizer.num_crops
+    text_sys.text_recognizer.calls = 0
+
+    results = text_sys.merge_deferred(results)
+    for key in ("map_a", "map_b"):
+        dt_boxes, rec_res, dt_scores = results[key]
+        assert [text for text, _ in rec_res] == ["main0", "main20", "main40", "main60"]
+        np.testing.assert_allclose(dt_scores, FakeDetector.scores)
+    # the deferred crops of both images are read in one call
+    assert text_sys.text_recognizer.num_crops == num_crops + 4
+    assert text_sys.text_recognizer.calls == 1
+    assert text_sys.deferred == []
+    assert text_sys.merge_deferred({}) == {}
+
+
+def test_gate_cheap_keeps_reading_order(img):
+    text_sys = _text_system("cheap", 0.6)
+    _, rec_res, dt_scores, _ = text_sys(img, return_det_scores=True)
+    expected = ["main0", "cheap20", "main40", "cheap60"]
+    assert [text for text, _ in rec_res] == expected
+    np.testing.assert_allclose(dt_scores, FakeDetector.scores)
+
+    for _, rec_res, _ in text_sys.predict_many([img, img]):
+        assert [text for text, _ in rec_res] == expected
+    assert text_sys.gate_stats == {"boxes": 12, "skipped": 0, "deferred": 0, "cheap": 6}
+
+
+class FakeClassifier:
+    def __init__(self):
+        self.num_crops = 0
+
+    def __call__(self, img_list):
+        self.num_crops += len(img_list)
+        return img_list, [("0", 1.0)] * len(img_list), 0.01
+
+
+def test_gate_cheap_follows_the_cls_argument(img):
+    text_sys = _text_system("cheap", 0.6)
+    text_sys.use_angle_cls = True
+    text_sys.text_classifier = FakeClassifier()
+    text_sys(img, cls=False)
+    assert text_sys.text_classifier.num_crops == 0
+    text_sys(img)
+    assert text_sys.text_classifier.num_crops == 4
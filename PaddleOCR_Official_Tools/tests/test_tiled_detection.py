@@ -0,0 +1,189 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+
+from tools.infer.utility import (
+    tile_generator,
+    select_text_tiles,
+    polygon_nms,
+    merge_fragmented,
+)
+
+
+def _rect(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+@pytest.mark.parametrize(
+    "shape, tile_size, overlap",
+    [((1000, 2500, 3), 960, 200), ((500, 400, 3), 960, 200), ((960, 960, 3), 960, 0)],
+)
+def test_tile_generator_covers_image(shape, tile_size, overlap):
+    image = np.zeros(shape, dtype=np.uint8)
+    covered = np.zeros(shape[:2], dtype=bool)
+    for tile, v_start, h_start in tile_generator(image, tile_size, overlap):
+        assert tile.shape[0] <= tile_size and tile.shape[1] <= tile_size
+        covered[v_start : v_start + tile.shape[0], h_start : h_start + tile.shape[1]] = True
+    assert covered.all()
+
+
+def test_tile_generator_overlap():
+    image = np.zeros((100, 250, 3), dtype=np.uint8)
+    starts = [h for _, _, h in tile_generator(image, 100, 30)]
+    assert starts == [0, 70, 140, 150]
+
+
+def test_tile_generator_invalid_overlap():
+    with pytest.raises(AssertionError):
+        next(tile_generator(np.zeros((10, 10, 3)), 100, 100))
+
+
+def test_polygon_nms_drops_duplicates_and_fragments():
+    boxes = np.array(
+        [
+            _rect(0, 0, 100, 20),  # full word
+            _rect(1, 0, 101, 20),  # same word seen from the neighbouring tile
+            _rect(60, 0, 100, 20),  # fragment cut at the tile border
+            _rect(200, 0, 260, 20),  # unrelated word
+        ],
+        dtype=np.float32,
+    )
+    keep = polygon_nms(boxes, thresh=0.5)
+    assert keep.tolist() == [0, 3] or keep.tolist() == [1, 3]
+
+
+def test_polygon_nms_respects_scores():
+    boxes = np.array([_rect(0, 0, 100, 20), _rect(0, 0, 100, 21)], dtype=np.float32)
+    keep = polygon_nms(boxes, scores=[0.9, 0.1], thresh=0.5)
+    assert keep.tolist() == [0]
+
+
+def test_polygon_nms_empty():
+    assert polygon_nms(np.zeros((0, 4, 2))).shape == (0,)
+
+
+def test_select_text_tiles_skips_empty_tiles():
+    image = np.zeros((1000, 1000, 3), dtype=np.uint8)
+    tiles = list(tile_generator(image, 500, 0))
+    # quarter resolution heat map with a single label in the top left tile
+    heat_map = np.zeros((250, 250), dtype=np.float32)
+    heat_map[50:55, 40:80] = 0.9
+    keep, skipped = select_text_tiles(tiles, heat_map, (0.25, 0.25), dilate=16)
+    assert keep == [0]
+    assert skipped == pytest.approx(0.75)
+
+
+def test_select_text_tiles_dilates_across_tile_borders():
+    image = np.zeros((1000, 1000, 3), dtype=np.uint8)
+    tiles = list(tile_generator(image, 500, 0))
+    heat_map = np.zeros((250, 250), dtype=np.float32)
+    # text ending 8 image pixels before the border of the right tile
+    heat_map[50:55, 100:123] = 0.9
+    keep, _ = select_text_tiles(tiles, heat_map, (0.25, 0.25), dilate=0)
+    assert keep == [0]
+    keep, _ = select_text_tiles(tiles, heat_map, (0.25, 0.25), dilate=16)
+    assert keep == [0, 1]
+
+
+def test_merge_fragmented_joins_slice_pieces():
+    boxes = np.array(
+        [
+            _rect(100, 50, 200, 70),
+            _rect(500, 400, 560, 420),
+            _rect(202, 52, 300, 71),
+            _rect(298, 49, 350, 70),
+        ],
+        dtype=np.float32,
+    )
+    merged = merge_fragmented(boxes)
+    assert isinstance(merged, np.ndarray) and merged.dtype == np.float32
+    np.testing.assert_array_equal(
+        merged, [_rect(100, 49, 350, 71), _rect(500, 400, 560, 420)]
+    )
+
+
+def test_merge_fragmented_keeps_lines_apart():
+    boxes = np.array([_rect(0, 0, 100, 20), _rect(100, 40, 200, 60)])
+    assert len(merge_fragmented(boxes)) == 2
+
+
+def test_merge_fragmented_rotated_quads():
+    # pieces given in any point order use their min/max extents
+    boxes = np.array(
+        [
+            [[0, 12], [100, 10], [100, 30], [0, 32]],
+            [[200, 30], [105, 31], [105, 11], [200, 10]],
+        ]
+    )
+    np.testing.assert_array_equal(merge_fragmented(boxes), [_rect(0, 10, 200, 32)])
+
+
+def test_merge_fragmented_empty():
+    assert merge_fragmented([]).shape == (0, 4, 2)
+
+
+def _reference_merge_boxes(box1, box2, x_threshold, y_threshold):
+    # merge_boxes before the NumPy rewrite (axis aligned extents)
+    min_x1, max_x1, min_y1, max_y1 = box1[0][0], box1[1][0], box1[0][1], box1[2][1]
+    min_x2, max_x2, min_y2, max_y2 = box2[0][0], box2[1][0], box2[0][1], box2[2][1]
+    if (
+        abs(min_y1 - min_y2) <= y_threshold
+        and abs(max_y1 - max_y2) <= y_threshold
+        and abs(max_x1 - min_x2) <= x_threshold
+    ):
+        return _rect(min(min_x1, min_x2), min(min_y1, min_y2), max(max_x1, max_x2), max(max_y1, max_y2))
+    return None
+
+
+def _reference_merge_fragmented(boxes, x_threshold=10, y_threshold=10):
+    # merge_fragmented before the NumPy rewrite
+    merged_boxes = []
+    visited = set()
+    for i, box1 in enumerate(boxes):
+        if i in visited:
+            continue
+        merged_box = [point[:] for point in box1]
+        for j, box2 in enumerate(boxes[i + 1 :], start=i + 1):
+            if j not in visited:
+                merged_result = _reference_merge_boxes(merged_box, box2, x_threshold, y_threshold)
+                if merged_result:
+                    merged_box = merged_result
+                    visited.add(j)
+        merged_boxes.append(merged_box)
+    if len(merged_boxes) == len(boxes):
+        return np.array(merged_boxes)
+    return _reference_merge_fragmented(merged_boxes, x_threshold, y_threshold)
+
+
+def _random_slice_boxes(rng):
+    # text lines cut into pieces at slice borders, with jitter, plus stray boxes
+    boxes = []
+    for _ in range(rng.integers(1, 8)):
+        x, y = rng.integers(0, 200), rng.integers(0, 120)
+        height = rng.integers(10, 30)
+        for _ in range(rng.integers(1, 5)):
+            width = rng.integers(5, 60)
+            top, bottom = y + rng.integers(-8, 9), y + height + rng.integers(-8, 9)
+            boxes.append(_rect(x, top, x + width, max(bottom, top + 1)))
+            x += width + rng.integers(-6, 16)
+    for _ in range(rng.integers(0, 6)):
+        x, y = rng.integers(0, 300), rng.integers(0, 150)
+        boxes.append(_rect(x, y, x + rng.integers(5, 60), y + rng.integers(5, 30)))
+    boxes = np.array(boxes, dtype=np.float32)
+    return boxes[rng.permutation(len(boxes))]
+
+
+def test_merge_fragmented_matches_previous_implementation():
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        boxes = _random_slice_boxes(rng)
+        x_threshold, y_threshold = rng.integers(2, 15, size=2)
+        expected = _reference_merge_fragmented(boxes, x_threshold, y_threshold)
+        np.testing.assert_array_equal(
+            merge_fragmented(boxes, x_threshold, y_threshold), expected.reshape(-1, 4, 2)
+        )
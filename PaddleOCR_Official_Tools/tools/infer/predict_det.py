@@ -21,6 +21,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(__dir__, "../..")))
 os.environ["FLAGS_allocator_strategy"] = "auto_growth"
 
 import cv2
+import hashlib
 import numpy as np
 import time
 import sys
@@ -33,6 +34,92 @@ from ppocr.postprocess import build_post_process
 import json
 
 
+class DetCache(object):
+    """
+    On-disk detection cache keyed by image content hash, detection model
+    digest and the detection parameters, so that recognition experiments can
+    reuse the boxes of a previous run. Boxes and their detection scores are
+    stored as float32 .npz files; polygons (det_box_type poly) have any
+    number of points, so their points are stored back to back with the
+    number of points of each box.
+    """
+
+    param_keys = [
+        "det_algorithm",
+        "det_limit_side_len",
+        "det_limit_type",
+        "det_box_type",
+        "det_db_thresh",
+        "det_db_box_thresh",
+        "det_db_unclip_ratio",
+        "det_db_score_mode",
+        "det_db_vectorized",
+        "use_dilation",
+        "use_tiled_det",
+        "det_tile_size",
+        "det_tile_overlap",
+        "det_tile_nms_thresh",
+        "use_pyramid_det",
+        "det_coarse_limit_side_len",
+        "det_coarse_thresh",
+        "det_coarse_dilate",
+    ]
+
+    def __init__(self, args):
+        self.cache_dir = args.det_cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+        params = {key: getattr(args, key, None) for key in self.param_keys}
+        self.prefix = "{}|{}".format(
+            utility.get_model_digest(args.det_model_dir),
+            json.dumps(params, sort_keys=True),
+        )
+        self.hits = 0
+        self.misses = 0
+        # counts of the last TextSystem.detect call, for its time_dict
+        self.last_hits = 0
+        self.last_misses = 0
+
+    def key(self, img, extra=None):
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(self.prefix.encode("utf-8"))
+        digest.update(json.dumps(extra, sort_keys=True).encode("utf-8"))
+        digest.update(str((img.shape, img.dtype.str)).encode("utf-8"))
+        digest.update(np.ascontiguousarray(img).data)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".npz")
+
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            self.last_misses += 1
+            return None
+        self.hits += 1
+        self.last_hits += 1
+        with np.load(path) as data:
+            if "lengths" in data:
+                points = np.split(data["points"], np.cumsum(data["lengths"])[:-1])
+                return points, data["scores"]
+            return data["points"], data["scores"]
+
+    def put(self, key, dt_boxes, dt_scores):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        arrays = {"scores": np.asarray(dt_scores, dtype=np.float32)}
+        lengths = {len(box) for box in dt_boxes}
+        if len(lengths) > 1:
+            arrays["points"] = np.concatenate(dt_boxes).astype(np.float32)
+            arrays["lengths"] = np.array([len(box) for box in dt_boxes], dtype=np.int64)
+        else:
+            arrays["points"] = np.asarray(dt_boxes, dtype=np.float32)
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+
 class TextDetector(object):
     def __init__(self, args, logger=None):
         if os.path.exists(f"{args.det_model_dir}/inference.yml"):
@@ -79,6 +166,7 @@ class TextDetector(object):
             postprocess_params["use_dilation"] = args.use_dilation
             postprocess_params["score_mode"] = args.det_db_score_mode
             postprocess_params["box_type"] = args.det_box_type
+            postprocess_params["vectorized"] = args.det_db_vectorized
         elif self.det_algorithm == "DB++":
             postprocess_params["name"] = "DBPostProcess"
             postprocess_params["thresh"] = args.det_db_thresh
@@ -88,6 +176,7 @@ class TextDetector(object):
             postprocess_params["use_dilation"] = args.use_dilation
             postprocess_params["score_mode"] = args.det_db_score_mode
             postprocess_params["box_type"] = args.det_box_type
+            postprocess_params["vectorized"] = args.det_db_vectorized
             pre_process_list[1] = {
                 "NormalizeImage": {
                     "std": [1.0, 1.0, 1.0],
@@ -158,6 +247,18 @@ class TextDetector(object):
                     "DetResizeForTest": {"image_shape": [img_h, img_w]}
                 }
         self.preprocess_op = create_operators(pre_process_list)
+        # low resolution pass of the pyramid detection
+        self.coarse_preprocess_op = create_operators(
+            [
+                {
+                    "DetResizeForTest": {
+                        "limit_side_len": args.det_coarse_limit_side_len,
+                        "limit_type": "max",
+                    }
+                }
+            ]
+            + pre_process_list[1:]
+        )
 
         if args.benchmark:
             import auto_log
@@ -204,10 +305,11 @@ class TextDetector(object):
             points[pno, 1] = int(min(max(points[pno, 1], 0), img_height - 1))
         return points
 
-    def filter_tag_det_res(self, dt_boxes, image_shape):
+    def filter_tag_det_res(self, dt_boxes, image_shape, scores=None):
         img_height, img_width = image_shape[0:2]
         dt_boxes_new = []
-        for box in dt_boxes:
+        keep = []
+        for bno, box in enumerate(dt_boxes):
             if type(box) is list:
                 box = np.array(box)
             box = self.order_points_clockwise(box)
@@ -217,7 +319,10 @@ class TextDetector(object):
             if rect_width <= 3 or rect_height <= 3:
                 continue
             dt_boxes_new.append(box)
+            keep.append(bno)
         dt_boxes = np.array(dt_boxes_new)
+        if scores is not None:
+            return dt_boxes, np.asarray(scores, dtype=np.float32).reshape(-1)[keep]
         return dt_boxes
 
     def filter_tag_det_res_only_clip(self, dt_boxes, image_shape):
@@ -238,7 +343,14 @@ class TextDetector(object):
         dt_boxes = np.array(dt_boxes_new)
         return dt_boxes
 
-    def predict(self, img):
+    def get_det_scores(self, post_result, num_boxes):
+        """DB box scores, or ones for algorithms that do not report them"""
+        scores = post_result.get("scores")
+        if scores is None or len(scores) != num_boxes:
+            return np.ones((num_boxes,), dtype=np.float32)
+        return np.asarray(scores, dtype=np.float32)
+
+    def predict(self, img, return_scores=False):
         ori_im = img.copy()
         data = {"image": img}
 
@@ -248,8 +360,10 @@ class TextDetector(object):
             self.autolog.times.start()
 
         data = transform(data, self.preprocess_op)
-        img, shape_list = data
+        img, shape_list = data if data is not None else (None, None)
         if img is None:
+            if return_scores:
+                return None, None, 0
             return None, 0
         img = np.expand_dims(img, axis=0)
         shape_list = np.expand_dims(shape_list, axis=0)
@@ -293,22 +407,140 @@ class TextDetector(object):
 
         post_result = self.postprocess_op(preds, shape_list)
         dt_boxes = post_result[0]["points"]
+        dt_scores = self.get_det_scores(post_result[0], len(dt_boxes))
 
         if self.args.det_box_type == "poly":
             dt_boxes = self.filter_tag_det_res_only_clip(dt_boxes, ori_im.shape)
         else:
-            dt_boxes = self.filter_tag_det_res(dt_boxes, ori_im.shape)
+            dt_boxes, dt_scores = self.filter_tag_det_res(
+                dt_boxes, ori_im.shape, scores=dt_scores
+            )
 
         if self.args.benchmark:
             self.autolog.times.end(stamp=True)
         et = time.time()
+        if return_scores:
+            return dt_boxes, dt_scores, et - st
         return dt_boxes, et - st
 
-    def __call__(self, img, use_slice=False):
+    def predict_batch(self, img_list, return_scores=False):
+        """
+        Detect text on several images with a single predictor run per
+        `det_batch_num` images. Resized images are zero padded to the largest
+        shape of the batch and the output maps are cropped back per image
+        using shape_list before post processing. Like predict, the boxes and
+        scores of an image the preprocessing rejects are None.
+        """
+        if self.det_algorithm not in ["DB", "DB++", "PSE"]:
+            dt_boxes_list, dt_scores_list, elapse = [], [], 0
+            for img in img_list:
+                dt_boxes, dt_scores, img_elapse = self.predict(img, return_scores=True)
+                dt_boxes_list.append(dt_boxes)
+                dt_scores_list.append(dt_scores)
+                elapse += img_elapse
+            if return_scores:
+                return dt_boxes_list, dt_scores_list, elapse
+            return dt_boxes_list, elapse
+
+        st = time.time()
+        dt_boxes_list = []
+        dt_scores_list = []
+        batch_num = max(1, self.args.det_batch_num)
+        for beg_img_no in range(0, len(img_list), batch_num):
+            batch_imgs = img_list[beg_img_no : beg_img_no + batch_num]
+            if self.args.benchmark:
+                self.autolog.times.start()
+
+            norm_imgs, shape_list, valid = [], [], []
+            for img in batch_imgs:
+                data = transform({"image": img}, self.preprocess_op)
+                norm_img, shape = data if data is not None else (None, None)
+                valid.append(norm_img is not None)
+                if norm_img is not None:
+                    norm_imgs.append(norm_img)
+                    shape_list.append(shape)
+            if not norm_imgs:
+                dt_boxes_list.extend([None] * len(batch_imgs))
+                dt_scores_list.extend([None] * len(batch_imgs))
+                continue
+            shape_list = np.array(shape_list)
+            max_h = max(norm_img.shape[1] for norm_img in norm_imgs)
+            max_w = max(norm_img.shape[2] for norm_img in norm_imgs)
+            norm_img_batch = np.zeros(
+                (len(norm_imgs), norm_imgs[0].shape[0], max_h, max_w), dtype=np.float32
+            )
+            for ino, norm_img in enumerate(norm_imgs):
+                norm_img_batch[ino, :, : norm_img.shape[1], : norm_img.shape[2]] = (
+                    norm_img
+                )
+
+            if self.args.benchmark:
+                self.autolog.times.stamp()
+            outputs = self.run_predictor(norm_img_batch)
+            if self.args.benchmark:
+                self.autolog.times.stamp()
+
+            ino = 0
+            for img, is_valid in zip(batch_imgs, valid):
+                if not is_valid:
+                    dt_boxes_list.append(None)
+                    dt_scores_list.append(None)
+                    continue
+                resize_h, resize_w = norm_imgs[ino].shape[1:3]
+                preds = {"maps": outputs[0][ino : ino + 1, :, :resize_h, :resize_w]}
+                post_result = self.postprocess_op(preds, shape_list[ino : ino + 1])
+                dt_boxes = post_result[0]["points"]
+                dt_scores = self.get_det_scores(post_result[0], len(dt_boxes))
+                if self.args.det_box_type == "poly":
+                    dt_boxes = self.filter_tag_det_res_only_clip(dt_boxes, img.shape)
+                else:
+                    dt_boxes, dt_scores = self.filter_tag_det_res(
+                        dt_boxes, img.shape, scores=dt_scores
+                    )
+                dt_boxes_list.append(dt_boxes)
+                dt_scores_list.append(dt_scores)
+                ino += 1
+
+            if self.args.benchmark:
+                self.autolog.times.end(stamp=True)
+        if return_scores:
+            return dt_boxes_list, dt_scores_list, time.time() - st
+        return dt_boxes_list, time.time() - st
+
+    def run_predictor(self, norm_img_batch):
+        if self.use_onnx:
+            input_dict = {}
+            input_dict[self.input_tensor.name] = norm_img_batch
+            return self.predictor.run(self.output_tensors, input_dict)
+        self.input_tensor.copy_from_cpu(norm_img_batch)
+        self.predictor.run()
+        outputs = []
+        for output_tensor in self.output_tensors:
+            output = output_tensor.copy_to_cpu()
+            outputs.append(output)
+        return outputs
+
+    def predict_heatmap(self, img):
+        """
+        Cheap low resolution pass: the DB text probability map of the whole
+        image, with its longest side limited to det_coarse_limit_side_len.
+        return:
+            heat map(array) of shape [h, w], (ratio_h, ratio_w) from the
+            image to the heat map, elapse
+        """
+        st = time.time()
+        norm_img, shape = transform({"image": img}, self.coarse_preprocess_op)
+        resize_h, resize_w = norm_img.shape[1:3]
+        outputs = self.run_predictor(np.expand_dims(norm_img, axis=0).copy())
+        heat_map = outputs[0][0, 0, :resize_h, :resize_w]
+        return heat_map, (float(shape[2]), float(shape[3])), time.time() - st
+
+    def __call__(self, img, use_slice=False, return_scores=False):
         # For image like poster with one side much greater than the other side,
         # splitting recursively and processing with overlap to enhance performance.
         MIN_BOUND_DISTANCE = 50
         dt_boxes = np.zeros((0, 4, 2), dtype=np.float32)
+        dt_scores = np.zeros((0,), dtype=np.float32)
         elapse = 0
         if (
             img.shape[0] / img.shape[1] > 2
@@ -322,7 +554,9 @@ class TextDetector(object):
                 subimg = img[start_h:end_h, :]
                 if len(subimg) == 0:
                     break
-                sub_dt_boxes, sub_elapse = self.predict(subimg)
+                sub_dt_boxes, sub_scores, sub_elapse = self.predict(
+                    subimg, return_scores=True
+                )
                 offset = start_h
                 # To prevent text blocks from being cut off, roll back a certain buffer area.
                 if (
@@ -334,6 +568,7 @@ class TextDetector(object):
                 else:
                     sorted_indices = np.argsort(sub_dt_boxes[:, 2, 1])
                     sub_dt_boxes = sub_dt_boxes[sorted_indices]
+                    sub_scores = sub_scores[sorted_indices]
                     bottom_line = (
                         0
                         if len(sub_dt_boxes) <= 1
@@ -341,9 +576,9 @@ class TextDetector(object):
                     )
                     if bottom_line > 0:
                         start_h += bottom_line
-                        sub_dt_boxes = sub_dt_boxes[
-                            sub_dt_boxes[:, 2, 1] <= bottom_line
-                        ]
+                        keep = sub_dt_boxes[:, 2, 1] <= bottom_line
+                        sub_dt_boxes = sub_dt_boxes[keep]
+                        sub_scores = sub_scores[keep]
                     else:
                         start_h = end_h
                 if len(sub_dt_boxes) > 0:
@@ -357,6 +592,7 @@ class TextDetector(object):
                             sub_dt_boxes + np.array([0, offset], dtype=np.float32),
                             axis=0,
                         )
+                    dt_scores = np.append(dt_scores, sub_scores)
                 elapse += sub_elapse
         elif (
             img.shape[1] / img.shape[0] > 3
@@ -370,7 +606,9 @@ class TextDetector(object):
                 subimg = img[:, start_w:end_w]
                 if len(subimg) == 0:
                     break
-                sub_dt_boxes, sub_elapse = self.predict(subimg)
+                sub_dt_boxes, sub_scores, sub_elapse = self.predict(
+                    subimg, return_scores=True
+                )
                 offset = start_w
                 if (
                     len(sub_dt_boxes) == 0
@@ -381,6 +619,7 @@ class TextDetector(object):
                 else:
                     sorted_indices = np.argsort(sub_dt_boxes[:, 2, 0])
                     sub_dt_boxes = sub_dt_boxes[sorted_indices]
+                    sub_scores = sub_scores[sorted_indices]
                     right_line = (
                         0
                         if len(sub_dt_boxes) <= 1
@@ -388,7 +627,9 @@ class TextDetector(object):
                     )
                     if right_line > 0:
                         start_w += right_line
-                        sub_dt_boxes = sub_dt_boxes[sub_dt_boxes[:, 1, 0] <= right_line]
+                        keep = sub_dt_boxes[:, 1, 0] <= right_line
+                        sub_dt_boxes = sub_dt_boxes[keep]
+                        sub_scores = sub_scores[keep]
                     else:
                         start_w = end_w
                 if len(sub_dt_boxes) > 0:
@@ -402,9 +643,12 @@ class TextDetector(object):
                             sub_dt_boxes + np.array([offset, 0], dtype=np.float32),
                             axis=0,
                         )
+                    dt_scores = np.append(dt_scores, sub_scores)
                 elapse += sub_elapse
         else:
-            dt_boxes, elapse = self.predict(img)
+            dt_boxes, dt_scores, elapse = self.predict(img, return_scores=True)
+        if return_scores:
+            return dt_boxes, dt_scores, elapse
         return dt_boxes, elapse
 
 
@@ -0,0 +1,288 @@
+# Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import sys
+
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(__dir__)
+sys.path.insert(0, os.path.abspath(os.path.join(__dir__, "../..")))
+
+os.environ["FLAGS_allocator_strategy"] = "auto_growth"
+
+import cv2
+import json
+import queue
+import threading
+import time
+import traceback
+
+import numpy as np
+
+import tools.infer.utility as utility
+from tools.infer.predict_system import TextSystem
+from ppocr.utils.utility import get_image_file_list, check_and_read
+from ppocr.utils.logging import get_logger
+
+logger = get_logger()
+
+_END = object()
+
+
+class PipelineStage(object):
+    """
+    One stage of a StreamingPipeline, running `func` on its own thread.
+    func takes a job dict and returns it after filling in its results.
+    """
+
+    def __init__(self, name, func, in_queue, out_queue):
+        self.name = name
+        self.func = func
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.processed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.max_queue_depth = 0
+        self.thread = None
+
+    def run(self):
+        while True:
+            self.max_queue_depth = max(self.max_queue_depth, self.in_queue.qsize())
+            job = self.in_queue.get()
+            if job is _END:
+                self.out_queue.put(_END)
+                break
+            if job.get("error") is None:
+                st = time.time()
+                try:
+                    job = self.func(job)
+                except Exception as e:
+                    logger.info(traceback.format_exc())
+                    job["error"] = "{}: {}".format(self.name, e)
+                    self.failed += 1
+                self.busy_time += time.time() - st
+                self.processed += 1
+            self.out_queue.put(job)
+
+
+class StreamingPipeline(object):
+    """
+    Run a chain of stages concurrently, each stage on its own thread and
+    connected to the next one by a bounded queue. Jobs leave the pipeline in
+    the order they entered it.
+    args:
+        stages(list): (name, func) pairs, in execution order
+        queue_size(int): capacity of each inter-stage queue
+    """
+
+    def __init__(self, stages, queue_size=4):
+        self.queue_size = queue_size
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+        self.stages = [
+            PipelineStage(name, func, self.queues[i], self.queues[i + 1])
+            for i, (name, func) in enumerate(stages)
+        ]
+        self.start_time = None
+
+    def _feed(self, jobs):
+        for job in jobs:
+            self.queues[0].put(job)
+        self.queues[0].put(_END)
+
+    def __call__(self, jobs):
+        self.start_time = time.time()
+        threads = [threading.Thread(target=self._feed, args=(jobs,), daemon=True)]
+        for stage in self.stages:
+            stage.thread = threading.Thread(target=stage.run, daemon=True)
+            threads.append(stage.thread)
+        for thread in threads:
+            thread.start()
+
+        while True:
+            job = self.queues[-1].get()
+            if job is _END:
+                break
+            yield job
+        for thread in threads:
+            thread.join()
+
+    def stats(self):
+        """
+        Per stage counters. `queue_depth` is the number of jobs currently
+        waiting for the stage; a stage whose input queue stays full and whose
+        utilization is close to 1 is the bottleneck.
+        """
+        elapse = time.time() - self.start_time if self.start_time else 0.0
+        stats = {}
+        for stage in self.stages:
+            stats[stage.name] = {
+                "processed": stage.processed,
+                "failed": stage.failed,
+                "busy_time": stage.busy_time,
+                "utilization": stage.busy_time / elapse if elapse > 0 else 0.0,
+                "queue_depth": stage.in_queue.qsize(),
+                "max_queue_depth": stage.max_queue_depth,
+            }
+        return stats
+
+
+class TextPipeline(object):
+    """
+    Streaming version of TextSystem: decode, detect, crop and recognize run
+    as concurrent stages, so the next image is decoded and detected while
+    the crops of the previous one are being recognized. Every page of a PDF
+    (the first page_num, all if 0) goes through the stages as an image.
+    """
+
+    def __init__(self, args, text_sys=None):
+        self.text_sys = text_sys if text_sys is not None else TextSystem(args)
+        self.page_num = args.page_num
+        self.pipeline = StreamingPipeline(
+            [
+                ("decode", self.decode),
+                ("det", self.detect),
+                ("crop", self.crop),
+                ("rec", self.recognize),
+            ],
+            queue_size=args.pipeline_queue_size,
+        )
+
+    def read_jobs(self, image_files):
+        """
+        One job per image file, and one per page of a PDF. The pages are
+        rendered here, as the whole document is read at once.
+        """
+        for image_file in image_files:
+            if os.path.basename(image_file)[-3:].lower() != "pdf":
+                yield {"image_file": image_file}
+                continue
+            try:
+                pages = check_and_read(image_file)[0]
+            except Exception as e:
+                logger.info(traceback.format_exc())
+                yield {"image_file": image_file, "error": "decode: {}".format(e)}
+                continue
+            if 0 < self.page_num < len(pages):
+                pages = pages[: self.page_num]
+            for page, img in enumerate(pages):
+                yield {"image_file": image_file, "img": img, "page": page, "pages": len(pages)}
+
+    def decode(self, job):
+        img = job.get("img")
+        if img is None:
+            # PDF pages come rendered from read_jobs
+            img, flag_gif, _ = check_and_read(job["image_file"])
+            if not flag_gif:
+                img = cv2.imread(job["image_file"])
+        if img is None:
+            raise ValueError("error in loading image:{}".format(job["image_file"]))
+        job["img"] = img
+        job["time_dict"] = {"det": 0, "rec": 0, "cls": 0, "all": 0}
+        return job
+
+    def detect(self, job):
+        dt_boxes, dt_scores, elapse = self.text_sys.detect(job["img"])
+        job["time_dict"]["det"] = elapse
+        job["dt_boxes"] = dt_boxes if dt_boxes is not None else []
+        job["dt_scores"] = dt_scores
+        return job
+
+    def crop(self, job):
+        job["img_crop_list"] = self.text_sys.crop(job.pop("img"), job["dt_boxes"])
+        return job
+
+    def recognize(self, job):
+        dt_boxes, rec_res, dt_scores = self.text_sys.recognize(
+            job["dt_boxes"],
+            job.pop("img_crop_list"),
+            time_dict=job["time_dict"],
+            dt_scores=job["dt_scores"],
+            key=job.get("image_file"),
+        )
+        if self.text_sys.deferred:
+            # rec_gate_policy defer: the low scoring boxes are read right
+            # after the image's other boxes, on this thread
+            dt_boxes, rec_res, dt_scores = self.text_sys.merge_deferred(
+                {job.get("image_file"): (dt_boxes, rec_res, dt_scores)}
+            )[job.get("image_file")]
+        job["dt_boxes"] = dt_boxes
+        job["rec_res"] = rec_res
+        job["dt_scores"] = dt_scores
+        return job
+
+    def __call__(self, image_files):
+        """
+        yields (image_file, dt_boxes, rec_res, time_dict) in input order;
+        dt_boxes and rec_res are None if the image failed. The pages of a
+        multi-page PDF come one by one, named <image_file>_<page> like in
+        predict_system's results.
+        """
+        for job in self.pipeline(self.read_jobs(image_files)):
+            name = job["image_file"]
+            if job.get("pages", 1) > 1:
+                name = "{}_{}".format(name, job["page"])
+            if job.get("error") is not None:
+                logger.info("{} failed in {}".format(name, job["error"]))
+                yield name, None, None, job.get("time_dict")
+            else:
+                yield name, job["dt_boxes"], job["rec_res"], job["time_dict"]
+
+    def stats(self):
+        return self.pipeline.stats()
+
+
+def main(args):
+    image_file_list = get_image_file_list(args.image_dir)
+    image_file_list = image_file_list[args.process_id :: args.total_process_num]
+    text_pipeline = TextPipeline(args)
+    draw_img_save_dir = args.draw_img_save_dir
+    os.makedirs(draw_img_save_dir, exist_ok=True)
+    save_results = []
+
+    _st = time.time()
+    for image_file, dt_boxes, rec_res, time_dict in text_pipeline(image_file_list):
+        if rec_res is None:
+            continue
+        res = [
+            {
+                "transcription": rec_res[i][0],
+                "points": np.array(dt_boxes[i]).astype(np.int32).tolist(),
+            }
+            for i in range(len(dt_boxes))
+        ]
+        save_results.append(
+            os.path.basename(image_file)
+            + "\t"
+            + json.dumps(res, ensure_ascii=False)
+            + "\n"
+        )
+    logger.info("The predict total time is {}".format(time.time() - _st))
+    for name, stage_stats in text_pipeline.stats().items():
+        logger.info(
+            "stage {}: processed {}, utilization {:.2%}, max queue depth {}".format(
+                name,
+                stage_stats["processed"],
+                stage_stats["utilization"],
+                stage_stats["max_queue_depth"],
+            )
+        )
+
+    with open(
+        os.path.join(draw_img_save_dir, "system_results.txt"), "w", encoding="utf-8"
+    ) as f:
+        f.writelines(save_results)
+
+
+if __name__ == "__main__":
+    main(utility.parse_args())
@@ -21,12 +21,17 @@ sys.path.insert(0, os.path.abspath(os.path.join(__dir__, "../..")))
 
 os.environ["FLAGS_allocator_strategy"] = "auto_growth"
 
+import atexit
 import cv2
+import glob
+import hashlib
+import json
 import numpy as np
 import math
 import time
 import traceback
 import paddle
+from collections import OrderedDict
 
 import tools.infer.utility as utility
 from ppocr.postprocess import build_post_process
@@ -36,6 +41,135 @@ from ppocr.utils.utility import get_image_file_list, check_and_read
 logger = get_logger()
 
 
+class RecCache(object):
+    """
+    LRU cache of recognition results keyed by a hash of the crop as the
+    recognizer resizes it to its input height, plus the recognition model
+    digest.
+    If cache_path is given the cache is loaded from that JSON file. Every
+    process appends the entries it adds to its own file next to it
+    (<cache_path>.<pid>.part, one JSON line per entry after a model digest
+    line), so the workers of a pool do not overwrite each other; the next
+    load merges these files into cache_path.
+    """
+
+    def __init__(self, capacity, model_digest, cache_path=None):
+        self.capacity = capacity
+        self.model_digest = model_digest
+        self.cache_path = cache_path
+        self.save_every = 1000
+        self.entries = OrderedDict()
+        self.unsaved = OrderedDict()  # keys added since the last save
+        self.hits = 0
+        self.misses = 0
+        self.last_hits = 0
+        self.last_misses = 0
+        if cache_path:
+            self.load()
+            atexit.register(self.save)
+
+    def _read(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return []
+        if data.get("model_digest") != self.model_digest:
+            return []
+        return data["entries"]
+
+    def _read_part(self, path):
+        entries = []
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                try:
+                    if json.loads(f.readline()).get("model_digest") != self.model_digest:
+                        return []
+                    for line in f:
+                        entries.append(json.loads(line))
+                except ValueError:
+                    pass  # cut short by a killed process: keep the complete lines
+        except OSError:
+            pass
+        return entries
+
+    def _write(self, path, entries):
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "model_digest": self.model_digest,
+                    "entries": [[key, list(value)] for key, value in entries],
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, path)
+
+    def load(self):
+        """Loads cache_path and the files saved by the processes since, oldest first."""
+        parts = glob.glob(glob.escape(self.cache_path) + ".*.part")
+        parts.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+        for entries in [self._read(self.cache_path)] + [self._read_part(path) for path in parts]:
+            for key, (text, score) in entries:
+                self.entries[key] = (text, score)
+                self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        if parts:
+            # merged into cache_path; a process loading at the same time
+            # writes the same merge
+            self._write(self.cache_path, self.entries.items())
+            for path in parts:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def key(self, img):
+        """Hash of a crop already resized by TextRecognizer.resize_rec_img."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(self.model_digest.encode("utf-8"))
+        digest.update(str(img.shape).encode("utf-8"))
+        digest.update(np.ascontiguousarray(img).data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        if key not in self.entries:
+            self.misses += 1
+            self.last_misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.last_hits += 1
+        return self.entries[key]
+
+    def put(self, key, rec_result):
+        self.entries[key] = (rec_result[0], float(rec_result[1]))
+        self.entries.move_to_end(key)
+        self.unsaved[key] = True
+        while len(self.entries) > self.capacity:
+            self.unsaved.pop(self.entries.popitem(last=False)[0], None)
+        if len(self.unsaved) >= self.save_every:
+            self.save()
+
+    def save(self):
+        """Appends the entries added since the last save to this process's file."""
+        if not self.cache_path or not self.unsaved:
+            return
+        path = "{}.{}.part".format(self.cache_path, os.getpid())
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        lines = [
+            json.dumps([key, list(self.entries[key])], ensure_ascii=False) + "\n"
+            for key in self.unsaved
+        ]
+        self.unsaved = OrderedDict()
+        with open(path, "a", encoding="utf-8") as f:
+            if f.tell() == 0:
+                f.write(json.dumps({"model_digest": self.model_digest}) + "\n")
+            f.writelines(lines)
+
+
 class TextRecognizer(object):
     def __init__(self, args, logger=None):
         if os.path.exists(f"{args.rec_model_dir}/inference.yml"):
@@ -201,8 +335,113 @@ class TextRecognizer(object):
                 logger=logger,
             )
         self.return_word_box = args.return_word_box
+        self.rec_cache = None
+        if args.rec_cache_size > 0 and not self.return_word_box:
+            self.rec_cache = RecCache(
+                args.rec_cache_size,
+                utility.get_model_digest(args.rec_model_dir),
+                cache_path=args.rec_cache_path,
+            )
+        # algorithms padded by resize_norm_img write straight into a reused
+        # float32 batch buffer instead of concatenating per-image arrays
+        self.use_batch_buffer = self.rec_algorithm not in [
+            "SAR",
+            "SRN",
+            "SVTR",
+            "SATRN",
+            "ParseQ",
+            "CPPD",
+            "CPPDPadding",
+            "VisionLAN",
+            "PREN",
+            "SPIN",
+            "ABINet",
+            "RobustScanner",
+            "CAN",
+            "LaTeXOCR",
+            "NRTR",
+            "ViTSTR",
+            "RFL",
+            "RARE",
+        ]
+        self.batch_buffers = OrderedDict()
+        self.max_batch_buffers = 8
+        # pad batches to a fixed set of widths so the predictor only ever
+        # sees a few input shapes and stays on cached kernels
+        self.rec_width_buckets = sorted(
+            int(w) for w in args.rec_width_buckets.split(",") if w.strip()
+        )
+        self.max_batch_buffers = max(self.max_batch_buffers, len(self.rec_width_buckets))
+        self.width_stats = {"batches": 0, "overflow": 0, "padded": 0, "content": 0}
+        if self.rec_width_buckets:
+            self.warmup_width_buckets()
+
+    def warmup_width_buckets(self):
+        imgC, imgH, imgW = self.rec_image_shape[:3]
+        for width in self.rec_width_buckets:
+            # batches are never padded below the configured input width
+            if width < imgW:
+                continue
+            img = np.full((imgH, width, imgC), 128, dtype=np.uint8)
+            self.predict([img] * self.rec_batch_num)
+        self.width_stats = {"batches": 0, "overflow": 0, "padded": 0, "content": 0}
+
+    def padding_waste(self):
+        """Fraction of the padded batch width that holds no image content."""
+        if self.width_stats["padded"] == 0:
+            return 0.0
+        return 1 - self.width_stats["content"] / self.width_stats["padded"]
+
+    def get_norm_img_width(self, max_wh_ratio):
+        imgH = self.rec_image_shape[1]
+        imgW = int((imgH * max_wh_ratio))
+        for bucket_w in self.rec_width_buckets:
+            if bucket_w >= imgW:
+                imgW = bucket_w
+                break
+        if self.use_onnx:
+            w = self.input_tensor.shape[3:][0]
+            if isinstance(w, str):
+                pass
+            elif w is not None and w > 0:
+                imgW = w
+        return imgW
+
+    def get_batch_buffer(self, batch_size, max_wh_ratio):
+        """
+        Return a [batch_size, C, H, W] view of a preallocated float32 buffer.
+        One buffer of rec_batch_num rows is kept per padded width.
+        """
+        imgC, imgH = self.rec_image_shape[:2]
+        imgW = self.get_norm_img_width(max_wh_ratio)
+        buffer = self.batch_buffers.get(imgW)
+        if buffer is None or buffer.shape[0] < batch_size:
+            buffer = np.zeros(
+                (max(batch_size, self.rec_batch_num), imgC, imgH, imgW),
+                dtype=np.float32,
+            )
+            self.batch_buffers[imgW] = buffer
+        self.batch_buffers.move_to_end(imgW)
+        while len(self.batch_buffers) > self.max_batch_buffers:
+            self.batch_buffers.popitem(last=False)
+        return buffer[:batch_size]
 
-    def resize_norm_img(self, img, max_wh_ratio):
+    def resize_rec_img(self, img):
+        """
+        The crop resized to the input height as resize_norm_img resizes it
+        in a batch of its own: hashed by the cache, then passed on to
+        resize_norm_img so it is not resized twice.
+        """
+        imgC, imgH, imgW = self.rec_image_shape[:3]
+        h, w = img.shape[:2]
+        ratio = w / float(h)
+        norm_w = self.get_norm_img_width(max(imgW / imgH, ratio))
+        resized_w = min(norm_w, int(math.ceil(imgH * ratio)))
+        if self.rec_algorithm == "RARE":
+            resized_w = min(resized_w, self.rec_image_shape[2])
+        return cv2.resize(img, (resized_w, imgH))
+
+    def resize_norm_img(self, img, max_wh_ratio, out=None, resized=None):
         imgC, imgH, imgW = self.rec_image_shape
         if self.rec_algorithm == "NRTR" or self.rec_algorithm == "ViTSTR":
             img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
@@ -231,13 +470,7 @@ class TextRecognizer(object):
             return resized_image
 
         assert imgC == img.shape[2]
-        imgW = int((imgH * max_wh_ratio))
-        if self.use_onnx:
-            w = self.input_tensor.shape[3:][0]
-            if isinstance(w, str):
-                pass
-            elif w is not None and w > 0:
-                imgW = w
+        imgW = self.get_norm_img_width(max_wh_ratio)
         h, w = img.shape[:2]
         ratio = w / float(h)
         if math.ceil(imgH * ratio) > imgW:
@@ -248,7 +481,20 @@ class TextRecognizer(object):
             if resized_w > self.rec_image_shape[2]:
                 resized_w = self.rec_image_shape[2]
             imgW = self.rec_image_shape[2]
-        resized_image = cv2.resize(img, (resized_w, imgH))
+        if resized is not None and resized.shape[1] == resized_w:
+            # already resized by resize_rec_img (unless the batch is narrower)
+            resized_image = resized
+        else:
+            resized_image = cv2.resize(img, (resized_w, imgH))
+        if out is not None:
+            # normalize in place into the batch buffer slot
+            norm_view = out[:, :, 0:resized_w]
+            norm_view[...] = resized_image.transpose((2, 0, 1))
+            norm_view /= 255
+            norm_view -= 0.5
+            norm_view /= 0.5
+            out[:, :, resized_w:] = 0
+            return out
         resized_image = resized_image.astype("float32")
         resized_image = resized_image.transpose((2, 0, 1)) / 255
         resized_image -= 0.5
@@ -578,6 +824,39 @@ class TextRecognizer(object):
         return img
 
     def __call__(self, img_list):
+        if self.rec_cache is None:
+            return self.predict(img_list)
+
+        st = time.time()
+        self.rec_cache.last_hits = 0
+        self.rec_cache.last_misses = 0
+        rec_res = [None] * len(img_list)
+        resized_list = [self.resize_rec_img(img) for img in img_list]
+        miss_keys = {}
+        for ino, resized in enumerate(resized_list):
+            key = self.rec_cache.key(resized)
+            cached = self.rec_cache.get(key)
+            if cached is not None:
+                rec_res[ino] = cached
+            else:
+                # identical crops within this call are recognized once
+                miss_keys.setdefault(key, []).append(ino)
+        if miss_keys:
+            miss_res, _ = self.predict(
+                [img_list[inos[0]] for inos in miss_keys.values()],
+                [resized_list[inos[0]] for inos in miss_keys.values()],
+            )
+            for (key, inos), rec_result in zip(miss_keys.items(), miss_res):
+                self.rec_cache.put(key, rec_result)
+                for ino in inos:
+                    rec_res[ino] = rec_result
+        return rec_res, time.time() - st
+
+    def predict(self, img_list, resized_list=None):
+        """
+        Recognizes the crops of img_list. resized_list optionally holds them
+        already resized by resize_rec_img.
+        """
         img_num = len(img_list)
         # Calculate the aspect ratio of all text bars
         width_list = []
@@ -608,6 +887,19 @@ class TextRecognizer(object):
                 wh_ratio = w * 1.0 / h
                 max_wh_ratio = max(max_wh_ratio, wh_ratio)
                 wh_ratio_list.append(wh_ratio)
+            if self.use_batch_buffer:
+                norm_img_buffer = self.get_batch_buffer(
+                    end_img_no - beg_img_no, max_wh_ratio
+                )
+                padded_w = norm_img_buffer.shape[3]
+                self.width_stats["batches"] += 1
+                if self.rec_width_buckets and padded_w > self.rec_width_buckets[-1]:
+                    self.width_stats["overflow"] += 1
+                self.width_stats["padded"] += padded_w * len(wh_ratio_list)
+                self.width_stats["content"] += sum(
+                    min(math.ceil(imgH * wh_ratio), padded_w)
+                    for wh_ratio in wh_ratio_list
+                )
             for ino in range(beg_img_no, end_img_no):
                 if self.rec_algorithm == "SAR":
                     norm_img, _, _, valid_ratio = self.resize_norm_img_sar(
@@ -683,14 +975,26 @@ class TextRecognizer(object):
                     norm_img = self.norm_img_latexocr(img_list[indices[ino]])
                     norm_img = norm_img[np.newaxis, :]
                     norm_img_batch.append(norm_img)
+                elif self.use_batch_buffer:
+                    self.resize_norm_img(
+                        img_list[indices[ino]],
+                        max_wh_ratio,
+                        out=norm_img_buffer[ino - beg_img_no],
+                        resized=resized_list[indices[ino]] if resized_list else None,
+                    )
                 else:
                     norm_img = self.resize_norm_img(
-                        img_list[indices[ino]], max_wh_ratio
+                        img_list[indices[ino]],
+                        max_wh_ratio,
+                        resized=resized_list[indices[ino]] if resized_list else None,
                     )
                     norm_img = norm_img[np.newaxis, :]
                     norm_img_batch.append(norm_img)
-            norm_img_batch = np.concatenate(norm_img_batch)
-            norm_img_batch = norm_img_batch.copy()
+            if self.use_batch_buffer:
+                norm_img_batch = norm_img_buffer
+            else:
+                norm_img_batch = np.concatenate(norm_img_batch)
+                norm_img_batch = norm_img_batch.copy()
             if self.benchmark:
                 self.autolog.times.stamp()
 
@@ -858,6 +1162,64 @@ class TextRecognizer(object):
         return rec_res, time.time() - st
 
 
+class RecScheduler(object):
+    """
+    Pool the crops of many images (maps or tiles) and recognize them in full
+    batches of rec_batch_num. The pool is sorted by aspect ratio inside
+    TextRecognizer, results are routed back to their (key, box index).
+    """
+
+    def __init__(self, text_recognizer, pool_size=None):
+        self.text_recognizer = text_recognizer
+        self.batch_num = text_recognizer.rec_batch_num
+        self.pool_size = max(pool_size or 0, self.batch_num)
+        self.pending = []
+        self.results = {}
+        self.remaining = {}
+        self.elapse = {}
+        self.stats = {"crops": 0, "batches": 0, "full_batches": 0, "rec_time": 0.0}
+
+    def add(self, key, img_crop_list):
+        """
+        Queue the crops of one image. Returns the [(key, rec_res, elapse)]
+        of the images whose crops have all been recognized.
+        """
+        self.results[key] = [["", 0.0]] * len(img_crop_list)
+        self.remaining[key] = len(img_crop_list)
+        self.elapse[key] = 0.0
+        self.pending.extend(
+            (key, bno, img_crop) for bno, img_crop in enumerate(img_crop_list)
+        )
+        if len(self.pending) >= self.pool_size:
+            self._run(len(self.pending) // self.batch_num * self.batch_num)
+        return self.pop_finished()
+
+    def flush(self):
+        self._run(len(self.pending))
+        return self.pop_finished()
+
+    def _run(self, num):
+        if num == 0:
+            return
+        items, self.pending = self.pending[:num], self.pending[num:]
+        rec_res, elapse = self.text_recognizer([img_crop for _, _, img_crop in items])
+        for (key, bno, _), rec_result in zip(items, rec_res):
+            self.results[key][bno] = rec_result
+            self.remaining[key] -= 1
+            self.elapse[key] += elapse / num
+        self.stats["crops"] += num
+        self.stats["batches"] += math.ceil(num / self.batch_num)
+        self.stats["full_batches"] += num // self.batch_num
+        self.stats["rec_time"] += elapse
+
+    def pop_finished(self):
+        finished = []
+        for key in [key for key, remaining in self.remaining.items() if remaining == 0]:
+            del self.remaining[key]
+            finished.append((key, self.results.pop(key), self.elapse.pop(key)))
+        return finished
+
+
 def main(args):
     image_file_list = get_image_file_list(args.image_dir)
     valid_image_file_list = []
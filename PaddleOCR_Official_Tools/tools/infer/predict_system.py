@@ -21,6 +21,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(__dir__, "../..")))
 
 os.environ["FLAGS_allocator_strategy"] = "auto_growth"
 
+import contextlib
 import cv2
 import copy
 import numpy as np
@@ -34,12 +35,16 @@ import tools.infer.predict_det as predict_det
 import tools.infer.predict_cls as predict_cls
 from ppocr.utils.utility import get_image_file_list, check_and_read
 from ppocr.utils.logging import get_logger
+from tools.infer.reading_order import reading_order
 from tools.infer.utility import (
     draw_ocr_box_txt,
-    get_rotate_crop_image,
+    get_rotate_crop_images,
     get_minarea_rect_crop,
     slice_generator,
     merge_fragmented,
+    tile_generator,
+    select_text_tiles,
+    polygon_nms,
 )
 
 logger = get_logger()
@@ -51,7 +56,27 @@ class TextSystem(object):
             logger.setLevel(logging.INFO)
 
         self.text_detector = predict_det.TextDetector(args)
+        self.det_cache = predict_det.DetCache(args) if args.det_cache_dir else None
         self.text_recognizer = predict_rec.TextRecognizer(args)
+        self.rec_score_gate = args.rec_score_gate
+        self.rec_gate_policy = args.rec_gate_policy
+        if self.rec_gate_policy not in ["skip", "defer", "cheap"]:
+            raise ValueError(
+                "rec_gate_policy must be one of skip, defer, cheap, got {}".format(
+                    self.rec_gate_policy
+                )
+            )
+        self.gate_recognizer = None
+        if self.rec_score_gate > 0 and self.rec_gate_policy == "cheap":
+            if not args.rec_gate_model_dir:
+                raise ValueError("rec_gate_policy cheap requires rec_gate_model_dir")
+            gate_args = copy.copy(args)
+            gate_args.rec_model_dir = args.rec_gate_model_dir
+            gate_args.rec_cache_size = 0
+            self.gate_recognizer = predict_rec.TextRecognizer(gate_args)
+        self.gate_stats = {"boxes": 0, "skipped": 0, "deferred": 0, "cheap": 0}
+        self.deferred = []
+        self.pyramid_stats = {"images": 0, "tiles": 0, "tiles_run": 0, "area_skipped": 0}
         self.use_angle_cls = args.use_angle_cls
         self.drop_score = args.drop_score
         if self.use_angle_cls:
@@ -73,15 +98,113 @@ class TextSystem(object):
             logger.debug(f"{bno}, {rec_res[bno]}")
         self.crop_image_res_index += bbox_num
 
-    def __call__(self, img, cls=True, slice={}):
-        time_dict = {"det": 0, "rec": 0, "cls": 0, "all": 0}
+    def tiled_detect(self, img):
+        """
+        Run the detector on overlapping tiles at native resolution and
+        deduplicate the boxes found in more than one tile.
+        """
+        tiles = list(
+            tile_generator(
+                img,
+                tile_size=self.args.det_tile_size,
+                overlap=self.args.det_tile_overlap,
+            )
+        )
+        return self.detect_tiles(tiles)
+
+    def pyramid_detect(self, img):
+        """
+        Coarse to fine detection: a low resolution pass gives the text
+        probability map of the whole image, then the full resolution tiles
+        are detected only where the dilated map shows text.
+        """
+        tiles = list(
+            tile_generator(
+                img,
+                tile_size=self.args.det_tile_size,
+                overlap=self.args.det_tile_overlap,
+            )
+        )
+        if len(tiles) == 1 or self.text_detector.det_algorithm not in ["DB", "DB++"]:
+            return self.detect_tiles(tiles)
+
+        heat_map, ratio, elapse = self.text_detector.predict_heatmap(img)
+        keep, skipped = select_text_tiles(
+            tiles,
+            heat_map,
+            ratio,
+            thresh=self.args.det_coarse_thresh,
+            dilate=self.args.det_coarse_dilate,
+        )
+        self.pyramid_stats["images"] += 1
+        self.pyramid_stats["tiles"] += len(tiles)
+        self.pyramid_stats["tiles_run"] += len(keep)
+        self.pyramid_stats["area_skipped"] += skipped
+        logger.debug(
+            "pyramid det tiles : {} of {}, area skipped : {:.2%}".format(
+                len(keep), len(tiles), skipped
+            )
+        )
+        dt_boxes, dt_scores, tiles_elapse = self.detect_tiles([tiles[i] for i in keep])
+        return dt_boxes, dt_scores, elapse + tiles_elapse
+
+    def detect_tiles(self, tiles):
+        """
+        Detect text on (tile, v_start, h_start) tiles and deduplicate the
+        boxes found in more than one of them.
+        """
+        if not tiles:
+            return (
+                np.zeros((0, 4, 2), dtype=np.float32),
+                np.zeros((0,), dtype=np.float32),
+                0,
+            )
+        dt_boxes_list, dt_scores_list, elapse = self.text_detector.predict_batch(
+            [tile_crop for tile_crop, _, _ in tiles], return_scores=True
+        )
+        dt_tile_boxes, dt_tile_scores = [], []
+        for dt_boxes, dt_scores, (_, v_start, h_start) in zip(
+            dt_boxes_list, dt_scores_list, tiles
+        ):
+            if dt_boxes is not None and dt_boxes.size:
+                dt_boxes = dt_boxes.astype(np.float32)
+                dt_boxes[:, :, 0] += h_start
+                dt_boxes[:, :, 1] += v_start
+                dt_tile_boxes.append(dt_boxes)
+                dt_tile_scores.append(dt_scores)
+        if not dt_tile_boxes:
+            return (
+                np.zeros((0, 4, 2), dtype=np.float32),
+                np.zeros((0,), dtype=np.float32),
+                elapse,
+            )
 
-        if img is None:
-            logger.debug("no valid image provided")
-            return None, None, time_dict
+        dt_boxes = np.concatenate(dt_tile_boxes)
+        dt_scores = np.concatenate(dt_tile_scores)
+        keep = polygon_nms(
+            dt_boxes, scores=dt_scores, thresh=self.args.det_tile_nms_thresh
+        )
+        logger.debug(
+            "tiled det boxes num : {}, after nms : {}".format(len(dt_boxes), len(keep))
+        )
+        return dt_boxes[keep], dt_scores[keep], elapse
+
+    def detect(self, img, slice={}):
+        """
+        Run text detection on a whole image and return the boxes in reading
+        order with their detection scores, or None if the detector produced
+        nothing. Boxes merged from slices get a score of 1.
+        """
+        if self.det_cache is not None:
+            self.det_cache.last_hits = 0
+            self.det_cache.last_misses = 0
+            cache_key = self.det_cache.key(img, slice)
+            cached = self.det_cache.get(cache_key)
+            if cached is not None:
+                dt_boxes, dt_scores = cached
+                logger.debug("dt_boxes num : {}, cached".format(len(dt_boxes)))
+                return list(dt_boxes), dt_scores, 0
 
-        start = time.time()
-        ori_im = img.copy()
         if slice:
             slice_gen = slice_generator(
                 img,
@@ -104,35 +227,84 @@ class TextSystem(object):
                 x_threshold=slice["merge_x_thres"],
                 y_threshold=slice["merge_y_thres"],
             )
+            dt_scores = np.ones((len(dt_boxes),), dtype=np.float32)
             elapse = sum(elapsed)
+        elif self.args.use_pyramid_det:
+            dt_boxes, dt_scores, elapse = self.pyramid_detect(img)
+        elif self.args.use_tiled_det:
+            dt_boxes, dt_scores, elapse = self.tiled_detect(img)
         else:
-            dt_boxes, elapse = self.text_detector(img)
-
-        time_dict["det"] = elapse
+            dt_boxes, dt_scores, elapse = self.text_detector(img, return_scores=True)
 
         if dt_boxes is None:
             logger.debug("no dt_boxes found, elapsed : {}".format(elapse))
-            end = time.time()
-            time_dict["all"] = end - start
-            return None, None, time_dict
-        else:
-            logger.debug(
-                "dt_boxes num : {}, elapsed : {}".format(len(dt_boxes), elapse)
+            return None, None, elapse
+        logger.debug("dt_boxes num : {}, elapsed : {}".format(len(dt_boxes), elapse))
+        order = sorted_boxes_index(dt_boxes)
+        dt_boxes = [dt_boxes[i] for i in order]
+        dt_scores = np.asarray(dt_scores, dtype=np.float32)[order]
+        if self.det_cache is not None:
+            self.det_cache.put(cache_key, dt_boxes, dt_scores)
+        return dt_boxes, dt_scores, elapse
+
+    @contextlib.contextmanager
+    def caches_disabled(self):
+        """Runs the block without the detection and recognition caches (e.g. warm-up on noise)."""
+        det_cache, rec_cache = self.det_cache, self.text_recognizer.rec_cache
+        self.det_cache = self.text_recognizer.rec_cache = None
+        try:
+            yield
+        finally:
+            self.det_cache, self.text_recognizer.rec_cache = det_cache, rec_cache
+
+    def log_det_cache(self, time_dict):
+        """Adds the detection cache hit and miss of the last detect call to time_dict."""
+        if self.det_cache is not None:
+            time_dict["det_cache_hit"] = self.det_cache.last_hits
+            time_dict["det_cache_miss"] = self.det_cache.last_misses
+
+    def crop(self, img, dt_boxes):
+        """
+        Crop every box from the image. Quad crops are warped in one batch
+        directly at the recognition input height.
+        """
+        if self.args.det_box_type == "quad":
+            return get_rotate_crop_images(
+                img, dt_boxes, target_height=self.text_recognizer.rec_image_shape[1]
             )
         img_crop_list = []
-
-        dt_boxes = sorted_boxes(dt_boxes)
-
         for bno in range(len(dt_boxes)):
-            tmp_box = copy.deepcopy(dt_boxes[bno])
-            if self.args.det_box_type == "quad":
-                img_crop = get_rotate_crop_image(ori_im, tmp_box)
-            else:
-                img_crop = get_minarea_rect_crop(ori_im, tmp_box)
-            img_crop_list.append(img_crop)
+            img_crop_list.append(get_minarea_rect_crop(img, dt_boxes[bno]))
+        return img_crop_list
+
+    def recognize(
+        self, dt_boxes, img_crop_list, cls=True, time_dict=None, dt_scores=None, key=None
+    ):
+        """
+        Classify and recognize the crops of one image, then drop the
+        results scoring below drop_score. With rec_score_gate set, boxes with
+        a lower detection score are handled by the gate policy instead.
+        return:
+            filtered boxes, rec results and detection scores
+        """
+        if time_dict is None:
+            time_dict = {"det": 0, "rec": 0, "cls": 0, "all": 0}
+        if dt_scores is None:
+            dt_scores = np.ones((len(dt_boxes),), dtype=np.float32)
+        dt_scores = np.asarray(dt_scores, dtype=np.float32)
+        gated = None
+        if self.rec_score_gate > 0:
+            (dt_boxes, img_crop_list, dt_scores), gated = self.gate(
+                dt_boxes,
+                img_crop_list,
+                dt_scores,
+                cls=cls,
+                key=key,
+                time_dict=time_dict,
+            )
         if self.use_angle_cls and cls:
             img_crop_list, angle_list, elapse = self.text_classifier(img_crop_list)
-            time_dict["cls"] = elapse
+            time_dict["cls"] += elapse
             logger.debug(
                 "cls num  : {}, elapsed : {}".format(len(img_crop_list), elapse)
             )
@@ -143,17 +315,236 @@ class TextSystem(object):
 
         rec_res, elapse = self.text_recognizer(img_crop_list)
         time_dict["rec"] = elapse
+        if self.text_recognizer.rec_cache is not None:
+            time_dict["rec_cache_hit"] = self.text_recognizer.rec_cache.last_hits
+            time_dict["rec_cache_miss"] = self.text_recognizer.rec_cache.last_misses
         logger.debug("rec_res num  : {}, elapsed : {}".format(len(rec_res), elapse))
         if self.args.save_crop_res:
             self.draw_crop_rec_res(self.args.crop_res_save_dir, img_crop_list, rec_res)
-        filter_boxes, filter_rec_res = [], []
-        for box, rec_result in zip(dt_boxes, rec_res):
+
+        if gated is not None:
+            dt_boxes, rec_res, dt_scores = self.merge_gated(
+                dt_boxes, rec_res, dt_scores, gated
+            )
+        return self.filter_rec_res(dt_boxes, rec_res, dt_scores)
+
+    def gate(
+        self, dt_boxes, img_crop_list, dt_scores, cls=True, key=None, time_dict=None
+    ):
+        """
+        Split off the boxes whose detection score is below rec_score_gate.
+        Depending on rec_gate_policy they are dropped (skip), put aside for
+        merge_deferred (defer) or read right away by the cheaper gate
+        recognizer (cheap).
+        return:
+            (dt_boxes, img_crop_list, dt_scores) of the boxes left for the
+            main recognizer, and (dt_boxes, rec_res, dt_scores) of the boxes
+            read by the gate recognizer or None
+        """
+        low = dt_scores < self.rec_score_gate
+        num_low = int(low.sum())
+        self.gate_stats["boxes"] += len(dt_boxes)
+        if time_dict is not None:
+            time_dict["rec_gated"] = num_low
+        if num_low == 0:
+            return (dt_boxes, img_crop_list, dt_scores), None
+
+        high_idx, low_idx = np.flatnonzero(~low), np.flatnonzero(low)
+        gated_boxes = [dt_boxes[i] for i in low_idx]
+        gated_crops = [img_crop_list[i] for i in low_idx]
+        kept = (
+            [dt_boxes[i] for i in high_idx],
+            [img_crop_list[i] for i in high_idx],
+            dt_scores[high_idx],
+        )
+        if self.rec_gate_policy == "skip":
+            self.gate_stats["skipped"] += num_low
+            return kept, None
+        if self.rec_gate_policy == "defer":
+            self.gate_stats["deferred"] += num_low
+            self.deferred.append((key, gated_boxes, gated_crops, dt_scores[low_idx]))
+            return kept, None
+
+        self.gate_stats["cheap"] += num_low
+        if self.use_angle_cls and cls:
+            gated_crops, _, elapse = self.text_classifier(gated_crops)
+            if time_dict is not None:
+                time_dict["cls"] += elapse
+        gated_res, elapse = self.gate_recognizer(gated_crops)
+        if time_dict is not None:
+            time_dict["rec_gate"] = elapse
+        logger.debug(
+            "gated rec_res num  : {}, elapsed : {}".format(len(gated_res), elapse)
+        )
+        return kept, (gated_boxes, gated_res, dt_scores[low_idx])
+
+    def merge_gated(self, dt_boxes, rec_res, dt_scores, gated):
+        """Put the results of the gate recognizer back in reading order"""
+        gated_boxes, gated_res, gated_scores = gated
+        dt_boxes = list(dt_boxes) + gated_boxes
+        rec_res = list(rec_res) + gated_res
+        dt_scores = np.concatenate([dt_scores, gated_scores])
+        order = sorted_boxes_index(dt_boxes)
+        return (
+            [dt_boxes[i] for i in order],
+            [rec_res[i] for i in order],
+            dt_scores[order],
+        )
+
+    def recognize_deferred(self, cls=True):
+        """
+        Recognize the boxes put aside by the defer gate policy with the main
+        recognizer, the crops of all images in one call so batches are full.
+        yields (key, filter_boxes, filter_rec_res, filter_scores) for every
+        image with deferred boxes, key being the one passed to recognize.
+        """
+        deferred, self.deferred = self.deferred, []
+        img_crop_list = [crop for _, _, crops, _ in deferred for crop in crops]
+        if not img_crop_list:
+            return
+        if self.use_angle_cls and cls:
+            img_crop_list, _, _ = self.text_classifier(img_crop_list)
+        rec_res, _ = self.text_recognizer(img_crop_list)
+        start = 0
+        for key, dt_boxes, crops, dt_scores in deferred:
+            end = start + len(crops)
+            yield (key,) + self.filter_rec_res(dt_boxes, rec_res[start:end], dt_scores)
+            start = end
+
+    def merge_deferred(self, results, cls=True):
+        """
+        Recognize the deferred boxes and merge them, in reading order, into
+        results: a dict key -> (dt_boxes, rec_res, dt_scores) of the images
+        they were deferred from. Drivers call it after every image or batch,
+        so deferred crops are never held longer than that.
+        """
+        for key, dt_boxes, rec_res, dt_scores in self.recognize_deferred(cls=cls):
+            results[key] = self.merge_gated(
+                *results[key], (dt_boxes, rec_res, dt_scores)
+            )
+        return results
+
+    def filter_rec_res(self, dt_boxes, rec_res, dt_scores=None):
+        if dt_scores is None:
+            dt_scores = np.ones((len(dt_boxes),), dtype=np.float32)
+        filter_boxes, filter_rec_res, keep = [], [], []
+        for bno, (box, rec_result) in enumerate(zip(dt_boxes, rec_res)):
             text, score = rec_result[0], rec_result[1]
             if score >= self.drop_score:
                 filter_boxes.append(box)
                 filter_rec_res.append(rec_result)
+                keep.append(bno)
+        return filter_boxes, filter_rec_res, np.asarray(dt_scores)[keep]
+
+    def __call__(self, img, cls=True, slice={}, return_det_scores=False, key=None):
+        """
+        return:
+            filter_boxes, filter_rec_res, time_dict; with return_det_scores
+            the detection scores of the boxes come before time_dict.
+            key identifies the image in recognize_deferred.
+        """
+        time_dict = {"det": 0, "rec": 0, "cls": 0, "all": 0}
+
+        if img is None:
+            logger.debug("no valid image provided")
+            if return_det_scores:
+                return None, None, None, time_dict
+            return None, None, time_dict
+
+        start = time.time()
+        dt_boxes, dt_scores, elapse = self.detect(img, slice=slice)
+        time_dict["det"] = elapse
+        self.log_det_cache(time_dict)
+
+        if dt_boxes is None:
+            end = time.time()
+            time_dict["all"] = end - start
+            if return_det_scores:
+                return None, None, None, time_dict
+            return None, None, time_dict
+
+        img_crop_list = self.crop(img, dt_boxes)
+        filter_boxes, filter_rec_res, filter_scores = self.recognize(
+            dt_boxes,
+            img_crop_list,
+            cls=cls,
+            time_dict=time_dict,
+            dt_scores=dt_scores,
+            key=key,
+        )
         end = time.time()
         time_dict["all"] = end - start
+        if return_det_scores:
+            return filter_boxes, filter_rec_res, filter_scores, time_dict
+        return filter_boxes, filter_rec_res, time_dict
+
+    def predict_many(self, img_list, cls=True, return_det_scores=False):
+        """
+        Run the whole system on several images, recognizing the crops of
+        all of them through a RecScheduler so every rec batch is full.
+        yields (dt_boxes, rec_res, time_dict) per image, in input order, with
+        the detection scores before time_dict if return_det_scores is set.
+        Deferred boxes are keyed by the index of their image, for
+        merge_deferred once the caller has the results of its batch.
+        """
+        scheduler = predict_rec.RecScheduler(
+            self.text_recognizer, pool_size=self.args.rec_pool_size
+        )
+        detected = {}
+        finished = {}
+        next_idx = 0
+        for idx, img in enumerate(img_list):
+            start = time.time()
+            time_dict = {"det": 0, "rec": 0, "cls": 0, "all": 0}
+            dt_boxes, dt_scores, elapse = self.detect(img)
+            time_dict["det"] = elapse
+            self.log_det_cache(time_dict)
+            if dt_boxes is None:
+                dt_boxes, dt_scores = [], np.zeros((0,), dtype=np.float32)
+            img_crop_list = self.crop(img, dt_boxes)
+            gated = None
+            if self.rec_score_gate > 0:
+                (dt_boxes, img_crop_list, dt_scores), gated = self.gate(
+                    dt_boxes,
+                    img_crop_list,
+                    dt_scores,
+                    cls=cls,
+                    key=idx,
+                    time_dict=time_dict,
+                )
+            if self.use_angle_cls and cls:
+                img_crop_list, angle_list, elapse = self.text_classifier(img_crop_list)
+                time_dict["cls"] += elapse
+            time_dict["all"] = time.time() - start
+            detected[idx] = (dt_boxes, dt_scores, gated, time_dict)
+
+            for key, rec_res, elapse in scheduler.add(idx, img_crop_list):
+                finished[key] = (rec_res, elapse)
+            while next_idx in finished:
+                yield self._finish_many(detected, finished, next_idx, return_det_scores)
+                next_idx += 1
+
+        for key, rec_res, elapse in scheduler.flush():
+            finished[key] = (rec_res, elapse)
+        while next_idx in finished:
+            yield self._finish_many(detected, finished, next_idx, return_det_scores)
+            next_idx += 1
+        logger.debug("rec scheduler stats: {}".format(scheduler.stats))
+
+    def _finish_many(self, detected, finished, idx, return_det_scores=False):
+        dt_boxes, dt_scores, gated, time_dict = detected.pop(idx)
+        rec_res, elapse = finished.pop(idx)
+        time_dict["rec"] = elapse
+        time_dict["all"] += elapse
+        if gated is not None:
+            dt_boxes, rec_res, dt_scores = self.merge_gated(
+                dt_boxes, rec_res, dt_scores, gated
+            )
+        filter_boxes, filter_rec_res, filter_scores = self.filter_rec_res(
+            dt_boxes, rec_res, dt_scores
+        )
+        if return_det_scores:
+            return filter_boxes, filter_rec_res, filter_scores, time_dict
         return filter_boxes, filter_rec_res, time_dict
 
 
@@ -165,21 +556,15 @@ def sorted_boxes(dt_boxes):
     return:
         sorted boxes(array) with shape [4, 2]
     """
-    num_boxes = dt_boxes.shape[0]
-    sorted_boxes = sorted(dt_boxes, key=lambda x: (x[0][1], x[0][0]))
-    _boxes = list(sorted_boxes)
-
-    for i in range(num_boxes - 1):
-        for j in range(i, -1, -1):
-            if abs(_boxes[j + 1][0][1] - _boxes[j][0][1]) < 10 and (
-                _boxes[j + 1][0][0] < _boxes[j][0][0]
-            ):
-                tmp = _boxes[j]
-                _boxes[j] = _boxes[j + 1]
-                _boxes[j + 1] = tmp
-            else:
-                break
-    return _boxes
+    return [dt_boxes[i] for i in sorted_boxes_index(dt_boxes)]
+
+
+def sorted_boxes_index(dt_boxes):
+    """
+    Same order as sorted_boxes, returned as indices into dt_boxes so that
+    arrays parallel to the boxes can be reordered with them
+    """
+    return reading_order(dt_boxes)
 
 
 def main(args):
@@ -198,11 +583,12 @@ def main(args):
         "if you are using recognition model with PP-OCRv2 or an older version, please set --rec_image_shape='3,32,320"
     )
 
-    # warm up 10 times
+    # warm up 10 times, without filling the caches with noise
     if args.warmup:
         img = np.random.uniform(0, 255, [640, 640, 3]).astype(np.uint8)
-        for i in range(10):
-            res = text_sys(img)
+        with text_sys.caches_disabled():
+            for i in range(10):
+                res = text_sys(img)
 
     total_time = 0
     cpu_mem, gpu_mem, gpu_util = 0, 0, 0
@@ -224,7 +610,13 @@ def main(args):
             imgs = img[:page_num]
         for index, img in enumerate(imgs):
             starttime = time.time()
-            dt_boxes, rec_res, time_dict = text_sys(img)
+            dt_boxes, rec_res, dt_scores, time_dict = text_sys(
+                img, return_det_scores=True, key=index
+            )
+            if text_sys.deferred:
+                dt_boxes, rec_res, dt_scores = text_sys.merge_deferred(
+                    {index: (dt_boxes, rec_res, dt_scores)}
+                )[index]
             elapse = time.time() - starttime
             total_time += elapse
             if len(imgs) > 1:
@@ -297,6 +689,37 @@ def main(args):
                 )
 
     logger.info("The predict total time is {}".format(time.time() - _st))
+    if text_sys.text_recognizer.rec_width_buckets:
+        logger.info(
+            "rec width buckets {}: {} batches, {} wider than the largest bucket, padding waste {:.2%}".format(
+                text_sys.text_recognizer.rec_width_buckets,
+                text_sys.text_recognizer.width_stats["batches"],
+                text_sys.text_recognizer.width_stats["overflow"],
+                text_sys.text_recognizer.padding_waste(),
+            )
+        )
+    if args.use_pyramid_det and text_sys.pyramid_stats["images"]:
+        pyramid_stats = text_sys.pyramid_stats
+        logger.info(
+            "pyramid det: {} of {} tiles detected, {:.2%} of the map area skipped on average".format(
+                pyramid_stats["tiles_run"],
+                pyramid_stats["tiles"],
+                pyramid_stats["area_skipped"] / pyramid_stats["images"],
+            )
+        )
+    if args.rec_score_gate > 0:
+        gate_stats = text_sys.gate_stats
+        logger.info(
+            "rec score gate {} ({}): {} of {} boxes below the gate, {} skipped, {} deferred, {} read by the gate model".format(
+                args.rec_score_gate,
+                args.rec_gate_policy,
+                gate_stats["skipped"] + gate_stats["deferred"] + gate_stats["cheap"],
+                gate_stats["boxes"],
+                gate_stats["skipped"],
+                gate_stats["deferred"],
+                gate_stats["cheap"],
+            )
+        )
     if args.benchmark:
         text_sys.text_detector.autolog.report()
         text_sys.text_recognizer.autolog.report()
@@ -0,0 +1,78 @@
+# Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import numpy as np
+
+__all__ = ["line_ids", "reading_order"]
+
+
+def _extents(dt_boxes):
+    """min x, min y and max y of every box; polygons may differ in length"""
+    try:
+        boxes = np.asarray(dt_boxes, dtype=np.float32).reshape(len(dt_boxes), -1, 2)
+    except ValueError:
+        boxes = [np.asarray(box, dtype=np.float32).reshape(-1, 2) for box in dt_boxes]
+        return (
+            np.array([box[:, 0].min() for box in boxes]),
+            np.array([box[:, 1].min() for box in boxes]),
+            np.array([box[:, 1].max() for box in boxes]),
+        )
+    return (
+        boxes[:, :, 0].min(axis=1),
+        boxes[:, :, 1].min(axis=1),
+        boxes[:, :, 1].max(axis=1),
+    )
+
+
+def line_ids(dt_boxes, line_tol=0.5):
+    """
+    Group text boxes into lines. Boxes are sorted by the center of their
+    y-extent and a new line starts wherever two consecutive centers are
+    further apart than line_tol times the height of the smaller box, so
+    the tolerance follows the text size instead of a fixed pixel count.
+    args:
+        dt_boxes(array): boxes with shape [N, K, 2]
+        line_tol(float): allowed center gap, as a fraction of box height
+    return:
+        line index of every box (array) with shape [N], numbered from
+        top to bottom
+    """
+    if len(dt_boxes) == 0:
+        return np.zeros((0,), dtype=np.int64)
+    _, min_y, max_y = _extents(dt_boxes)
+    centers = (min_y + max_y) / 2
+    heights = np.maximum(max_y - min_y, 1.0)
+
+    by_center = np.argsort(centers, kind="stable")
+    gaps = np.diff(centers[by_center])
+    tol = line_tol * np.minimum(heights[by_center[:-1]], heights[by_center[1:]])
+    ids = np.empty(len(dt_boxes), dtype=np.int64)
+    ids[by_center] = np.concatenate([[0], np.cumsum(gaps > tol)])
+    return ids
+
+
+def reading_order(dt_boxes, line_tol=0.5):
+    """
+    Order text boxes from top to bottom, left to right: lines from
+    line_ids, then the left edge of the boxes within a line.
+    args:
+        dt_boxes(array): boxes with shape [N, K, 2]
+        line_tol(float): see line_ids
+    return:
+        permutation (array) with shape [N]; index dt_boxes and any array
+        parallel to it with it
+    """
+    if len(dt_boxes) == 0:
+        return np.zeros((0,), dtype=np.int64)
+    min_x, _, _ = _extents(dt_boxes)
+    return np.lexsort((min_x, line_ids(dt_boxes, line_tol)))
@@ -72,6 +72,19 @@ def init_args():
     parser.add_argument("--max_batch_size", type=int, default=10)
     parser.add_argument("--use_dilation", type=str2bool, default=False)
     parser.add_argument("--det_db_score_mode", type=str, default="fast")
+    parser.add_argument("--det_db_vectorized", type=str2bool, default=False)
+    parser.add_argument("--det_batch_num", type=int, default=8)
+    parser.add_argument("--det_cache_dir", type=str, default=None)
+
+    # params for tiled detection on large images
+    parser.add_argument("--use_tiled_det", type=str2bool, default=False)
+    parser.add_argument("--det_tile_size", type=int, default=960)
+    parser.add_argument("--det_tile_overlap", type=int, default=200)
+    parser.add_argument("--det_tile_nms_thresh", type=float, default=0.5)
+    parser.add_argument("--use_pyramid_det", type=str2bool, default=False)
+    parser.add_argument("--det_coarse_limit_side_len", type=int, default=1280)
+    parser.add_argument("--det_coarse_thresh", type=float, default=0.1)
+    parser.add_argument("--det_coarse_dilate", type=int, default=64)
 
     # EAST params
     parser.add_argument("--det_east_score_thresh", type=float, default=0.8)
@@ -100,6 +113,13 @@ def init_args():
     parser.add_argument("--rec_image_inverse", type=str2bool, default=True)
     parser.add_argument("--rec_image_shape", type=str, default="3, 48, 320")
     parser.add_argument("--rec_batch_num", type=int, default=6)
+    parser.add_argument("--rec_pool_size", type=int, default=64)
+    parser.add_argument("--rec_width_buckets", type=str, default="")
+    parser.add_argument("--rec_cache_size", type=int, default=0)
+    parser.add_argument("--rec_cache_path", type=str, default=None)
+    parser.add_argument("--rec_score_gate", type=float, default=0.0)
+    parser.add_argument("--rec_gate_policy", type=str, default="skip")
+    parser.add_argument("--rec_gate_model_dir", type=str, default=None)
     parser.add_argument("--max_text_length", type=int, default=25)
     parser.add_argument(
         "--rec_char_dict_path", type=str, default="./ppocr/utils/ppocr_keys_v1.txt"
@@ -131,6 +151,7 @@ def init_args():
     parser.add_argument("--cls_thresh", type=float, default=0.9)
 
     parser.add_argument("--enable_mkldnn", type=str2bool, default=None)
+    parser.add_argument("--mkldnn_cache_capacity", type=int, default=10)
     parser.add_argument("--cpu_threads", type=int, default=10)
     parser.add_argument("--use_pdserving", type=str2bool, default=False)
     parser.add_argument("--warmup", type=str2bool, default=False)
@@ -149,6 +170,7 @@ def init_args():
     parser.add_argument("--use_mp", type=str2bool, default=False)
     parser.add_argument("--total_process_num", type=int, default=1)
     parser.add_argument("--process_id", type=int, default=0)
+    parser.add_argument("--pipeline_queue_size", type=int, default=4)
 
     parser.add_argument("--benchmark", type=str2bool, default=False)
     parser.add_argument("--save_log_path", type=str, default="./log_output/")
@@ -386,8 +408,8 @@ def create_predictor(args, mode, logger):
             config.disable_gpu()
             if args.enable_mkldnn is not None:
                 if args.enable_mkldnn:
-                    # cache 10 different shapes for mkldnn to avoid memory leak
-                    config.set_mkldnn_cache_capacity(10)
+                    # cache a bounded number of shapes for mkldnn to avoid memory leak
+                    config.set_mkldnn_cache_capacity(args.mkldnn_cache_capacity)
                     config.enable_mkldnn()
                     if args.precision == "fp16":
                         config.enable_mkldnn_bfloat16()
@@ -540,6 +562,26 @@ def load_config(file_path):
     return config
 
 
+def get_model_digest(model_dir):
+    """sha1 of the model files in model_dir (or of the model file itself)"""
+    import hashlib
+
+    digest = hashlib.sha1()
+    if os.path.isfile(model_dir):
+        file_paths = [model_dir]
+    else:
+        file_paths = [
+            os.path.join(model_dir, file_name)
+            for file_name in sorted(os.listdir(model_dir))
+            if file_name.endswith((".pdiparams", ".pdmodel", ".json", ".onnx"))
+        ]
+    for file_path in file_paths:
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
 def get_output_tensors(args, mode, predictor):
     output_names = predictor.get_output_names()
     output_tensors = []
@@ -906,6 +948,91 @@ def get_rotate_crop_image(img, points):
     return dst_img
 
 
+def get_perspective_transforms(src, dst):
+    """
+    Batched equivalent of cv2.getPerspectiveTransform.
+    args:
+        src(array): source quads with shape [N, 4, 2]
+        dst(array): destination quads with shape [N, 4, 2]
+    return:
+        transforms(array) with shape [N, 3, 3]
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    num = src.shape[0]
+    x, y = src[:, :, 0], src[:, :, 1]
+    u, v = dst[:, :, 0], dst[:, :, 1]
+    zeros, ones = np.zeros_like(x), np.ones_like(x)
+    rows_u = np.stack([x, y, ones, zeros, zeros, zeros, -u * x, -u * y], axis=-1)
+    rows_v = np.stack([zeros, zeros, zeros, x, y, ones, -v * x, -v * y], axis=-1)
+    A = np.concatenate([rows_u, rows_v], axis=1)
+    b = np.concatenate([u, v], axis=1)
+    try:
+        h = np.linalg.solve(A, b[:, :, None])[:, :, 0]
+    except np.linalg.LinAlgError:
+        # degenerate quads, fall back to one transform at a time
+        return np.stack(
+            [
+                cv2.getPerspectiveTransform(
+                    src[i].astype(np.float32), dst[i].astype(np.float32)
+                )
+                for i in range(num)
+            ]
+        )
+    return np.concatenate([h, np.ones((num, 1))], axis=1).reshape(num, 3, 3)
+
+
+def get_rotate_crop_images(img, boxes, target_height=None):
+    """
+    Batched get_rotate_crop_image: the crop sizes and perspective transforms
+    of all boxes are computed at once, and each crop is warped straight from
+    the source image without copying it. If target_height is given, crops are
+    warped directly at that height (the width after rotating vertical text),
+    which saves the recognizer a resize of every crop.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4, 2)
+    if len(boxes) == 0:
+        return []
+    widths = np.maximum(
+        np.linalg.norm(boxes[:, 0] - boxes[:, 1], axis=1),
+        np.linalg.norm(boxes[:, 2] - boxes[:, 3], axis=1),
+    ).astype(np.int64)
+    heights = np.maximum(
+        np.linalg.norm(boxes[:, 0] - boxes[:, 3], axis=1),
+        np.linalg.norm(boxes[:, 1] - boxes[:, 2], axis=1),
+    ).astype(np.int64)
+    widths = np.maximum(widths, 1)
+    heights = np.maximum(heights, 1)
+    # decided on the unscaled size, as get_rotate_crop_image does: rounding
+    # to target_height could move a crop across the 1.5 ratio
+    vertical = heights >= 1.5 * widths
+    if target_height:
+        scale = target_height / np.where(vertical, widths, heights)
+        widths = np.maximum(np.round(widths * scale).astype(np.int64), 1)
+        heights = np.maximum(np.round(heights * scale).astype(np.int64), 1)
+
+    pts_std = np.zeros((len(boxes), 4, 2), dtype=np.float32)
+    pts_std[:, 1, 0] = widths
+    pts_std[:, 2, 0] = widths
+    pts_std[:, 2, 1] = heights
+    pts_std[:, 3, 1] = heights
+    transforms = get_perspective_transforms(boxes, pts_std)
+
+    img_crop_list = []
+    for M, width, height, rotate in zip(transforms, widths, heights, vertical):
+        dst_img = cv2.warpPerspective(
+            img,
+            M,
+            (int(width), int(height)),
+            borderMode=cv2.BORDER_REPLICATE,
+            flags=cv2.INTER_CUBIC,
+        )
+        if rotate:
+            dst_img = np.rot90(dst_img)
+        img_crop_list.append(dst_img)
+    return img_crop_list
+
+
 def get_minarea_rect_crop(img, points):
     bounding_box = cv2.minAreaRect(np.array(points).astype(np.int32))
     points = sorted(list(cv2.boxPoints(bounding_box)), key=lambda x: x[0])
@@ -969,11 +1096,127 @@ def slice_generator(image, horizontal_stride, vertical_stride, maximum_slices=50
             yield (horizontal_slice, v_start, h_start)
 
 
+def tile_generator(image, tile_size, overlap):
+    """
+    Split an image into fixed-size tiles that overlap by `overlap` pixels.
+    The last row/column of tiles is aligned to the image border so every
+    pixel is covered and no tile is smaller than necessary.
+    yields (tile, v_start, h_start)
+    """
+    if not isinstance(image, np.ndarray):
+        image = np.array(image)
+
+    stride = tile_size - overlap
+    assert stride > 0, f"Tile overlap ({overlap}) must be smaller than tile size ({tile_size})"
+
+    image_h, image_w = image.shape[:2]
+
+    def _starts(length):
+        starts = list(range(0, max(length - tile_size, 0) + 1, stride))
+        if starts[-1] + tile_size < length:
+            starts.append(length - tile_size)
+        return starts
+
+    for v_start in _starts(image_h):
+        for h_start in _starts(image_w):
+            yield (
+                image[v_start : v_start + tile_size, h_start : h_start + tile_size],
+                v_start,
+                h_start,
+            )
+
+
+def select_text_tiles(tiles, heat_map, ratio, thresh=0.1, dilate=64):
+    """
+    Keep the tiles that overlap text according to a low resolution text
+    probability map of the whole image.
+    args:
+        tiles(list): (tile, v_start, h_start) as yielded by tile_generator
+        heat_map(array): text probability map with shape [h, w]
+        ratio(tuple): (ratio_h, ratio_w) from image to heat map coordinates
+        thresh(float): probability above which a heat map pixel is text
+        dilate(int): margin around text regions, in image pixels
+    return:
+        indices of the kept tiles, fraction of the image area skipped
+    """
+    ratio_h, ratio_w = ratio
+    text_mask = (heat_map > thresh).astype(np.uint8)
+    kernel_h = 2 * int(math.ceil(dilate * ratio_h)) + 1
+    kernel_w = 2 * int(math.ceil(dilate * ratio_w)) + 1
+    text_mask = cv2.dilate(text_mask, np.ones((kernel_h, kernel_w), np.uint8))
+
+    covered = np.zeros_like(text_mask, dtype=bool)
+    keep = []
+    for tno, (tile, v_start, h_start) in enumerate(tiles):
+        tile_h, tile_w = tile.shape[:2]
+        y0, x0 = int(v_start * ratio_h), int(h_start * ratio_w)
+        y1 = int(math.ceil((v_start + tile_h) * ratio_h))
+        x1 = int(math.ceil((h_start + tile_w) * ratio_w))
+        if text_mask[y0:y1, x0:x1].any():
+            keep.append(tno)
+            covered[y0:y1, x0:x1] = True
+    skipped = 1.0 - covered.mean() if covered.size else 0.0
+    return keep, float(skipped)
+
+
+def polygon_nms(boxes, scores=None, thresh=0.5):
+    """
+    Suppress duplicated text polygons, e.g. the same word detected in two
+    overlapping tiles or a fragment of it cut at a tile border.
+    Overlap is measured as intersection over the smaller polygon so that a
+    fragment fully contained in the complete word is also suppressed.
+    args:
+        boxes(array): polygons with shape [N, K, 2]
+        scores(array): priority of each polygon, defaults to polygon area
+        thresh(float): overlap ratio above which the lower priority box is dropped
+    return:
+        indices(array) of the kept boxes, in ascending order
+    """
+    from shapely.geometry import Polygon
+
+    boxes = np.asarray(boxes, dtype=np.float32)
+    if len(boxes) == 0:
+        return np.zeros((0,), dtype=np.int64)
+
+    polys = []
+    for box in boxes:
+        poly = Polygon(box)
+        if not poly.is_valid:
+            poly = poly.buffer(0)
+        polys.append(poly)
+    areas = np.array([poly.area for poly in polys])
+    if scores is None:
+        scores = areas
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind="stable")
+
+    x_min, y_min = boxes[:, :, 0].min(axis=1), boxes[:, :, 1].min(axis=1)
+    x_max, y_max = boxes[:, :, 0].max(axis=1), boxes[:, :, 1].max(axis=1)
+
+    done = np.zeros(len(boxes), dtype=bool)
+    keep = []
+    for i in order:
+        if done[i]:
+            continue
+        done[i] = True
+        keep.append(i)
+        candidates = np.where(
+            ~done
+            & (x_min < x_max[i])
+            & (x_max > x_min[i])
+            & (y_min < y_max[i])
+            & (y_max > y_min[i])
+        )[0]
+        for j in candidates:
+            inter = polys[i].intersection(polys[j]).area
+            if inter / max(min(areas[i], areas[j]), 1e-6) > thresh:
+                done[j] = True
+    return np.sort(np.array(keep, dtype=np.int64))
+
+
 def calculate_box_extents(box):
-    min_x = box[0][0]
-    max_x = box[1][0]
-    min_y = box[0][1]
-    max_y = box[2][1]
+    box = np.asarray(box)
+    min_x, min_y = box[:, 0].min(), box[:, 1].min()
+    max_x, max_y = box[:, 0].max(), box[:, 1].max()
     return min_x, max_x, min_y, max_y
 
 
@@ -1001,30 +1244,81 @@ def merge_boxes(box1, box2, x_threshold, y_threshold):
 
 
 def merge_fragmented(boxes, x_threshold=10, y_threshold=10):
-    merged_boxes = []
-    visited = set()
-
-    for i, box1 in enumerate(boxes):
-        if i in visited:
-            continue
-
-        merged_box = [point[:] for point in box1]
-
-        for j, box2 in enumerate(boxes[i + 1 :], start=i + 1):
-            if j not in visited:
-                merged_result = merge_boxes(
-                    merged_box, box2, x_threshold=x_threshold, y_threshold=y_threshold
+    """
+    Merge the pieces of text boxes cut at slice borders: a group absorbs a
+    later box whose top and bottom edges are within y_threshold of its own
+    and whose left edge is within x_threshold of its right edge. Passes are
+    repeated until nothing merges, as the recursive version did; each group
+    is tested against the groups after it in one NumPy step, so the worst
+    case stays O(n^2) comparisons.
+    args:
+        boxes(array): quads with shape [N, 4, 2]
+    return:
+        (array) with shape [M, 4, 2]: the bounding box of every merged
+        group and the unchanged quad of every box left alone, in the order
+        of the first box of each group
+    """
+    boxes = np.asarray(boxes)
+    if len(boxes) == 0:
+        return np.zeros((0, 4, 2), dtype=np.float32)
+    # extents of every group, kept on its root (the first box of the group):
+    # min_x, max_x, min_y, max_y
+    extents = np.stack(
+        [
+            boxes[:, :, 0].min(axis=1),
+            boxes[:, :, 0].max(axis=1),
+            boxes[:, :, 1].min(axis=1),
+            boxes[:, :, 1].max(axis=1),
+        ],
+        axis=1,
+    ).astype(np.float64)
+    sizes = np.ones(len(boxes), dtype=np.int64)  # boxes in each group, kept on its root
+    roots = np.arange(len(boxes))  # in the order of the first box of each group
+
+    merged = True
+    while merged:
+        merged = False
+        absorbed = np.zeros(len(roots), dtype=bool)
+        for k in range(len(roots)):
+            if absorbed[k]:
+                continue
+            root = roots[k]
+            start = k + 1
+            while start < len(roots):
+                # the first box after the last one absorbed that matches the grown group
+                tail = extents[roots[start:]]
+                min_x, max_x, min_y, max_y = extents[root]
+                hits = np.flatnonzero(
+                    ~absorbed[start:]
+                    & (np.abs(min_y - tail[:, 2]) <= y_threshold)
+                    & (np.abs(max_y - tail[:, 3]) <= y_threshold)
+                    & (np.abs(max_x - tail[:, 0]) <= x_threshold)
                 )
-                if merged_result:
-                    merged_box = merged_result
-                    visited.add(j)
-
-        merged_boxes.append(merged_box)
-
-    if len(merged_boxes) == len(boxes):
-        return np.array(merged_boxes)
-    else:
-        return merge_fragmented(merged_boxes, x_threshold, y_threshold)
+                if len(hits) == 0:
+                    break
+                other = start + hits[0]
+                absorbed[other] = True
+                sizes[root] += sizes[roots[other]]
+                extents[root, [0, 2]] = np.minimum(extents[root, [0, 2]], tail[hits[0], [0, 2]])
+                extents[root, [1, 3]] = np.maximum(extents[root, [1, 3]], tail[hits[0], [1, 3]])
+                merged = True
+                start = other + 1
+        roots = roots[~absorbed]
+
+    # groups of a single box keep their quad, like merge_boxes never touched them
+    result = boxes[roots].copy()
+    grown = sizes[roots] > 1
+    min_x, max_x, min_y, max_y = extents[roots[grown]].T
+    result[grown] = np.stack(
+        [
+            np.stack([min_x, min_y], axis=1),
+            np.stack([max_x, min_y], axis=1),
+            np.stack([max_x, max_y], axis=1),
+            np.stack([min_x, max_y], axis=1),
+        ],
+        axis=1,
+    )
+    return result
 
 
 def check_gpu(use_gpu):
@@ -1,8 +1,14 @@
 import sys
 import os
 import cv2
-import csv
 import glob
+import multiprocessing as mp
+import multiprocessing.util
+from functools import partial
+import numpy as np
+
+import crop_store
+import results_store
 
 # 1. Add the tools folder to Python's path so we can import the working engine
 TOOLS_PATH = os.path.join(os.getcwd(), "PaddleOCR_Official_Tools")
@@ -16,70 +22,264 @@ except ImportError:
     print("❌ Error: Could not find PaddleOCR tools. Make sure you are in the 'Rumsey_Map_OCR' folder.")
     sys.exit(1)
 
-def main():
-    # --- CONFIGURATION ---
-    IMAGE_FOLDER = r"C:\Users\sharj\Desktop\Rumsey_Map_OCR\Rumsey_Map_OCR_Data\rumsey\icdar24-train-png\train_images"
-    OUTPUT_CSV = "map_text_results.csv"
-    
-    # Paths to your models
-    DET_MODEL = "./inference/ch_PP-OCRv4_det_infer/"
-    REC_MODEL = "./output/rec_inference/"
-    DICT_PATH = "PaddleOCR_Official_Tools/ppocr/utils/en_dict.txt"
-    
-    print("🔄 Initializing the Robust Engine (TextSystem)...")
-    
-    # 3. Configure the engine manually (Same as command line args)
+# --- CONFIGURATION ---
+IMAGE_FOLDER = r"C:\Users\sharj\Desktop\Rumsey_Map_OCR\Rumsey_Map_OCR_Data\rumsey\icdar24-train-png\train_images"
+# Results store (one Arrow file per map, see results_store.py)
+OUTPUT_STORE = "map_text_results"
+# Word thumbnails for search results (see crop_store.py); None to skip
+CROP_STORE = "map_text_crops"
+
+# Paths to your models
+DET_MODEL = "./inference/ch_PP-OCRv4_det_infer/"
+REC_MODEL = "./output/rec_inference/"
+DICT_PATH = "PaddleOCR_Official_Tools/ppocr/utils/en_dict.txt"
+
+# Boxes are cached per (image, det model, det params): re-runs with a new
+# recognition model skip detection entirely. Set to None to disable.
+DET_CACHE_DIR = "cache/det"
+# Recognition results of repeated crops (legends, grid labels) are kept
+# across runs of the same recognition model. Set to None to disable.
+REC_CACHE_PATH = "cache/rec.json"
+
+# Two pass detection: a 1280px pass over the whole map decides which
+# full resolution tiles are worth detecting. Much faster on maps that are
+# mostly sea or blank margin; check small-label recall before enabling.
+USE_PYRAMID_DET = False
+
+# Maps handed to a worker at once: the crops of a chunk are recognized
+# together, so the rec batches stay full on sparse maps too. With the crop
+# store on, the decoded maps of a chunk are kept until it is done.
+MAPS_PER_TASK = 4
+
+# Parallelism: each worker process holds its own engine.
+# The CPU math threads are split evenly between the workers.
+NUM_WORKERS = max(1, (os.cpu_count() or 1) // 4)
+TOTAL_CPU_THREADS = os.cpu_count() or 1
+
+MIN_CONFIDENCE = 0.85
+
+# Boxes the detector itself is unsure about (hachures, contour lines) can be
+# held back from the main recognizer: set a detection score (above the detector's
+# det_db_box_thresh of 0.6) and a policy, "skip" (dropped), "defer" (read
+# after the rest of their map) or "cheap" (needs a gate model). Off by
+# default: measure the recall lost on the validation maps before enabling.
+REC_SCORE_GATE = None
+REC_GATE_POLICY = "skip"
+
+# Cache and gate counters of the engine's time_dict, summed over the run
+CACHE_STATS = ("det_cache_hit", "det_cache_miss", "rec_cache_hit", "rec_cache_miss", "rec_gated")
+
+# Engine of the current worker process (set by init_worker)
+_text_sys = None
+
+
+def build_engine(cpu_threads):
+    """Configures the engine manually (Same as command line args)."""
     args = parse_args()
     args.det_model_dir = DET_MODEL
     args.rec_model_dir = REC_MODEL
     args.rec_char_dict_path = DICT_PATH
     args.use_angle_cls = False
     args.use_gpu = False  # Keep CPU for maximum stability
-    
-    # Initialize the engine
-    text_sys = TextSystem(args)
-    
-    # 4. Find Images
-    image_files = glob.glob(os.path.join(IMAGE_FOLDER, "*.png")) + \
-                  glob.glob(os.path.join(IMAGE_FOLDER, "*.jpg"))
-    
-    print(f"📂 Found {len(image_files)} images. Starting processing...")
-    
-    # 5. Process and Save
-    with open(OUTPUT_CSV, mode='w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(["Filename", "Detected Text", "Confidence", "Box Coordinates"])
-        
-        for index, img_file in enumerate(image_files):
+    args.cpu_threads = cpu_threads
+    args.show_log = False
+    # Detect on overlapping full-resolution tiles so small labels survive
+    args.use_tiled_det = True
+    args.det_tile_size = 960
+    args.det_tile_overlap = 200
+    # Box extraction from the DB map in NumPy batches instead of per contour
+    args.det_db_vectorized = True
+    # Only detect the tiles a low resolution pass finds text in
+    args.use_pyramid_det = USE_PYRAMID_DET
+    args.det_cache_dir = DET_CACHE_DIR
+    # Legends, grid labels and repeated names are recognized only once
+    args.rec_cache_size = 50000
+    args.rec_cache_path = REC_CACHE_PATH
+    # Fixed padded widths keep the CPU predictor on cached kernels
+    args.rec_width_buckets = "320,480,640,960"
+    args.rec_score_gate = REC_SCORE_GATE or 0
+    args.rec_gate_policy = REC_GATE_POLICY
+    return TextSystem(args)
+
+
+def init_worker(cpu_threads):
+    """Builds and warms up the engine once per worker process."""
+    global _text_sys
+    _text_sys = build_engine(cpu_threads)
+    # The caches are off for the noise image: its boxes and crops would
+    # only fill them with junk entries
+    with _text_sys.caches_disabled():
+        _text_sys(np.random.uniform(0, 255, [640, 640, 3]).astype(np.uint8))
+    # Pool workers skip atexit: save the rec cache entries added since its
+    # last periodic save when the worker exits (ocr_maps closes the pool)
+    rec_cache = _text_sys.text_recognizer.rec_cache
+    if rec_cache is not None:
+        mp.util.Finalize(None, rec_cache.save, exitpriority=10)
+
+
+def map_result(fname, img, preds, with_crops=False):
+    """
+    (fname, results table, None, thumbnails, time_dict) of one map from the
+    engine's (boxes, rec results, detection scores, time_dict).
+    """
+    dt_boxes, rec_res, det_scores, time_dict = preds
+    if dt_boxes is None or rec_res is None:
+        dt_boxes, rec_res, det_scores = [], [], []
+    texts = [text for text, _ in rec_res]
+    scores = np.array([score for _, score in rec_res], dtype=np.float32)
+    keep = scores >= MIN_CONFIDENCE  # Confidence threshold
+    boxes = np.asarray(dt_boxes, dtype=np.float32).reshape(-1, 4, 2)[keep]
+    table = results_store.make_table(
+        boxes,
+        [text for text, k in zip(texts, keep) if k],
+        scores[keep],
+        np.asarray(det_scores, dtype=np.float32)[keep],
+        # a box is its own crop: its id is its row
+        [[i] for i in range(len(boxes))],
+    )
+    # Cut while the map is decoded: encoding runs in the workers
+    crops = crop_store.encode_crops(img, boxes) if with_crops else None
+    return fname, table, None, crops, time_dict
+
+
+def ocr_map(fname, img, with_crops=False):
+    """Runs OCR on one decoded map; the result of map_result, or an error message."""
+    try:
+        dt_boxes, rec_res, det_scores, time_dict = _text_sys(img, return_det_scores=True)
+        if _text_sys.deferred:
+            dt_boxes, rec_res, det_scores = _text_sys.merge_deferred(
+                {fname: (dt_boxes, rec_res, det_scores)}
+            )[fname]
+    except Exception as e:
+        _text_sys.deferred.clear()
+        return fname, None, str(e), None, {}
+    return map_result(fname, img, (dt_boxes, rec_res, det_scores, time_dict), with_crops)
+
+
+def process_map(img_file, with_crops=False):
+    """
+    Runs OCR on one map and returns its results table (or an error
+    message), with_crops the encoded thumbnails of its boxes, and the
+    time_dict of the engine (timings and cache hits).
+    """
+    fname = os.path.basename(img_file)
+    img = cv2.imread(img_file)
+    if img is None:
+        return fname, None, None, None, {}
+    return ocr_map(fname, img, with_crops)
+
+
+def process_maps(img_files, with_crops=False):
+    """
+    Runs OCR on a chunk of maps, recognizing the crops of all of them
+    together (TextSystem.predict_many) so the rec batches stay full.
+    Returns the process_map result of every map, in order, and the
+    CACHE_STATS counters of the chunk.
+    """
+    rec_cache = _text_sys.text_recognizer.rec_cache
+    rec_before = (rec_cache.hits, rec_cache.misses) if rec_cache is not None else (0, 0)
+
+    results = [None] * len(img_files)
+    decoded = []  # (position in the chunk, fname, image kept for the thumbnails)
+
+    def read_maps():
+        for position, img_file in enumerate(img_files):
             fname = os.path.basename(img_file)
-            print(f"[{index+1}/{len(image_files)}] Processing {fname}...", end="\r")
-            
-            # Read image
             img = cv2.imread(img_file)
             if img is None:
+                results[position] = (fname, None, None, None, {})
                 continue
-            
-            # Run inference
-            try:
-                # FIX: Capture all return values first
-                preds = text_sys(img)
-                
-                # Extract only the first two (Boxes and Results)
-                dt_boxes = preds[0]
-                rec_res = preds[1]
-                
-            except Exception as e:
-                print(f"\n   ❌ Error on {fname}: {e}")
-                continue
-            
-            # Save results
-            if dt_boxes is not None and rec_res is not None:
-                for box, res in zip(dt_boxes, rec_res):
-                    text, score = res
-                    if score >= 0.85: # Confidence threshold
-                        writer.writerow([fname, text, f"{score:.4f}", box.tolist()])
-                        
-    print(f"\n✅ Success! Results saved to: {os.path.abspath(OUTPUT_CSV)}")
+            decoded.append((position, fname, img if with_crops else None))
+            yield img
+
+    try:
+        preds = dict(enumerate(_text_sys.predict_many(read_maps(), return_det_scores=True)))
+        # deferred boxes are keyed by the index of their map in predict_many
+        merged = _text_sys.merge_deferred({i: pred[:3] for i, pred in preds.items()})
+        for i, (position, fname, img) in enumerate(decoded):
+            results[position] = map_result(
+                fname, img, merged[i] + (preds[i][3],), with_crops,
+            )
+    except Exception:
+        # one bad map must not cost the others: run the chunk map by map
+        _text_sys.deferred.clear()
+        results = [process_map(img_file, with_crops) for img_file in img_files]
+
+    stats = dict.fromkeys(CACHE_STATS, 0)
+    for *_, time_dict in results:
+        for name in ("det_cache_hit", "det_cache_miss", "rec_gated"):
+            stats[name] += time_dict.get(name, 0)
+    if rec_cache is not None:
+        stats["rec_cache_hit"] = rec_cache.hits - rec_before[0]
+        stats["rec_cache_miss"] = rec_cache.misses - rec_before[1]
+    return results, stats
+
+
+def find_images(folder=IMAGE_FOLDER):
+    """Map images of a folder, sorted so the output order is deterministic."""
+    return sorted(glob.glob(os.path.join(folder, "*.png")) + \
+                  glob.glob(os.path.join(folder, "*.jpg")))
+
+
+def ocr_maps(image_files, crops=None):
+    """
+    Runs OCR on the maps in parallel and yields (map file name, results
+    table) per map, in input order, as soon as each map is done. With a
+    CropStore, the thumbnails of every map are appended to it.
+    """
+    chunks = [image_files[i:i + MAPS_PER_TASK] for i in range(0, len(image_files), MAPS_PER_TASK)]
+    num_workers = max(1, min(NUM_WORKERS, len(chunks)))
+    cpu_threads = max(1, TOTAL_CPU_THREADS // num_workers)
+
+    print(f"📂 Found {len(image_files)} images. Starting processing...")
+    print(f"🔄 Initializing {num_workers} engine(s) (TextSystem) with {cpu_threads} CPU threads each...")
+
+    # imap yields results in input order, so the output is identical to a serial run
+    cache_stats = dict.fromkeys(CACHE_STATS, 0)
+    with mp.get_context("spawn").Pool(num_workers, initializer=init_worker, initargs=(cpu_threads,)) as pool:
+        work = partial(process_maps, with_crops=crops is not None)
+        index = 0
+        for results, chunk_stats in pool.imap(work, chunks):
+            for name in CACHE_STATS:
+                cache_stats[name] += chunk_stats[name]
+            for fname, table, error, map_crops, _ in results:
+                index += 1
+                print(f"[{index}/{len(image_files)}] Processed {fname}...", end="\r")
+                if error is not None:
+                    print(f"\n   ❌ Error on {fname}: {error}")
+                    continue
+                if map_crops is not None:
+                    crops.append(fname, *map_crops)
+                if table is not None:
+                    yield fname, table
+        # Let the workers exit and save their caches: leaving the with
+        # block terminates them
+        pool.close()
+        pool.join()
+    print()
+    print(f"🗃️  Cache hits: det {cache_stats['det_cache_hit']}/"
+          f"{cache_stats['det_cache_hit'] + cache_stats['det_cache_miss']} maps, "
+          f"rec {cache_stats['rec_cache_hit']}/"
+          f"{cache_stats['rec_cache_hit'] + cache_stats['rec_cache_miss']} crops")
+    if REC_SCORE_GATE:
+        print(f"✂️  Rec score gate {REC_SCORE_GATE} ({REC_GATE_POLICY}): "
+              f"{cache_stats['rec_gated']} boxes below the gate")
+
+
+def main():
+    # 3. Find Images
+    image_files = find_images()
+
+    # 4. Process in parallel and save from this single writer process,
+    # one file per map. Results of a previous run are replaced.
+    results_store.clear(OUTPUT_STORE)
+    crops = None
+    if CROP_STORE is not None:
+        crop_store.clear(CROP_STORE)
+        crops = crop_store.CropStore(CROP_STORE)
+    results_store.write_maps(OUTPUT_STORE, ocr_maps(image_files, crops))
+
+    print(f"✅ Success! Results saved to: {os.path.abspath(OUTPUT_STORE)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,9 +1,14 @@
-import pandas as pd
-import re
+import numpy as np
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+import results_store
 
 # --- CONFIGURATION ---
-INPUT_CSV = "map_text_results_linked.csv"
-OUTPUT_CSV = "map_text_results_elite.csv"
+INPUT_STORE = "map_text_results_linked"
+OUTPUT_STORE = "map_text_results_elite"
+# Also write the elite results as a CSV (old layout) for sharing; None to skip
+EXPORT_CSV = None
 
 # 🎯 THE ELITE THRESHOLDS
 # 1. Minimum Confidence: Raise from 0.85 to 0.88 (Discard weak guesses)
@@ -13,54 +18,58 @@ MIN_CONFIDENCE = 0.80
 #    (Keeps 'N', 'S', 'E', 'W' for compass directions if they are clear)
 MIN_LENGTH_CONFIDENCE = 0.92
 
-def is_garbage(text):
-    """Returns True if text looks like OCR noise (e.g., ';;', '..', or empty)."""
-    if not isinstance(text, str):
-        return True
-    # Remove special chars
-    clean_text = re.sub(r'[^a-zA-Z0-9]', '', text)
-    if len(clean_text) == 0:
-        return True
-    return False
+# 3. Garbage: text without a single letter or digit is OCR noise (e.g. ';;', '..', empty)
+ALNUM_PATTERN = r'[a-zA-Z0-9]'
+
+def elite_filter():
+    """
+    The three filters below as one dataset expression, evaluated column-wise
+    by Arrow instead of row by row.
+    """
+    text = ds.field(results_store.TEXT)
+    conf = ds.field(results_store.CONFIDENCE)
+    # --- FILTER 1: REMOVE GARBAGE --- (null texts are dropped too)
+    not_garbage = pc.match_substring_regex(text, ALNUM_PATTERN)
+    # --- FILTER 2: RAISE CONFIDENCE FLOOR ---
+    confident = conf >= MIN_CONFIDENCE
+    # --- FILTER 3: SMART LENGTH CHECK ---
+    # If text is 1 character long, it MUST be > 95% confident.
+    # Otherwise, it's likely a rock or tree detected as a letter.
+    # Logic: Keep if (Length > 1) OR (Length == 1 AND Confidence > 0.95)
+    text_len = pc.utf8_length(text)
+    long_enough = (text_len > 1) | ((text_len == 1) & (conf >= MIN_LENGTH_CONFIDENCE))
+    return not_garbage & confident & long_enough
+
+def filter_maps(maps):
+    """Applies elite_filter to every (map_id, table) of `maps`, map by map."""
+    keep = elite_filter()
+    for map_id, table in maps:
+        yield map_id, table.filter(keep)
 
 def main():
-    print(f"📉 Loading {INPUT_CSV}...")
-    try:
-        df = pd.read_csv(INPUT_CSV)
-    except FileNotFoundError:
+    print(f"📉 Loading {INPUT_STORE}...")
+    if not results_store.map_ids(INPUT_STORE):
         print("❌ File not found.")
         return
 
-    original_count = len(df)
-    original_conf = df['Confidence'].mean()
+    # Only the confidence column is read for the starting stats
+    confs = results_store.read_table(INPUT_STORE, columns=[results_store.CONFIDENCE])
+    original_count = confs.num_rows
+    original_conf = pc.mean(confs.column(results_store.CONFIDENCE)).as_py() or 0.0
 
     print(f"📊 Starting Stats: {original_count} rows @ {original_conf*100:.2f}% confidence")
     print("-" * 40)
 
-    # --- FILTER 1: REMOVE GARBAGE ---
-    # Remove rows where text is empty or just symbols
-    df = df[~df['Detected Text'].apply(is_garbage)]
-    
-    # --- FILTER 2: RAISE CONFIDENCE FLOOR ---
-    # Drop anything below 88% (The "Maybe" Zone)
-    df = df[df['Confidence'] >= MIN_CONFIDENCE]
-
-    # --- FILTER 3: SMART LENGTH CHECK ---
-    # If text is 1 character long, it MUST be > 95% confident. 
-    # Otherwise, it's likely a rock or tree detected as a letter.
-    # We keep words (len > 1) if they meet the standard MIN_CONFIDENCE.
-    
-    # Logic: Keep if (Length > 1) OR (Length == 1 AND Confidence > 0.95)
-    df['text_len'] = df['Detected Text'].astype(str).apply(len)
-    df = df[ (df['text_len'] > 1) | ((df['text_len'] == 1) & (df['Confidence'] >= MIN_LENGTH_CONFIDENCE)) ]
-
-    # --- RESULTS ---
-    final_count = len(df)
-    final_conf = df['Confidence'].mean()
-
-    # Save
-    df.drop(columns=['text_len'], inplace=True)
-    df.to_csv(OUTPUT_CSV, index=False)
+    # Filter and save map by map
+    results_store.clear(OUTPUT_STORE)
+    final_count, conf_sum = 0, 0.0
+    for map_id, table in filter_maps(results_store.iter_maps(INPUT_STORE)):
+        results_store.write_map(OUTPUT_STORE, map_id, table)
+        final_count += table.num_rows
+        conf_sum += float(np.sum(table.column(results_store.CONFIDENCE).to_numpy(), dtype=np.float64))
+    final_conf = conf_sum / final_count if final_count else 0.0
+    if EXPORT_CSV is not None:
+        results_store.export_csv(OUTPUT_STORE, EXPORT_CSV)
 
     print(f"🚀 OPTIMIZATION COMPLETE")
     print("-" * 40)
@@ -0,0 +1,211 @@
+"""
+Packed store of the word thumbnails of the OCR results.
+
+Every box found by batch OCR is cut out of the map (its bounding rectangle
+plus CROP_PADDING pixels), scaled down to THUMB_HEIGHT and encoded by the
+OCR workers, which have the decoded map at hand. The writer appends the
+thumbnails to one pack file and, per map, one JSON line to an index file:
+
+    <root>/crops.pack    encoded thumbnails, back to back
+    <root>/crops.idx     {"map": ..., "offsets": [...], "lengths": [...], "rects": [...]}
+
+A thumbnail is keyed by (map, box id), the box id being the row of the box
+in the map's raw OCR results; every label of the results store lists the
+box ids it was made of (results_store.BOX_IDS). Both files are append-only: a map written
+again gets a new index line, which replaces the previous one on load. The
+first line of the index identifies the pack, so readers notice a clear.
+Reading a thumbnail is one pread, so search results can show the words
+without decoding the maps.
+"""
+import json
+import os
+import threading
+import uuid
+
+import cv2
+import numpy as np
+
+PACK_FILE = "crops.pack"
+INDEX_FILE = "crops.idx"
+# Pixels of context kept around each box
+CROP_PADDING = 4
+# Taller crops are scaled down to this height (aspect ratio kept)
+THUMB_HEIGHT = 64
+# ".jpg" or ".webp"
+THUMB_FORMAT = ".jpg"
+THUMB_QUALITY = 85
+
+
+def encode_crops(image, boxes):
+    """
+    Thumbnails of the boxes ([N, 4, 2]) of a decoded map. Returns (list of
+    encoded images, empty for boxes outside the map; int32 crop rectangles
+    [N, 4] as x0, y0, x1, y1).
+    """
+    height, width = image.shape[:2]
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4, 2)
+    rects = np.concatenate([
+        np.floor(boxes.min(axis=1)) - CROP_PADDING,
+        np.ceil(boxes.max(axis=1)) + CROP_PADDING,
+    ], axis=1)
+    rects = np.clip(rects, 0, [width, height, width, height]).astype(np.int32)
+
+    if THUMB_FORMAT == ".webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, THUMB_QUALITY]
+    else:
+        params = [cv2.IMWRITE_JPEG_QUALITY, THUMB_QUALITY]
+    crops = []
+    for x0, y0, x1, y1 in rects.tolist():
+        crop = image[y0:y1, x0:x1]
+        if crop.size == 0:
+            crops.append(b"")
+            continue
+        if crop.shape[0] > THUMB_HEIGHT:
+            new_width = max(1, round(crop.shape[1] * THUMB_HEIGHT / crop.shape[0]))
+            crop = cv2.resize(crop, (new_width, THUMB_HEIGHT), interpolation=cv2.INTER_AREA)
+        ok, data = cv2.imencode(THUMB_FORMAT, crop, params)
+        crops.append(data.tobytes() if ok else b"")
+    return crops, rects
+
+
+def clear(root):
+    """Removes the crop store at root, so a full run starts a new pack."""
+    for name in (PACK_FILE, INDEX_FILE):
+        path = os.path.join(root, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class CropStore(object):
+    """
+    The crop store at root: appends the thumbnails of new maps and reads
+    them back. Safe to read from several threads.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.pack_path = os.path.join(root, PACK_FILE)
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self.maps = {}  # map_id -> (offsets, lengths, rects)
+        self._index_size = 0
+        self._header = None
+        self._fd = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Reads the index lines appended since the last call (all of them after a clear)."""
+        with self._lock:
+            try:
+                f = open(self.index_path, "rb")
+            except FileNotFoundError:
+                self._reset(None)
+                return
+            with f:
+                header = f.readline()
+                if not header.endswith(b"\n"):
+                    # just created, the header is still being written
+                    self._reset(None)
+                    return
+                if header != self._header:
+                    # cleared (and maybe rewritten): start over on the new pack
+                    self._reset(header)
+                    self._index_size = len(header)
+                f.seek(self._index_size)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # still being written
+                    entry = json.loads(line)
+                    self.maps[entry["map"]] = (
+                        np.array(entry["offsets"], dtype=np.int64),
+                        np.array(entry["lengths"], dtype=np.int64),
+                        np.array(entry["rects"], dtype=np.int32).reshape(-1, 4),
+                    )
+                    self._index_size += len(line)
+
+    def append(self, map_id, crops, rects):
+        """Appends the thumbnails of one map; the box id of a crop is its position in crops."""
+        os.makedirs(self.root, exist_ok=True)
+        lengths = np.array([len(c) for c in crops], dtype=np.int64)
+        with open(self.pack_path, "ab") as pack:
+            start = pack.seek(0, os.SEEK_END)
+            pack.write(b"".join(crops))
+        if not os.path.exists(self.index_path):
+            with open(self.index_path, "w", encoding="utf-8") as index:
+                index.write(json.dumps({"pack": uuid.uuid4().hex}) + "\n")
+        # The pack is written first, so an index line never points past its end
+        entry = {
+            "map": map_id,
+            "offsets": (start + np.cumsum(lengths) - lengths).tolist(),
+            "lengths": lengths.tolist(),
+            "rects": np.asarray(rects, dtype=np.int32).ravel().tolist(),
+        }
+        with open(self.index_path, "a", encoding="utf-8") as index:
+            index.write(json.dumps(entry) + "\n")
+        self.refresh()
+
+    def read(self, map_id, box_id):
+        """
+        Encoded thumbnail of a box, or None if there is none (also between
+        a clear of the store and the next refresh).
+        """
+        # Under the lock: a refresh after a clear replaces the entries and
+        # closes the fd
+        with self._lock:
+            entry = self.maps.get(map_id)
+            if entry is None or not 0 <= box_id < len(entry[0]) or entry[1][box_id] == 0:
+                return None
+            offset, length = int(entry[0][box_id]), int(entry[1][box_id])
+            if self._fd is None and not self._open_pack():
+                return None
+            if not hasattr(os, "pread"):
+                # Windows: no pread
+                os.lseek(self._fd, offset, os.SEEK_SET)
+                return os.read(self._fd, length)
+            return os.pread(self._fd, length, offset)
+
+    def box_ids(self, map_id, box_ids):
+        """
+        The box ids (e.g. the box_ids of a label of the results store) that
+        have a thumbnail, in order.
+        """
+        entry = self.maps.get(map_id)
+        if entry is None or not box_ids:
+            return []
+        lengths = entry[1]
+        return [i for i in box_ids if 0 <= i < len(lengths) and lengths[i] > 0]
+
+    def _open_pack(self):
+        """Opens the pack the loaded index lines point into; False if it has been cleared since."""
+        try:
+            fd = os.open(self.pack_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        except FileNotFoundError:
+            return False
+        # The pack is removed before the index on a clear, and a new pack
+        # is only written once both are gone: if the index still has our
+        # header, fd is our pack
+        try:
+            with open(self.index_path, "rb") as f:
+                header = f.readline()
+        except FileNotFoundError:
+            header = None
+        if header != self._header:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def _reset(self, header):
+        self.maps = {}
+        self._index_size = 0
+        self._header = header
+        self._close()
+
+    def _close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def close(self):
+        with self._lock:
+            self._close()
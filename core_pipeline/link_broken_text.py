@@ -1,11 +1,13 @@
-import pandas as pd
-import ast
-import math
+import numpy as np
+import pyarrow as pa
 import os
+import multiprocessing as mp
+
+import results_store
 
 # --- CONFIGURATION ---
-INPUT_CSV = "map_text_results.csv"
-OUTPUT_CSV = "map_text_results_linked.csv"
+INPUT_STORE = "map_text_results"
+OUTPUT_STORE = "map_text_results_linked"
 
 # Tuning Parameters
 # How far apart can letters be? (2.5x the letter height is a good standard)
@@ -13,6 +15,9 @@ MAX_HORIZONTAL_GAP_RATIO = 1.0
 # How much can they shift up/down? (0.5x the letter height)
 MAX_VERTICAL_SHIFT_RATIO = 0.2 
 
+# Maps are linked in parallel, one map per task
+NUM_WORKERS = os.cpu_count() or 1
+
 def get_box_height(box):
     """Calculates height of the box."""
     ys = [p[1] for p in box]
@@ -31,112 +36,132 @@ def merge_boxes(box1, box2):
     ys = [p[1] for p in all_points]
     return [[min(xs), min(ys)], [max(xs), min(ys)], [max(xs), max(ys)], [min(xs), max(ys)]]
 
-def process_map_data(df):
-    """Merges broken text for a single map."""
-    # Convert string boxes back to lists if needed
-    if isinstance(df.iloc[0]['Box Coordinates'], str):
-        df['Box Coordinates'] = df['Box Coordinates'].apply(ast.literal_eval)
-        
+def process_map_data(table):
+    """Merges broken text for a single map (a results_store table)."""
     # Sort by Left-X coordinate to process left-to-right
-    df['x_min'] = df['Box Coordinates'].apply(lambda b: min(p[0] for p in b))
-    df = df.sort_values('x_min').reset_index(drop=True)
-
-    merged_data = []
-    used_indices = set()
-
-    for i in range(len(df)):
-        if i in used_indices:
+    points = results_store.boxes(table).astype(np.float64)
+    order = np.argsort(points[:, :, 0].min(axis=1), kind='mergesort')
+    points = points[order]
+
+    # Box extents as arrays: x_min is sorted, so every "boxes starting just
+    # right of X" lookup is a range query with searchsorted
+    boxes = points.tolist()
+    x_min = points[:, :, 0].min(axis=1)
+    x_max = points[:, :, 0].max(axis=1)
+    y_min = points[:, :, 1].min(axis=1)
+    y_max = points[:, :, 1].max(axis=1)
+    heights = y_max - y_min
+    centers_y = points[:, :, 1].sum(axis=1) / 4
+    texts = table.column(results_store.TEXT).to_pylist()
+    texts = [texts[k] for k in order]
+    confs = table.column(results_store.CONFIDENCE).to_numpy().astype(np.float64)[order].tolist()
+    det_scores = table.column(results_store.DET_SCORE).to_numpy(zero_copy_only=False)[order].tolist()
+    box_ids = results_store.box_ids(table)
+    box_ids = [box_ids[k] for k in order]
+
+    used = np.zeros(len(boxes), dtype=bool)
+    merged_boxes, merged_texts, merged_confs, merged_dets, merged_ids = [], [], [], [], []
+
+    for i in range(len(boxes)):
+        if used[i]:
             continue
 
-        current_box = df.iloc[i]['Box Coordinates']
-        current_text = str(df.iloc[i]['Detected Text'])
-        current_conf = float(df.iloc[i]['Confidence'])
-        current_h = get_box_height(current_box)
-
-        # Iteratively look for the "next letter"
-        has_merged = True
-        while has_merged:
-            has_merged = False
-            best_merge_idx = -1
-            
-            # Check other unused boxes
-            for j in range(len(df)):
-                if i == j or j in used_indices:
-                    continue
-                
-                next_box = df.iloc[j]['Box Coordinates']
-                next_h = get_box_height(next_box)
-                
-                # 1. Height Check (Must be roughly same size)
-                if abs(current_h - next_h) > (current_h * 0.5):
-                    continue
-
-                # 2. Distance Check (Right edge of A -> Left edge of B)
-                curr_x_max = max(p[0] for p in current_box)
-                next_x_min = min(p[0] for p in next_box)
-                gap = next_x_min - curr_x_max
-                
-                allowed_gap = current_h * MAX_HORIZONTAL_GAP_RATIO
-                
-                # If gap is positive (next is to the right) and small enough
-                if 0 < gap < allowed_gap:
-                     # 3. Vertical Alignment Check
-                     curr_y = get_box_center(current_box)[1]
-                     next_y = get_box_center(next_box)[1]
-                     
-                     if abs(curr_y - next_y) < (current_h * MAX_VERTICAL_SHIFT_RATIO):
-                         best_merge_idx = j
-                         break # Found the closest neighbor
-            
+        current_box = boxes[i]
+        current_text = texts[i]
+        current_conf = confs[i]
+        current_det = det_scores[i]
+        current_ids = box_ids[i]
+        current_h = heights[i]
+        curr_x_max = x_max[i]
+        curr_y = centers_y[i]
+        used[i] = True
+
+        # Iteratively look for the "next letter": the first box (in x_min
+        # order) starting less than allowed_gap right of the current box,
+        # with a similar height and vertically aligned with it
+        allowed_gap = current_h * MAX_HORIZONTAL_GAP_RATIO
+        while True:
+            lo = np.searchsorted(x_min, curr_x_max, side='right')
+            hi = np.searchsorted(x_min, curr_x_max + allowed_gap, side='left')
+            cand = np.arange(lo, hi)
+            cand = cand[~used[cand]]
+            cand = cand[np.abs(current_h - heights[cand]) <= current_h * 0.5]
+            cand = cand[np.abs(curr_y - centers_y[cand]) < current_h * MAX_VERTICAL_SHIFT_RATIO]
+            if len(cand) == 0:
+                break
+
             # Merge Logic
-            if best_merge_idx != -1:
-                target = df.iloc[best_merge_idx]
-                current_text += " " + str(target['Detected Text'])
-                current_conf = (current_conf + float(target['Confidence'])) / 2
-                current_box = merge_boxes(current_box, target['Box Coordinates'])
-                
-                used_indices.add(best_merge_idx)
-                has_merged = True # Loop again to find the *next* letter
+            j = cand[0]
+            used[j] = True
+            # a missing text (null in the store) adds nothing to the label,
+            # which stays null if all of its boxes are
+            if current_text is None:
+                current_text = texts[j]
+            elif texts[j] is not None:
+                current_text += " " + texts[j]
+            current_conf = (current_conf + confs[j]) / 2
+            # det scores are NaN when the OCR run did not record them
+            current_det = (current_det + det_scores[j]) / 2
+            # the raw boxes of a linked label, left to right
+            if current_ids is not None and box_ids[j] is not None:
+                current_ids = current_ids + box_ids[j]
+            else:
+                current_ids = None
+            current_box = merge_boxes(current_box, boxes[j])
+            curr_x_max = current_box[1][0]
+            curr_y = get_box_center(current_box)[1]
 
         # Save result
-        merged_data.append({
-            'Filename': df.iloc[i]['Filename'],
-            'Detected Text': current_text,
-            'Confidence': f"{current_conf:.4f}",
-            'Box Coordinates': current_box
-        })
-        used_indices.add(i)
-
-    return pd.DataFrame(merged_data)
+        merged_boxes.append(current_box)
+        merged_texts.append(current_text)
+        merged_confs.append(current_conf)
+        merged_dets.append(current_det)
+        merged_ids.append(current_ids)
+
+    return results_store.make_table(
+        np.array(merged_boxes, dtype=np.float32).reshape(-1, 4, 2),
+        merged_texts,
+        merged_confs,
+        pa.array(merged_dets, pa.float32(), from_pandas=True),
+        merged_ids,
+    )
+
+def link_map(item):
+    """Pool worker: links the rows of one map."""
+    map_id, table = item
+    return map_id, process_map_data(table)
+
+def link_maps(maps, pool=None):
+    """
+    Links every (map_id, table) of `maps` and yields (map_id, linked table),
+    in order. With a pool, maps are linked in parallel.
+    """
+    mapper = pool.imap if pool is not None else map
+    yield from mapper(link_map, maps)
 
 def main():
-    print("🔗 Loading CSV...")
-    if not os.path.exists(INPUT_CSV):
-        print("❌ Error: map_text_results.csv not found.")
+    print("🔗 Loading results...")
+    map_ids = results_store.map_ids(INPUT_STORE)
+    if not map_ids:
+        print(f"❌ Error: no results found in {INPUT_STORE}.")
         return
 
-    full_df = pd.read_csv(INPUT_CSV)
-    all_merged_dfs = []
-    unique_files = full_df['Filename'].unique()
-    
-    print(f"🔄 Linking text in {len(unique_files)} maps...")
-    
-    for idx, filename in enumerate(unique_files):
-        print(f"   [{idx+1}/{len(unique_files)}] Processing {filename}...", end="\r")
-        
-        # Get data for just this map
-        map_df = full_df[full_df['Filename'] == filename].copy()
-        
-        # Run merging algorithm
-        linked_df = process_map_data(map_df)
-        all_merged_dfs.append(linked_df)
-
-    # Save to new CSV
-    final_df = pd.concat(all_merged_dfs)
-    final_df.to_csv(OUTPUT_CSV, index=False)
-    
-    print(f"\n\n✅ Done! Saved to: {OUTPUT_CSV}")
-    print(f"📊 Rows Reduced: {len(full_df)} -> {len(final_df)} ({(len(full_df)-len(final_df))} merges)")
+    num_workers = max(1, min(NUM_WORKERS, len(map_ids)))
+    print(f"🔄 Linking text in {len(map_ids)} maps with {num_workers} worker(s)...")
+
+    # Maps are independent: link them in parallel, one map in memory per task
+    rows_in = results_store.read_table(INPUT_STORE, columns=[results_store.CONFIDENCE]).num_rows
+    rows_out = 0
+    results_store.clear(OUTPUT_STORE)
+    with mp.get_context("spawn").Pool(num_workers) as pool:
+        maps = results_store.iter_maps(INPUT_STORE)
+        for idx, (map_id, linked) in enumerate(link_maps(maps, pool)):
+            print(f"   [{idx+1}/{len(map_ids)}] Processed {map_id}...", end="\r")
+            rows_out += linked.num_rows
+            results_store.write_map(OUTPUT_STORE, map_id, linked)
+
+    print(f"\n\n✅ Done! Saved to: {OUTPUT_STORE}")
+    print(f"📊 Rows Reduced: {rows_in} -> {rows_out} ({(rows_in-rows_out)} merges)")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
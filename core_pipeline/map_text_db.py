@@ -0,0 +1,192 @@
+"""
+SQLite database of the recognized map text, loaded from a results store.
+
+Labels are full-text searchable (FTS5, accent insensitive) and indexed
+spatially (R*Tree over their bounding boxes). Ingest works map by map:
+re-running a map replaces only that map's rows, and maps whose store
+file has not changed since the last ingest are skipped, so the nightly
+re-processing only touches what changed.
+
+Usage:
+  python core_pipeline/map_text_db.py                 # ingest changed maps
+  python core_pipeline/map_text_db.py --map a.png     # re-ingest one map
+"""
+import argparse
+import os
+import sqlite3
+
+import numpy as np
+
+import results_store
+
+# --- CONFIGURATION ---
+DB_PATH = "map_text.db"
+RESULTS_STORE = "map_text_results_elite"
+# Maps written per transaction
+BATCH_MAPS = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS maps (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    source TEXT NOT NULL,
+    num_labels INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS labels (
+    id INTEGER PRIMARY KEY,
+    map_id INTEGER NOT NULL REFERENCES maps(id),
+    row INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    det_score REAL,
+    min_x REAL NOT NULL, max_x REAL NOT NULL,
+    min_y REAL NOT NULL, max_y REAL NOT NULL,
+    box BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS labels_map ON labels(map_id, row);
+CREATE VIRTUAL TABLE IF NOT EXISTS labels_fts USING fts5(
+    text, content='labels', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS labels_rtree USING rtree(id, min_x, max_x, min_y, max_y);
+CREATE TRIGGER IF NOT EXISTS labels_ai AFTER INSERT ON labels BEGIN
+    INSERT INTO labels_fts(rowid, text) VALUES (new.id, new.text);
+    INSERT INTO labels_rtree VALUES (new.id, new.min_x, new.max_x, new.min_y, new.max_y);
+END;
+CREATE TRIGGER IF NOT EXISTS labels_ad AFTER DELETE ON labels BEGIN
+    INSERT INTO labels_fts(labels_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    DELETE FROM labels_rtree WHERE id = old.id;
+END;
+"""
+
+
+def connect(db_path=DB_PATH):
+    """Opens (and creates if needed) the database, in WAL mode."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL + NORMAL only risks the last transactions on power loss, never corruption
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def map_source(root, map_id):
+    """Identifies the version of a map in the store (size and mtime of its file)."""
+    stat = os.stat(results_store.map_file(root, map_id))
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def upsert_map(conn, name, table, source=""):
+    """Replaces the labels of one map by the rows of a results_store table."""
+    map_id = conn.execute(
+        "INSERT INTO maps(name, source, num_labels) VALUES (?, ?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET source = excluded.source, num_labels = excluded.num_labels "
+        "RETURNING id",
+        (name, source, table.num_rows),
+    ).fetchone()[0]
+    conn.execute("DELETE FROM labels WHERE map_id = ?", (map_id,))
+
+    boxes = results_store.boxes(table)
+    mins, maxs = boxes.min(axis=1).tolist(), boxes.max(axis=1).tolist()
+    conn.executemany(
+        "INSERT INTO labels(map_id, row, text, confidence, det_score, min_x, max_x, min_y, max_y, box) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (map_id, row, text, conf, det, lo[0], hi[0], lo[1], hi[1], box.tobytes())
+            for row, (text, conf, det, lo, hi, box) in enumerate(zip(
+                table.column(results_store.TEXT).to_pylist(),
+                table.column(results_store.CONFIDENCE).to_pylist(),
+                table.column(results_store.DET_SCORE).to_pylist(),
+                mins, maxs, boxes,
+            ))
+        ),
+    )
+
+
+def delete_map(conn, name):
+    conn.execute("DELETE FROM labels WHERE map_id IN (SELECT id FROM maps WHERE name = ?)", (name,))
+    conn.execute("DELETE FROM maps WHERE name = ?", (name,))
+
+
+def ingest(db_path=DB_PATH, root=RESULTS_STORE, maps=None, only_changed=True, prune=False):
+    """
+    Loads the maps of a results store into the database, BATCH_MAPS maps
+    per transaction. Returns (maps written, maps skipped, maps removed).
+    """
+    conn = connect(db_path)
+    known = dict(conn.execute("SELECT name, source FROM maps"))
+    store_maps = results_store.map_ids(root)
+    todo = store_maps if maps is None else [m for m in store_maps if m in set(maps)]
+
+    written, skipped, removed = 0, 0, 0
+    for start in range(0, len(todo), BATCH_MAPS):
+        with conn:
+            for name in todo[start:start + BATCH_MAPS]:
+                source = map_source(root, name)
+                if only_changed and known.get(name) == source:
+                    skipped += 1
+                    continue
+                upsert_map(conn, name, results_store.read_map(root, name), source)
+                written += 1
+
+    if prune:
+        # Maps that are no longer in the store
+        with conn:
+            for name in set(known) - set(store_maps):
+                delete_map(conn, name)
+                removed += 1
+    conn.close()
+    return written, skipped, removed
+
+
+def _label_rows(cursor):
+    return [
+        {
+            "map": name, "row": row, "text": text, "confidence": conf, "det_score": det,
+            "box": np.frombuffer(box, dtype=np.float32).reshape(-1, 2).tolist(),
+        }
+        for name, row, text, conf, det, box in cursor
+    ]
+
+
+def search_text(conn, query, prefix=False, limit=100):
+    """Labels containing the words of query (or words starting with them)."""
+    words = [w.replace('"', '""') for w in query.split()]
+    if not words:
+        return []
+    match = " ".join(f'"{w}"' + ("*" if prefix else "") for w in words)
+    return _label_rows(conn.execute(
+        "SELECT m.name, l.row, l.text, l.confidence, l.det_score, l.box "
+        "FROM labels_fts f JOIN labels l ON l.id = f.rowid JOIN maps m ON m.id = l.map_id "
+        "WHERE labels_fts MATCH ? ORDER BY f.rank LIMIT ?",
+        (match, limit),
+    ))
+
+
+def labels_in_window(conn, map_name, x0, y0, x1, y1):
+    """Labels of one map whose bounding box meets the window."""
+    return _label_rows(conn.execute(
+        "SELECT m.name, l.row, l.text, l.confidence, l.det_score, l.box "
+        "FROM labels_rtree r JOIN labels l ON l.id = r.id JOIN maps m ON m.id = l.map_id "
+        "WHERE m.name = ? AND r.max_x >= ? AND r.min_x <= ? AND r.max_y >= ? AND r.min_y <= ? "
+        "ORDER BY l.row",
+        (map_name, x0, x1, y0, y1),
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load OCR results into the map text database.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--store", default=RESULTS_STORE)
+    parser.add_argument("--map", action="append", help="Only (re)load this map; repeatable")
+    parser.add_argument("--all", action="store_true", help="Reload maps even if unchanged")
+    parser.add_argument("--prune", action="store_true", help="Remove maps missing from the store")
+    args = parser.parse_args()
+
+    only_changed = not args.all and args.map is None
+    print(f"🗄️  Loading {args.store} into {args.db}...")
+    written, skipped, removed = ingest(args.db, args.store, args.map, only_changed, args.prune)
+    print(f"✅ {written} maps loaded, {skipped} unchanged, {removed} removed")
+
+
+if __name__ == "__main__":
+    main()
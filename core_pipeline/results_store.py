@@ -0,0 +1,273 @@
+"""
+Columnar results store shared by the core_pipeline scripts.
+
+A store is a directory with one Arrow IPC file per map, hive partitioned
+on the map id:
+
+    <root>/map_id=<map file name>/part-0.arrow
+
+Boxes are fixed size float32 lists (4 points, x and y interleaved), so
+loading and filtering a whole corpus is a memory-mapped columnar scan
+instead of an ast.literal_eval per row.
+"""
+import csv
+import hashlib
+import os
+import shutil
+import urllib.parse
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs
+
+# --- SCHEMA ---
+MAP_ID = "map_id"
+TEXT = "text"
+CONFIDENCE = "confidence"
+DET_SCORE = "det_score"
+BOX = "box"
+# Rows of the map's raw OCR results a label was made of (the ids of its
+# thumbnails in crop_store); null when unknown
+BOX_IDS = "box_ids"
+
+BOX_POINTS = 4
+
+# Columns stored in every map file; map_id comes from the directory name
+SCHEMA = pa.schema([
+    (TEXT, pa.string()),
+    (CONFIDENCE, pa.float32()),
+    (DET_SCORE, pa.float32()),
+    (BOX, pa.list_(pa.float32(), BOX_POINTS * 2)),
+    (BOX_IDS, pa.list_(pa.int32())),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([(MAP_ID, pa.string())]), flavor="hive")
+PART_FILE = "part-0.arrow"
+
+# Column names of the CSV layout the scripts used to write
+CSV_HEADER = ["Filename", "Detected Text", "Confidence", "Box Coordinates", "Det Score"]
+# Column names of the CSV layout step4 used to write, read by the dataset
+# tools (prepare_dataset.py, tools/augment_dataset.py)
+BOX_CSV_HEADER = ["image_file", "text", "confidence", "x_min", "y_min", "x_max", "y_max", "bbox_coords"]
+
+
+def make_table(boxes, texts, confidences, det_scores=None, box_ids=None):
+    """
+    Builds the results of one map; boxes is anything shaped [N, 4, 2] and
+    box_ids a list of N lists (or None) of raw OCR rows.
+    """
+    flat = np.asarray(boxes, dtype=np.float32).reshape(-1, BOX_POINTS * 2)
+    if det_scores is None:
+        det_scores = pa.nulls(len(flat), pa.float32())
+    if box_ids is None:
+        box_ids = pa.nulls(len(flat), SCHEMA.field(BOX_IDS).type)
+    return pa.table({
+        TEXT: pa.array(list(texts), pa.string()),
+        CONFIDENCE: pa.array(np.asarray(confidences, dtype=np.float32)),
+        DET_SCORE: pa.array(det_scores, pa.float32()),
+        BOX: pa.FixedSizeListArray.from_arrays(pa.array(flat.ravel()), BOX_POINTS * 2),
+        BOX_IDS: pa.array(box_ids, SCHEMA.field(BOX_IDS).type),
+    }, schema=SCHEMA)
+
+
+def boxes(table):
+    """The box column of a table as a float32 array with shape [N, 4, 2]."""
+    column = table.column(BOX).combine_chunks()
+    return column.flatten().to_numpy().reshape(-1, BOX_POINTS, 2)
+
+
+def box_ids(table):
+    """The box_ids of a table as lists (None where unknown, e.g. maps written before the column)."""
+    if BOX_IDS not in table.column_names:
+        return [None] * table.num_rows
+    return table.column(BOX_IDS).to_pylist()
+
+
+def _map_dir(root, map_id):
+    return os.path.join(root, f"{MAP_ID}={urllib.parse.quote(map_id, safe='')}")
+
+
+def map_file(root, map_id):
+    """Path of the file holding the results of one map."""
+    return os.path.join(_map_dir(root, map_id), PART_FILE)
+
+
+def write_map(root, map_id, table):
+    """Writes (or replaces) the results of one map."""
+    map_dir = _map_dir(root, map_id)
+    os.makedirs(map_dir, exist_ok=True)
+    path = map_file(root, map_id)
+    # Write next to the target and rename, so readers never see half a file
+    # (dataset scans skip files starting with ".")
+    tmp_path = os.path.join(map_dir, "." + PART_FILE + ".tmp")
+    if BOX_IDS not in table.column_names:
+        table = table.append_column(BOX_IDS, pa.nulls(table.num_rows, SCHEMA.field(BOX_IDS).type))
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, SCHEMA) as writer:
+        writer.write_table(table.select(SCHEMA.names).cast(SCHEMA))
+    os.replace(tmp_path, path)
+
+
+def write_maps(root, maps):
+    """Writes every (map_id, table) of `maps`; returns the number of rows."""
+    num_rows = 0
+    for map_id, table in maps:
+        write_map(root, map_id, table)
+        num_rows += table.num_rows
+    return num_rows
+
+
+def tee_maps(root, maps):
+    """
+    Writes every (map_id, table) of `maps` and passes it on, to keep an
+    intermediate store of a streaming chain.
+    """
+    for map_id, table in maps:
+        write_map(root, map_id, table)
+        yield map_id, table
+
+
+def clear(root):
+    """Removes every map of a store (only the map directories, nothing else)."""
+    for map_id in map_ids(root):
+        shutil.rmtree(_map_dir(root, map_id))
+
+
+def map_ids(root):
+    """Map ids in the store, sorted."""
+    if not os.path.isdir(root):
+        return []
+    prefix = MAP_ID + "="
+    return sorted(
+        urllib.parse.unquote(name[len(prefix):])
+        for name in os.listdir(root)
+        if name.startswith(prefix) and os.path.exists(os.path.join(root, name, PART_FILE))
+    )
+
+
+def version(root):
+    """
+    Hash of the map files of a store (names, sizes and mtimes): changes
+    whenever a map is written or removed, without reading any data.
+    """
+    digest = hashlib.sha1()
+    for map_id in map_ids(root):
+        stat = os.stat(map_file(root, map_id))
+        digest.update(f"{map_id}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def read_map(root, map_id, columns=None, filter=None, memory_map=True):
+    """
+    Reads the results of one map, memory-mapped. Without memory_map the
+    file is read into memory and closed, so it can be replaced while the
+    table is in use (Windows refuses to replace a mapped file).
+    """
+    open_file = pa.memory_map if memory_map else pa.OSFile
+    with open_file(map_file(root, map_id)) as source:
+        table = pa.ipc.open_file(source).read_all()
+    if filter is not None:
+        table = table.filter(filter)
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+
+def iter_maps(root, columns=None, filter=None):
+    """Yields (map_id, table) for every map of the store, one map at a time."""
+    for map_id in map_ids(root):
+        yield map_id, read_map(root, map_id, columns=columns, filter=filter)
+
+
+def read_rows(root, rows, columns=None, open_maps=None, memory_map=True):
+    """
+    Reads the given (map_id, row in the map file) pairs into one table with
+    a map_id column, reading each map once. rows is grouped by map, as
+    returned by an index over the store. open_maps is an optional dict
+    (map_id -> full table) of maps kept open between calls; the maps read
+    are added to it. memory_map is passed on to read_map.
+    """
+    tables = []
+    start = 0
+    while start < len(rows):
+        map_id = rows[start][0]
+        end = start
+        while end < len(rows) and rows[end][0] == map_id:
+            end += 1
+        if open_maps is None:
+            table = read_map(root, map_id, columns=columns, memory_map=memory_map)
+        else:
+            table = open_maps.get(map_id)
+            if table is None:
+                table = open_maps.setdefault(map_id, read_map(root, map_id, memory_map=memory_map))
+            if columns is not None:
+                table = table.select(columns)
+        table = table.take([row for _, row in rows[start:end]])
+        tables.append(table.append_column(MAP_ID, pa.array([map_id] * table.num_rows, pa.string())))
+        start = end
+    if not tables:
+        schema = SCHEMA if columns is None else pa.schema([SCHEMA.field(c) for c in columns])
+        return schema.append(pa.field(MAP_ID, pa.string())).empty_table()
+    return pa.concat_tables(tables)
+
+
+def read_table(root, columns=None, filter=None, maps=None):
+    """
+    Scans the whole store (or only `maps`) into one table with a map_id
+    column. `filter` is a pyarrow.dataset expression, e.g.
+    ds.field("confidence") >= 0.9; only the requested columns are read.
+    """
+    dataset = ds.dataset(
+        root,
+        format="ipc",
+        partitioning=PARTITIONING,
+        filesystem=pyarrow.fs.LocalFileSystem(use_mmap=True),
+    )
+    if maps is not None:
+        maps_filter = ds.field(MAP_ID).isin(list(maps))
+        filter = maps_filter if filter is None else filter & maps_filter
+    return dataset.to_table(columns=columns, filter=filter)
+
+
+def export_csv(root, csv_path):
+    """Writes the store in the old CSV layout, map by map."""
+    write_csv(csv_path, iter_maps(root))
+
+
+def write_csv(csv_path, maps):
+    """Writes every (map_id, table) of `maps` in the old CSV layout."""
+    with open(csv_path, mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for map_id, table in maps:
+            for text, conf, det_score, box in zip(
+                table.column(TEXT).to_pylist(),
+                table.column(CONFIDENCE).to_pylist(),
+                table.column(DET_SCORE).to_pylist(),
+                boxes(table).tolist(),
+            ):
+                det_score = "" if det_score is None else f"{det_score:.4f}"
+                writer.writerow([map_id, text, f"{conf:.4f}", box, det_score])
+
+
+def export_box_csv(root, csv_path):
+    """Writes the store in step4's CSV layout (BOX_CSV_HEADER), map by map."""
+    with open(csv_path, mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(BOX_CSV_HEADER)
+        for map_id, table in iter_maps(root):
+            # pixel coordinates, truncated like the integer boxes of the old CSVs
+            points = boxes(table).astype(np.int64)
+            mins, maxs = points.min(axis=1).tolist(), points.max(axis=1).tolist()
+            for text, conf, (x_min, y_min), (x_max, y_max), box in zip(
+                table.column(TEXT).to_pylist(),
+                table.column(CONFIDENCE).to_pylist(),
+                mins, maxs, points.tolist(),
+            ):
+                writer.writerow([map_id, text, round(conf, 4), x_min, y_min, x_max, y_max, str(box)])
+
+
+def text_filter(pattern, ignore_case=True):
+    """Expression matching rows whose text contains the regex `pattern`."""
+    return pc.match_substring_regex(ds.field(TEXT), pattern, ignore_case=ignore_case)
@@ -0,0 +1,87 @@
+"""
+OCR -> link -> filter -> export in one pass.
+
+Runs the same steps as batch_process_maps.py, link_broken_text.py and
+boost_accuracy.py, but map by map: every map goes through linking and the
+elite filters as soon as its OCR is done, so memory use does not depend
+on the size of the corpus and no intermediate results are written unless
+asked for below.
+"""
+import os
+
+import numpy as np
+
+import crop_store
+import map_text_db
+import results_store
+from batch_process_maps import find_images, ocr_maps
+from boost_accuracy import filter_maps
+from link_broken_text import link_maps
+
+# --- CONFIGURATION ---
+OUTPUT_STORE = "map_text_results_elite"
+
+# Intermediate stores of the separate scripts, kept only if set
+# (e.g. "map_text_results" and "map_text_results_linked")
+RAW_STORE = None
+LINKED_STORE = None
+
+# Also write the final results as a CSV (old layout); None to skip
+EXPORT_CSV = None
+
+# Load the maps that changed into the SQLite map text database; None to skip
+DB_PATH = None
+
+# Word thumbnails cut during OCR, for search results (see crop_store.py); None to skip
+CROP_STORE = "map_text_crops"
+
+
+def count_rows(maps, stats, name):
+    """Passes (map_id, table) through, adding its row count to stats[name]."""
+    for map_id, table in maps:
+        stats[name] += table.num_rows
+        yield map_id, table
+
+
+def build_chain(maps, stats):
+    """Chains the post-processing stages onto a stream of (map_id, table)."""
+    maps = count_rows(maps, stats, "ocr")
+    if RAW_STORE is not None:
+        results_store.clear(RAW_STORE)
+        maps = results_store.tee_maps(RAW_STORE, maps)
+
+    maps = count_rows(link_maps(maps), stats, "linked")
+    if LINKED_STORE is not None:
+        results_store.clear(LINKED_STORE)
+        maps = results_store.tee_maps(LINKED_STORE, maps)
+
+    return count_rows(filter_maps(maps), stats, "elite")
+
+
+def main():
+    image_files = find_images()
+    stats = {"ocr": 0, "linked": 0, "elite": 0}
+    conf_sum = 0.0
+
+    results_store.clear(OUTPUT_STORE)
+    crops = None
+    if CROP_STORE is not None:
+        crop_store.clear(CROP_STORE)
+        crops = crop_store.CropStore(CROP_STORE)
+    for map_id, table in build_chain(ocr_maps(image_files, crops), stats):
+        results_store.write_map(OUTPUT_STORE, map_id, table)
+        conf_sum += float(np.sum(table.column(results_store.CONFIDENCE).to_numpy(), dtype=np.float64))
+
+    if EXPORT_CSV is not None:
+        results_store.export_csv(OUTPUT_STORE, EXPORT_CSV)
+    if DB_PATH is not None:
+        map_text_db.ingest(DB_PATH, OUTPUT_STORE, prune=True)
+
+    final_conf = conf_sum / stats["elite"] if stats["elite"] else 0.0
+    print(f"✅ Done! Results saved to: {os.path.abspath(OUTPUT_STORE)}")
+    print(f"📊 Rows: {stats['ocr']} detected -> {stats['linked']} linked -> {stats['elite']} kept")
+    print(f"🏆 Avg Conf: {final_conf*100:.2f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Load generator for search_server.py.
+
+Starts the service on a results store (by default a stand-in corpus of
+random place names and boxes, written to a temporary folder) and replays
+a mix of exact, prefix, fuzzy and spatial queries from concurrent
+clients. Every distinct query is first sent once (cold: computed by the
+service), then the mix is replayed at random (warm: mostly served from
+the LRU cache). Reports p50/p99 latency and throughput per endpoint.
+
+Usage:
+  python core_pipeline/search_load_test.py                      # stand-in corpus
+  python core_pipeline/search_load_test.py --store map_text_results_elite
+  python core_pipeline/search_load_test.py --url http://127.0.0.1:8765 --store map_text_results_elite
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlparse
+
+import numpy as np
+
+import results_store
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_server.py")
+SYLLABLES = ["san", "ta", "ri", "ver", "mon", "port", "ville", "ber", "lin", "ca", "sto", "ne",
+             "ham", "ford", "la", "gro", "ve", "mi", "ssi", "ppi", "or", "le", "ans", "wa"]
+
+
+def make_corpus(root, num_maps=200, labels_per_map=500, seed=0):
+    """Writes a stand-in results store: random place names at random places on 8000x6000 maps."""
+    rng = np.random.default_rng(seed)
+    vocabulary = sorted({
+        "".join(rng.choice(SYLLABLES, size=rng.integers(2, 5))).capitalize() for _ in range(5000)
+    })
+    results_store.clear(root)
+    for m in range(num_maps):
+        n = labels_per_map
+        texts = [
+            " ".join(rng.choice(vocabulary, size=rng.integers(1, 3))) for _ in range(n)
+        ]
+        corner = rng.uniform([0, 0], [7800, 5950], size=(n, 1, 2))
+        size = np.stack([rng.uniform(20, 200, n), rng.uniform(8, 40, n)], axis=1)[:, None, :]
+        unit = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=np.float32)
+        boxes = corner + unit * size
+        results_store.write_map(
+            root, f"map_{m:04d}.png",
+            results_store.make_table(boxes, texts, rng.uniform(0.9, 1.0, n), rng.uniform(0.5, 1.0, n)),
+        )
+
+
+def make_queries(root, count, seed=0):
+    """Distinct query paths drawn from the labels of the store, a quarter of each kind."""
+    rng = random.Random(seed)
+    maps = results_store.map_ids(root)
+    words = sorted({
+        word
+        for _, table in results_store.iter_maps(root, columns=[results_store.TEXT])
+        for text in table.column(results_store.TEXT).to_pylist()
+        for word in text.split()
+        if len(word) >= 4
+    })
+    letters = "abcdefghijklmnopqrstuvwxyz"
+
+    queries = set()
+    while len(queries) < count:
+        word = rng.choice(words)
+        kind = len(queries) % 4
+        if kind == 0:
+            # exact substring, or prefix
+            if rng.random() < 0.5:
+                queries.add(f"/search?q={quote(word.lower())}")
+            else:
+                queries.add(f"/search?q={quote(word[:4])}&prefix=1")
+        elif kind == 1:
+            # one typo
+            i = rng.randrange(len(word))
+            typo = word[:i] + rng.choice(letters) + word[i + 1:]
+            queries.add(f"/fuzzy?q={quote(typo)}")
+        else:
+            map_id = quote(rng.choice(maps))
+            x, y = rng.uniform(0, 7000), rng.uniform(0, 5000)
+            if kind == 2:
+                queries.add(f"/area?map={map_id}&window={x:.0f},{y:.0f},{x + 1000:.0f},{y + 1000:.0f}")
+            else:
+                queries.add(f"/area?map={map_id}&near={x:.0f},{y:.0f}&k=10")
+    return sorted(queries)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(store, index_path, port):
+    """Runs search_server.py in its own process and waits until it answers."""
+    process = subprocess.Popen([
+        sys.executable, SERVER_SCRIPT, "--store", store, "--index", index_path, "--port", str(port),
+    ])
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError("search_server.py exited before serving")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/status")
+            connection.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+
+
+def run_load(url, paths, clients):
+    """Sends paths from concurrent keep-alive clients. Returns [(endpoint, seconds)]."""
+    host = urlparse(url)
+    local = threading.local()
+
+    def send(path):
+        if not hasattr(local, "connection"):
+            local.connection = http.client.HTTPConnection(host.hostname, host.port)
+        start = time.perf_counter()
+        local.connection.request("GET", path)
+        response = local.connection.getresponse()
+        body = response.read()
+        seconds = time.perf_counter() - start
+        if response.status != 200:
+            raise RuntimeError(f"{path}: HTTP {response.status} {body[:200]!r}")
+        return path[1:].split("?")[0], seconds
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        return list(pool.map(send, paths))
+
+
+def report(name, timings, wall):
+    print(f"\n📊 {name}: {len(timings)} requests in {wall:.2f}s ({len(timings) / wall:.0f} req/s)")
+    print(f"   {'endpoint':<8} {'count':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for endpoint in sorted({e for e, _ in timings}) + ["all"]:
+        ms = np.array([s for e, s in timings if endpoint in (e, "all")]) * 1000
+        print(f"   {endpoint:<8} {len(ms):>6} {np.percentile(ms, 50):>8.2f} "
+              f"{np.percentile(ms, 99):>8.2f} {ms.max():>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the latency of search_server.py.")
+    parser.add_argument("--store", help="Results store to query (default: a stand-in corpus)")
+    parser.add_argument("--url", help="Load an already running service instead of starting one")
+    parser.add_argument("--maps", type=int, default=200, help="Maps of the stand-in corpus")
+    parser.add_argument("--labels", type=int, default=500, help="Labels per map of the stand-in corpus")
+    parser.add_argument("--queries", type=int, default=1000, help="Distinct queries")
+    parser.add_argument("--requests", type=int, default=10000, help="Requests of the warm run")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = args.store
+        if store is None:
+            store = os.path.join(tmp, "store")
+            print(f"🧪 Writing a stand-in corpus of {args.maps} maps x {args.labels} labels...")
+            make_corpus(store, args.maps, args.labels, args.seed)
+
+        process = None
+        url = args.url
+        if url is None:
+            port = free_port()
+            start = time.time()
+            process = start_server(store, os.path.join(tmp, "index.npz"), port)
+            url = f"http://127.0.0.1:{port}"
+            print(f"🌐 Service up in {time.time() - start:.1f}s")
+
+        try:
+            paths = make_queries(store, args.queries, args.seed)
+            start = time.perf_counter()
+            report("Cold (each query once)", run_load(url, paths, args.clients), time.perf_counter() - start)
+
+            rng = random.Random(args.seed)
+            warm = [rng.choice(paths) for _ in range(args.requests)]
+            start = time.perf_counter()
+            report("Warm (random replay)", run_load(url, warm, args.clients), time.perf_counter() - start)
+
+            host = urlparse(url)
+            connection = http.client.HTTPConnection(host.hostname, host.port)
+            connection.request("GET", "/status")
+            status = json.loads(connection.getresponse().read())
+            print(f"\n🗄️  {status['labels']} labels in {status['maps']} maps, cache: {status['cache']}")
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,95 @@
-import pandas as pd
 import argparse
 import os
 
+import pyarrow as pa
+
+import results_store
+import spatial_index
+from text_index import TextIndex
+
 # --- CONFIGURATION ---
 # We use your new ELITE dataset for the best results
-CSV_FILE = "map_text_results_elite.csv"
+RESULTS_STORE = "map_text_results_elite"
+# Trigram index of the store, rebuilt automatically when the store changes
+INDEX_FILE = "map_text_results_elite_index.npz"
 
-def search(query):
-    if not os.path.exists(CSV_FILE):
+def search(query, prefix=False, regex=False):
+    if not os.path.isdir(RESULTS_STORE):
         print("❌ Error: Elite data file not found. Run boost_accuracy.py first.")
         return
 
     print(f"🔎 Searching for '{query}'...")
-    df = pd.read_csv(CSV_FILE)
-    
-    # Case-insensitive search
-    # We convert the column to string to handle any edge cases
-    mask = df['Detected Text'].astype(str).str.contains(query, case=False, na=False)
-    results = df[mask]
-
-    if len(results) == 0:
+    if regex:
+        # Case-insensitive regular expression, evaluated by a scan of the store
+        results = results_store.read_table(RESULTS_STORE, filter=results_store.text_filter(query))
+    else:
+        # Case and accent insensitive search in the index; only the matching
+        # rows are read from the store
+        index = TextIndex.open(RESULTS_STORE, INDEX_FILE)
+        results = results_store.read_rows(RESULTS_STORE, index.search(query, prefix=prefix))
+
+    if results.num_rows == 0:
         print(f"❌ No matches found for '{query}'")
         return
+    print_results(results)
+
+def search_area(map_id, query=None, prefix=False, window=None, near=None, k=10):
+    """Labels of one map inside a window or nearest to a point, optionally matching query."""
+    if map_id not in results_store.map_ids(RESULTS_STORE):
+        print(f"❌ Error: no results for map '{map_id}'.")
+        return
+
+    where = f"in {window}" if window is not None else f"near {near}"
+    print(f"🗺️  Labels of {map_id} {where}" + (f" matching '{query}'" if query else "") + "...")
+    results = spatial_index.query_map(
+        RESULTS_STORE, map_id, window=window, near=near, k=k, text=query, prefix=prefix
+    )
+    results = results.append_column(results_store.MAP_ID, pa.array([map_id] * results.num_rows, pa.string()))
 
-    print(f"✅ Found {len(results)} matches:")
+    if results.num_rows == 0:
+        print("❌ No labels found there")
+        return
+    print_results(results)
+
+def print_results(results):
+    print(f"✅ Found {results.num_rows} matches:")
     print("-" * 60)
-    
-    for i, row in results.iterrows():
-        text = row['Detected Text']
-        file = row['Filename']
-        conf = float(row['Confidence']) * 100
-        box = row['Box Coordinates']
-        
+
+    for text, file, conf, box in zip(
+        results.column(results_store.TEXT).to_pylist(),
+        results.column(results_store.MAP_ID).to_pylist(),
+        results.column(results_store.CONFIDENCE).to_pylist(),
+        results_store.boxes(results).tolist(),
+    ):
+        conf = float(conf) * 100
+
         print(f"📍 Map: {file}")
-        print(f"   Label: '{text}'") 
+        print(f"   Label: '{text}'")
         print(f"   Confidence: {conf:.1f}%")
         print(f"   Location: {box}")
         print("-" * 60)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Search your historic map database.")
-    parser.add_argument("query", type=str, help="The word to find (e.g., 'River', 'City')")
+    parser.add_argument("query", type=str, nargs="?", help="The word to find (e.g., 'River', 'City')")
+    parser.add_argument("--prefix", action="store_true", help="Only match labels starting with the query")
+    parser.add_argument("--regex", action="store_true",
+                        help="The query is a regular expression (scans the whole store, no index)")
+    parser.add_argument("--map", help="Map file name, for --window and --near")
+    parser.add_argument("--window", type=float, nargs=4, metavar=("X0", "Y0", "X1", "Y1"),
+                        help="Only labels inside this rectangle of --map")
+    parser.add_argument("--near", type=float, nargs=2, metavar=("X", "Y"),
+                        help="The --k labels of --map closest to this point")
+    parser.add_argument("--k", type=int, default=10)
     args = parser.parse_args()
-    
-    search(args.query)
\ No newline at end of file
+
+    if args.regex and (args.prefix or args.window is not None or args.near is not None):
+        parser.error("--regex cannot be combined with --prefix, --window or --near")
+    if args.window is not None or args.near is not None:
+        if args.map is None:
+            parser.error("--window and --near need --map")
+        search_area(args.map, args.query, prefix=args.prefix, window=args.window, near=args.near, k=args.k)
+    elif args.query is None:
+        parser.error("a query is needed without --window or --near")
+    else:
+        search(args.query, prefix=args.prefix, regex=args.regex)
@@ -0,0 +1,440 @@
+"""
+Local HTTP/JSON search service over a results store.
+
+The indexes are loaded once and shared by every request:
+  - the trigram text index (text_index.py), memory-mapped;
+  - a fuzzy index over the words of the labels (tools/fuzzy_index.py);
+  - the spatial index of each map (spatial_index.py), opened on first use.
+Requests are served concurrently and their responses kept in an LRU cache.
+The store is checked every RELOAD_SECONDS: when new results have been
+written, fresh indexes are built in the background and swapped in, and
+the cache is emptied. Requests never wait for a reload, and only the maps
+that changed are read again for the fuzzy index.
+
+On Windows nothing is memory-mapped (see MEMORY_MAP): a mapped file cannot
+be replaced there, so writing a map to a served store would fail.
+
+Endpoints (GET, JSON responses):
+  /search?q=river[&prefix=1][&limit=100]        labels containing q (or starting with it)
+  /fuzzy?q=rivr[&limit=5]                       closest words, with their labels
+  /area?map=a.png&window=X0,Y0,X1,Y1[&q=...]    labels of a map in a rectangle
+  /area?map=a.png&near=X,Y[&k=10][&q=...]       labels of a map closest to a point
+  /crop?map=a.png&box=3                         thumbnail of a box (image bytes)
+  /status                                       store version, sizes, cache hits
+
+With a crop store (crop_store.py), every label lists the box ids of its
+thumbnails ("crops"), to be fetched with /crop.
+
+Usage:
+  python core_pipeline/search_server.py [--port 8765]
+  curl "http://127.0.0.1:8765/search?q=river"
+
+See search_load_test.py for latency measurements.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import crop_store
+import results_store
+import spatial_index
+from text_index import TextIndex
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from fuzzy_index import FuzzyIndex  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+RESULTS_STORE = "map_text_results_elite"
+# Trigram index of the store (shared with search_maps.py)
+INDEX_FILE = "map_text_results_elite_index.npz"
+# Thumbnails written by the OCR run; None to serve without them
+CROP_STORE = "map_text_crops"
+HOST = "127.0.0.1"
+PORT = 8765
+# Responses kept in memory
+CACHE_SIZE = 4096
+# How often the store is checked for new results
+RELOAD_SECONDS = 5.0
+# Most labels returned by one query (or per word for /fuzzy)
+RESULT_LIMIT = 100
+# Windows cannot replace a file that is memory-mapped: there the maps and
+# the text index are read into memory, so the OCR run can write new results
+# (and the service its rebuilt index) while it is up
+MEMORY_MAP = os.name != "nt"
+
+
+class LRUCache(object):
+    """Least recently used cache, safe to share between threads."""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def _labels(table, rows, crops=None):
+    """
+    JSON-ready labels of a table read from the store; rows are (map_id, row)
+    pairs. With a CropStore, each label gets the box ids of its thumbnails.
+    """
+    labels = [
+        {"map": map_id, "row": row, "text": text, "confidence": conf, "det_score": det, "box": box}
+        for (map_id, row), text, conf, det, box in zip(
+            rows,
+            table.column(results_store.TEXT).to_pylist(),
+            table.column(results_store.CONFIDENCE).to_pylist(),
+            table.column(results_store.DET_SCORE).to_pylist(),
+            results_store.boxes(table).tolist(),
+        )
+    ]
+    if crops is not None:
+        for label, box_ids in zip(labels, results_store.box_ids(table)):
+            label["crops"] = crops.box_ids(label["map"], box_ids)
+    return labels
+
+
+def _floats(value, count, name):
+    try:
+        values = [float(v) for v in value.split(",")]
+    except ValueError:
+        values = []
+    if len(values) != count:
+        raise ValueError(f"{name} needs {count} comma separated numbers")
+    return values
+
+
+class Indexes(object):
+    """
+    The indexes of one version of the store. Requests only read them; the
+    maps (memory-mapped) and their spatial indexes are opened on first use
+    and kept open. Built from the indexes of the previous version, only the
+    words of the maps that changed are read again.
+    """
+
+    def __init__(self, root, index_path, crops=None, previous=None):
+        self.root = root
+        self.crops = crops
+        self.text_index = TextIndex.open(root, index_path, mmap=MEMORY_MAP)
+        self.version = self.text_index.version
+
+        # Words of the labels, per map: map_id -> (file stat, words, rows of
+        # the words in the map, rows of the map)
+        self.map_words = {}
+        for map_id in results_store.map_ids(root):
+            stat = os.stat(results_store.map_file(root, map_id))
+            stamp = (stat.st_size, stat.st_mtime_ns)
+            cached = previous.map_words.get(map_id) if previous is not None else None
+            if cached is None or cached[0] != stamp:
+                table = results_store.read_map(root, map_id, columns=[results_store.TEXT],
+                                               memory_map=MEMORY_MAP)
+                words, rows = [], []
+                texts = table.column(results_store.TEXT).to_pylist()
+                for row, text in enumerate(texts):
+                    if text is None:
+                        continue
+                    for word in text.split():
+                        words.append(word)
+                        rows.append(row)
+                cached = (stamp, words, rows, len(texts))
+            self.map_words[map_id] = cached
+
+        # word_rows maps the words back to rows numbered like the text index
+        # (across the store, in store order)
+        words, word_rows = [], []
+        row = 0
+        for _, map_word_list, map_rows, num_rows in self.map_words.values():
+            words.extend(map_word_list)
+            word_rows.extend(row + r for r in map_rows)
+            row += num_rows
+        self.fuzzy_index = FuzzyIndex(
+            words, base=previous.fuzzy_index if previous is not None else None,
+        )
+        self.word_rows = np.array(word_rows, dtype=np.int64)
+        self.num_rows = row
+
+        self.open_maps = {}
+        self.spatial_indexes = {}
+        self.spatial_lock = threading.Lock()
+
+    def spatial(self, map_id):
+        with self.spatial_lock:
+            index = self.spatial_indexes.get(map_id)
+            if index is None:
+                index = spatial_index.open_map_index(self.root, map_id)
+                self.spatial_indexes[map_id] = index
+        return index
+
+    def read_map(self, map_id):
+        table = self.open_maps.get(map_id)
+        if table is None:
+            table = self.open_maps.setdefault(
+                map_id, results_store.read_map(self.root, map_id, memory_map=MEMORY_MAP),
+            )
+        return table
+
+    def read_rows(self, rows):
+        return results_store.read_rows(self.root, rows, open_maps=self.open_maps, memory_map=MEMORY_MAP)
+
+    def search(self, params):
+        query = params.get("q", "")
+        if not query.strip():
+            raise ValueError("q is required")
+        limit = int(params.get("limit", RESULT_LIMIT))
+        rows = self.text_index.search(query, prefix=params.get("prefix") == "1")
+        shown = rows[:limit]
+        return {
+            "query": query,
+            "total": len(rows),
+            "results": _labels(self.read_rows(shown), shown, self.crops),
+        }
+
+    def fuzzy(self, params):
+        query = params.get("q", "").strip()
+        if not query:
+            raise ValueError("q is required")
+        matches = []
+        for word, score, count in self.fuzzy_index.search(query, limit=int(params.get("limit", 5))):
+            rows = np.unique(self.word_rows[self.fuzzy_index.rows[word]])
+            rows = self.text_index.locate(rows[:RESULT_LIMIT])
+            matches.append({
+                "word": word,
+                "score": score,
+                "count": count,
+                "results": _labels(self.read_rows(rows), rows, self.crops),
+            })
+        return {"query": query, "matches": matches}
+
+    def area(self, params):
+        map_id = params.get("map")
+        if map_id is None:
+            raise ValueError("map is required")
+        if map_id not in self.text_index.map_ids:
+            raise KeyError(f"no results for map '{map_id}'")
+        window = near = None
+        if "window" in params:
+            window = _floats(params["window"], 4, "window")
+        elif "near" in params:
+            near = _floats(params["near"], 2, "near")
+        else:
+            raise ValueError("window or near is required")
+        table = spatial_index.query_map(
+            self.root, map_id, window=window, near=near, k=int(params.get("k", 10)),
+            text=params.get("q"), prefix=params.get("prefix") == "1",
+            index=self.spatial(map_id), table=self.read_map(map_id),
+        )
+        rows = [(map_id, row) for row in table.column("row").to_pylist()[:RESULT_LIMIT]]
+        return {"map": map_id, "total": table.num_rows, "results": _labels(table, rows, self.crops)}
+
+
+def load_indexes(root, index_path, crops=None, previous=None):
+    """Builds the indexes of the store, again if it changed while they were being built."""
+    while True:
+        indexes = Indexes(root, index_path, crops, previous)
+        if results_store.version(root) == indexes.version:
+            return indexes
+
+
+class SearchService(object):
+    """The current indexes of a store, its crop store, a response cache and the reload loop."""
+
+    ENDPOINTS = ("search", "fuzzy", "area")
+
+    def __init__(self, root=RESULTS_STORE, index_path=INDEX_FILE, cache_size=CACHE_SIZE,
+                 crop_root=None):
+        self.root = root
+        self.index_path = index_path
+        self.cache = LRUCache(cache_size)
+        self.crops = crop_store.CropStore(crop_root) if crop_root is not None else None
+        self.indexes = load_indexes(root, index_path, self.crops)
+        self.reloads = 0
+        self._stop = threading.Event()
+
+    def reload(self):
+        """Swaps in new indexes if the store has changed. Returns True if it had."""
+        if self.crops is not None:
+            # crops are written before the results of their map
+            self.crops.refresh()
+        if results_store.version(self.root) == self.indexes.version:
+            return False
+        # Requests keep using the old indexes until the new ones are ready
+        self.indexes = load_indexes(self.root, self.index_path, self.crops, self.indexes)
+        self.cache.clear()
+        self.reloads += 1
+        return True
+
+    def watch(self, interval=RELOAD_SECONDS):
+        """Reloads in a background thread whenever the store changes."""
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    if self.reload():
+                        print(f"🔄 Reloaded {self.root} ({self.indexes.num_rows} labels)")
+                except Exception as e:
+                    # a map half way through being written: try again next time
+                    print(f"⚠️  Reload failed: {e}")
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def query(self, endpoint, params):
+        """JSON body of the response to one query, from the cache when possible."""
+        indexes = self.indexes
+        key = (indexes.version, endpoint, tuple(sorted(params.items())))
+        body = self.cache.get(key)
+        if body is None:
+            body = json.dumps(getattr(indexes, endpoint)(params)).encode("utf-8")
+            self.cache.put(key, body)
+        return body
+
+    def crop(self, params):
+        """Encoded thumbnail of a box and its content type."""
+        if self.crops is None:
+            raise KeyError("no crop store is served")
+        try:
+            box_id = int(params["box"])
+        except (KeyError, ValueError):
+            raise ValueError("box needs an integer box id")
+        data = self.crops.read(params.get("map"), box_id)
+        if data is None:
+            raise KeyError(f"no crop {box_id} for map '{params.get('map')}'")
+        content_type = "image/webp" if data[:4] == b"RIFF" else "image/jpeg"
+        return data, content_type
+
+    def status(self):
+        indexes = self.indexes
+        return {
+            "store": os.path.abspath(self.root),
+            "version": indexes.version,
+            "maps": len(indexes.text_index.map_ids),
+            "labels": indexes.num_rows,
+            "words": len(indexes.fuzzy_index.words),
+            "crop_maps": len(self.crops.maps) if self.crops is not None else None,
+            "reloads": self.reloads,
+            "cache": {
+                "entries": len(self.cache.entries), "hits": self.cache.hits, "misses": self.cache.misses,
+            },
+        }
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    # keep-alive, so clients do not pay a new connection per query; headers
+    # and body are separate writes, which Nagle would hold back ~40ms
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        endpoint = url.path.strip("/")
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        service = self.server.service
+        content_type = "application/json; charset=utf-8"
+        try:
+            if endpoint == "crop":
+                body, content_type = service.crop(params)
+            elif endpoint == "status":
+                body = json.dumps(service.status()).encode("utf-8")
+            elif endpoint in service.ENDPOINTS:
+                body = service.query(endpoint, params)
+            else:
+                raise KeyError(f"unknown endpoint '/{endpoint}'")
+            status = 200
+        except KeyError as e:
+            status, body = 404, json.dumps({"error": e.args[0]}).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        except ValueError as e:
+            status, body = 400, json.dumps({"error": str(e)}).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        except Exception as e:
+            # a bug, or a store changing under the request: answer, keep serving
+            logger.exception("%s failed", self.path)
+            status, body = 500, json.dumps({"error": f"{type(e).__name__}: {e}"}).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # one line per request drowns the reload messages
+        pass
+
+
+def make_server(service, host=HOST, port=PORT):
+    server = ThreadingHTTPServer((host, port), SearchHandler)
+    server.service = service
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve map text searches over HTTP.")
+    parser.add_argument("--store", default=RESULTS_STORE)
+    parser.add_argument("--index", default=INDEX_FILE, help="Trigram index file of the store")
+    parser.add_argument("--crops", default=CROP_STORE, help="Crop store of the OCR run")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--reload", type=float, default=RELOAD_SECONDS,
+                        help="Seconds between checks of the store for new results")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.store):
+        print(f"❌ Error: results store '{args.store}' not found. Run run_pipeline.py first.")
+        sys.exit(1)
+
+    start = time.time()
+    crop_root = args.crops if args.crops and os.path.isdir(args.crops) else None
+    service = SearchService(args.store, args.index, crop_root=crop_root)
+    elapsed = time.time() - start
+    print(f"📚 Loaded {service.indexes.num_rows} labels from {args.store} in {elapsed:.1f}s")
+    service.watch(args.reload)
+    server = make_server(service, args.host, args.port)
+    print(f"🌐 Serving on http://{args.host}:{server.server_address[1]}/ (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Spatial index over the label polygons of one map.
+
+A packed R-tree (Sort-Tile-Recursive): the boxes are sorted into tiles of
+NODE_SIZE, and every level of the tree is a flat array of bounding boxes
+whose node i covers children [i * NODE_SIZE, (i + 1) * NODE_SIZE) of the
+level below. Window and polygon queries descend the levels with NumPy;
+nearest-neighbour queries are a best-first search. Candidates are checked
+against the exact polygons.
+
+The index of a map is saved in its store directory (<map dir>/_rtree.npz,
+skipped by dataset scans) together with the polygons, so a viewer can
+find the labels of a viewport without reading the map's rows.
+"""
+import heapq
+import os
+import zipfile
+
+import numpy as np
+import pyarrow as pa
+import shapely
+
+import results_store
+from text_index import normalize
+
+NODE_SIZE = 16
+INDEX_FILE = "_rtree.npz"
+
+
+def _children(nodes, num_children):
+    """Indices of the children of nodes, on the level below."""
+    starts = nodes * NODE_SIZE
+    lengths = np.minimum(starts + NODE_SIZE, num_children) - starts
+    shift = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return shift + np.arange(lengths.sum())
+
+
+def _intersects(rects, x0, y0, x1, y1):
+    return (rects[:, 0] <= x1) & (rects[:, 2] >= x0) & (rects[:, 1] <= y1) & (rects[:, 3] >= y0)
+
+
+def _rect_distance(rects, x, y):
+    dx = np.maximum(np.maximum(rects[:, 0] - x, x - rects[:, 2]), 0)
+    dy = np.maximum(np.maximum(rects[:, 1] - y, y - rects[:, 3]), 0)
+    return np.hypot(dx, dy)
+
+
+class SpatialIndex(object):
+    """
+    Packed R-tree of one map. Query results are rows of the map file, so
+    they can be read with results_store.read_map(...).take(rows).
+    """
+
+    def __init__(self, boxes, order, level_rects, source=None):
+        self.boxes = boxes  # [N, 4, 2], in tree order
+        self.order = order  # tree order -> row of the map file
+        self.level_rects = level_rects  # leaves (the boxes) first, root last
+        self.source = source
+        self._polygons = None
+
+    @classmethod
+    def build(cls, boxes, source=None):
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4, 2)
+        rects = np.concatenate([boxes.min(axis=1), boxes.max(axis=1)], axis=1)
+
+        # Sort-Tile-Recursive: vertical slices by x center, then y center within a slice
+        num_leaves = -(-len(boxes) // NODE_SIZE)
+        slice_size = NODE_SIZE * int(np.ceil(np.sqrt(num_leaves)))
+        centers = (rects[:, :2] + rects[:, 2:]) / 2
+        order = np.argsort(centers[:, 0], kind="stable")
+        slice_id = np.arange(len(order)) // max(slice_size, 1)
+        order = order[np.lexsort((centers[order, 1], slice_id))]
+
+        level_rects = [rects[order]]
+        while len(level_rects[-1]) > 1:
+            level = level_rects[-1]
+            starts = np.arange(0, len(level), NODE_SIZE)
+            level_rects.append(np.concatenate([
+                np.minimum.reduceat(level[:, :2], starts),
+                np.maximum.reduceat(level[:, 2:], starts),
+            ], axis=1))
+        return cls(boxes[order], order, level_rects, source)
+
+    def save(self, path):
+        offsets = np.cumsum([0] + [len(rects) for rects in self.level_rects])
+        # written aside and renamed, so a reader never loads half an index
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                boxes=self.boxes,
+                order=self.order,
+                level_rects=np.concatenate(self.level_rects),
+                level_offsets=offsets,
+                source=np.asarray(self.source if self.source is not None else [], dtype=np.int64),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            offsets = arrays["level_offsets"]
+            level_rects = arrays["level_rects"]
+            return cls(
+                arrays["boxes"],
+                arrays["order"],
+                [level_rects[s:e] for s, e in zip(offsets[:-1], offsets[1:])],
+                tuple(arrays["source"].tolist()),
+            )
+
+    @property
+    def polygons(self):
+        if self._polygons is None:
+            self._polygons = shapely.polygons(self.boxes)
+        return self._polygons
+
+    def _window_items(self, x0, y0, x1, y1):
+        """Tree order indices of the boxes whose bounding box meets the window."""
+        if len(self.boxes) == 0:
+            return np.zeros(0, dtype=np.int64)
+        nodes = np.zeros(1, dtype=np.int64)
+        nodes = nodes[_intersects(self.level_rects[-1][nodes], x0, y0, x1, y1)]
+        for level in reversed(self.level_rects[:-1]):
+            nodes = _children(nodes, len(level))
+            nodes = nodes[_intersects(level[nodes], x0, y0, x1, y1)]
+        return nodes
+
+    def _rows(self, items, allowed):
+        rows = self.order[items]
+        if allowed is not None:
+            rows = rows[allowed[rows]]
+        return np.sort(rows)
+
+    def intersecting(self, polygon, allowed=None):
+        """Rows whose polygon intersects a shapely geometry."""
+        items = self._window_items(*polygon.bounds)
+        items = items[shapely.intersects(self.polygons[items], polygon)]
+        return self._rows(items, allowed)
+
+    def window(self, x0, y0, x1, y1, allowed=None):
+        """Rows whose polygon meets the rectangle (x0, y0) - (x1, y1)."""
+        return self.intersecting(shapely.box(x0, y0, x1, y1), allowed=allowed)
+
+    def nearest(self, x, y, k=1, allowed=None):
+        """
+        Rows of the k polygons closest to (x, y), closest first. allowed is
+        an optional boolean mask over the rows of the map.
+        """
+        if len(self.boxes) == 0 or k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        point = shapely.Point(x, y)
+        num_levels = len(self.level_rects)
+        # (distance, level, index); level 0 entries are boxes, the entry
+        # above the root level stands for the whole tree
+        heap = [(0.0, num_levels, 0)]
+        rows = []
+        while heap and len(rows) < k:
+            _, level, index = heapq.heappop(heap)
+            if level == 0:
+                rows.append(self.order[index])
+                continue
+            if level == num_levels:
+                children = np.arange(len(self.level_rects[-1]))
+            else:
+                children = _children(np.array([index]), len(self.level_rects[level - 1]))
+            if level == 1:
+                if allowed is not None:
+                    children = children[allowed[self.order[children]]]
+                distances = shapely.distance(self.polygons[children], point)
+            else:
+                distances = _rect_distance(self.level_rects[level - 1][children], x, y)
+            for distance, child in zip(distances.tolist(), children.tolist()):
+                heapq.heappush(heap, (distance, level - 1, child))
+        return np.array(rows, dtype=np.int64)
+
+
+def _source(root, map_id):
+    stat = os.stat(results_store.map_file(root, map_id))
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def open_map_index(root, map_id):
+    """Loads the spatial index of a map, (re)building it if the map has changed."""
+    path = os.path.join(os.path.dirname(results_store.map_file(root, map_id)), INDEX_FILE)
+    source = _source(root, map_id)
+    try:
+        index = SpatialIndex.load(path)
+        if index.source == source:
+            return index
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        pass
+    table = results_store.read_map(root, map_id, columns=[results_store.BOX])
+    index = SpatialIndex.build(results_store.boxes(table), source=source)
+    index.save(path)
+    return index
+
+
+def text_mask(root, map_id, query, prefix=False, table=None):
+    """Rows of a map whose label contains (or starts with) query, as text_index matches."""
+    query = normalize(query)
+    if table is None:
+        table = results_store.read_map(root, map_id, columns=[results_store.TEXT])
+    texts = [normalize(t) for t in table.column(results_store.TEXT).to_pylist()]
+    if prefix:
+        return np.array([t.startswith(query) for t in texts], dtype=bool)
+    return np.array([query in t for t in texts], dtype=bool)
+
+
+def query_map(root, map_id, window=None, polygon=None, near=None, k=10, text=None,
+              prefix=False, columns=None, index=None, table=None):
+    """
+    Labels of one map in a window (x0, y0, x1, y1), intersecting a polygon
+    (list of points) or the k nearest to a point near=(x, y), optionally
+    restricted to labels matching text. Returns the rows read from the
+    store with a "row" column (row in the map file). index and table are
+    the map's SpatialIndex and full table, if already open.
+    """
+    if index is None:
+        index = open_map_index(root, map_id)
+    allowed = text_mask(root, map_id, text, prefix, table=table) if text is not None else None
+    if near is not None:
+        rows = index.nearest(near[0], near[1], k=k, allowed=allowed)
+    elif polygon is not None:
+        rows = index.intersecting(shapely.Polygon(polygon), allowed=allowed)
+    elif window is not None:
+        rows = index.window(*window, allowed=allowed)
+    else:
+        rows = np.arange(len(index.order)) if allowed is None else np.flatnonzero(allowed)
+    if table is None:
+        table = results_store.read_map(root, map_id, columns=columns)
+    elif columns is not None:
+        table = table.select(columns)
+    return table.take(rows).append_column("row", pa.array(rows, pa.int64()))
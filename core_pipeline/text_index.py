@@ -0,0 +1,249 @@
+"""
+Trigram inverted index over the texts of a results store.
+
+Texts are normalized (accents removed, case folded, whitespace collapsed)
+and deduplicated; every trigram of a text points at the text, and every
+text points at its rows (map id + row in the map file). A substring query
+intersects the postings of its trigrams and checks the few candidates
+left; a prefix query is a binary search in the sorted texts.
+
+The index is saved as a single (uncompressed) .npz file next to the store
+and is rebuilt when the store changes (see results_store.version). A
+long-running reader can memory-map it instead of reading it.
+"""
+import bisect
+import os
+import struct
+import unicodedata
+import zipfile
+
+import numpy as np
+
+import results_store
+
+
+def normalize(text):
+    """
+    Accent and case insensitive form of a text, used for indexing and
+    queries. A null text is empty (it matches no query).
+    """
+    if text is None:
+        return ""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.casefold().split())
+
+
+def trigram_codes(text):
+    """Distinct trigrams of a normalized text, each packed into one int64."""
+    codes = {
+        (ord(text[i]) << 42) | (ord(text[i + 1]) << 21) | ord(text[i + 2])
+        for i in range(len(text) - 2)
+    }
+    return np.array(sorted(codes), dtype=np.int64)
+
+
+def _pack_strings(strings):
+    # "\n" never appears in a normalized text or a map file name
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _unpack_strings(blob, count):
+    if count == 0:
+        return []
+    return blob.tobytes().decode("utf-8").split("\n")
+
+
+def _memmap_npz(path):
+    """Arrays of an uncompressed .npz file, memory-mapped instead of read."""
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: compressed archives cannot be memory-mapped")
+            # local file header: 30 fixed bytes, then the name and extra field
+            f.seek(info.header_offset)
+            name_length, extra_length = struct.unpack("<HH", f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len(".npy")]
+            if dtype.hasobject:
+                raise ValueError(f"{path}: object arrays cannot be memory-mapped")
+            if not shape or 0 in shape:
+                # scalars and empty arrays: nothing worth mapping
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+                arrays[name] = np.lib.format.read_array(f)
+                continue
+            arrays[name] = np.memmap(
+                path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                order="F" if fortran_order else "C",
+            )
+    return arrays
+
+
+def _gather(offsets, values, keys):
+    """Concatenation of the CSR groups of keys (see _csr)."""
+    starts, ends = offsets[keys], offsets[keys + 1]
+    lengths = ends - starts
+    shift = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return values[shift + np.arange(lengths.sum())]
+
+
+def _csr(keys, values, num_keys):
+    """Groups values by key: values[offsets[k]:offsets[k + 1]] belong to k."""
+    order = np.argsort(keys, kind="stable")
+    offsets = np.zeros(num_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=num_keys), out=offsets[1:])
+    return offsets, values[order]
+
+
+class TextIndex(object):
+    """
+    Trigram index of one results store. Build it with TextIndex.build,
+    persist it with save/load and query it with search.
+    """
+
+    def __init__(self, arrays):
+        self.version = str(arrays["version"])
+        self.map_ids = _unpack_strings(arrays["map_blob"], len(arrays["row_map_offsets"]) - 1)
+        self.texts = _unpack_strings(arrays["text_blob"], len(arrays["text_row_offsets"]) - 1)
+        self.trigrams = arrays["trigrams"]
+        self.trigram_offsets = arrays["trigram_offsets"]
+        self.trigram_texts = arrays["trigram_texts"]
+        self.text_row_offsets = arrays["text_row_offsets"]
+        self.text_rows = arrays["text_rows"]
+        self.row_map_offsets = arrays["row_map_offsets"]
+
+    @classmethod
+    def build(cls, root):
+        """Indexes the text column of every map of the store at root."""
+        version = results_store.version(root)
+        map_ids, row_texts = [], []
+        normalized = {}  # labels repeat a lot: normalize each one once
+        for map_id, table in results_store.iter_maps(root, columns=[results_store.TEXT]):
+            map_ids.append(map_id)
+            texts = table.column(results_store.TEXT).to_pylist()
+            for t in set(texts).difference(normalized):
+                normalized[t] = normalize(t)
+            row_texts.append([normalized[t] for t in texts])
+        row_map_offsets = np.zeros(len(map_ids) + 1, dtype=np.int64)
+        np.cumsum([len(texts) for texts in row_texts], out=row_map_offsets[1:])
+
+        # Rows are numbered across maps; texts are sorted and deduplicated
+        texts = sorted({t for map_texts in row_texts for t in map_texts})
+        text_id = {text: i for i, text in enumerate(texts)}
+        row_text = np.fromiter(
+            (text_id[t] for map_texts in row_texts for t in map_texts),
+            dtype=np.int64,
+            count=int(row_map_offsets[-1]),
+        )
+        text_row_offsets, text_rows = _csr(
+            row_text, np.arange(len(row_text), dtype=np.int64), len(texts)
+        )
+
+        codes = [trigram_codes(text) for text in texts]
+        code_text = np.repeat(np.arange(len(texts), dtype=np.int64), [len(c) for c in codes])
+        codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64)
+        trigrams, code_index = np.unique(codes, return_inverse=True)
+        trigram_offsets, trigram_texts = _csr(code_index.ravel(), code_text, len(trigrams))
+
+        return cls({
+            "version": np.array(version),
+            "map_blob": _pack_strings(map_ids),
+            "text_blob": _pack_strings(texts),
+            "trigrams": trigrams,
+            "trigram_offsets": trigram_offsets,
+            "trigram_texts": trigram_texts,
+            "text_row_offsets": text_row_offsets,
+            "text_rows": text_rows,
+            "row_map_offsets": row_map_offsets,
+        })
+
+    def save(self, path):
+        # Written next to path and renamed: readers that memory-mapped the
+        # old file keep reading it safely
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                version=np.array(self.version),
+                map_blob=_pack_strings(self.map_ids),
+                text_blob=_pack_strings(self.texts),
+                trigrams=self.trigrams,
+                trigram_offsets=self.trigram_offsets,
+                trigram_texts=self.trigram_texts,
+                text_row_offsets=self.text_row_offsets,
+                text_rows=self.text_rows,
+                row_map_offsets=self.row_map_offsets,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """Loads a saved index; with mmap the posting arrays stay on disk."""
+        if mmap:
+            return cls(_memmap_npz(path))
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    @classmethod
+    def open(cls, root, path, mmap=False):
+        """Loads the index at path, (re)building it if the store has changed."""
+        try:
+            index = cls.load(path, mmap=mmap)
+            if index.version == results_store.version(root):
+                return index
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            pass
+        index = cls.build(root)
+        index.save(path)
+        return cls.load(path, mmap=True) if mmap else index
+
+    def _postings(self, code):
+        pos = np.searchsorted(self.trigrams, code)
+        if pos == len(self.trigrams) or self.trigrams[pos] != code:
+            return np.zeros(0, dtype=np.int64)
+        return self.trigram_texts[self.trigram_offsets[pos] : self.trigram_offsets[pos + 1]]
+
+    def match_texts(self, query, prefix=False):
+        """Ids of the (normalized) texts containing, or starting with, query."""
+        query = normalize(query)
+        if prefix:
+            lo = bisect.bisect_left(self.texts, query)
+            hi = bisect.bisect_left(self.texts, query + "\U0010ffff")
+            return np.arange(lo, hi, dtype=np.int64)
+        if len(query) < 3:
+            # too short for a trigram: check every distinct text
+            return np.array([i for i, text in enumerate(self.texts) if query in text], dtype=np.int64)
+
+        postings = sorted((self._postings(code) for code in trigram_codes(query)), key=len)
+        candidates = postings[0]
+        for other in postings[1:]:
+            if len(candidates) == 0:
+                break
+            candidates = np.intersect1d(candidates, other, assume_unique=True)
+        # all trigrams present does not mean they are adjacent: verify
+        return np.array([i for i in candidates if query in self.texts[i]], dtype=np.int64)
+
+    def search(self, query, prefix=False):
+        """
+        Rows matching query, as a list of (map_id, row in the map file),
+        in store order.
+        """
+        text_ids = self.match_texts(query, prefix=prefix)
+        if len(text_ids) == 0:
+            return []
+        return self.locate(np.sort(_gather(self.text_row_offsets, self.text_rows, text_ids)))
+
+    def locate(self, rows):
+        """(map_id, row in the map file) of sorted rows numbered across the store."""
+        rows = np.asarray(rows, dtype=np.int64)
+        maps = np.searchsorted(self.row_map_offsets, rows, side="right") - 1
+        return [
+            (self.map_ids[m], int(row - self.row_map_offsets[m]))
+            for m, row in zip(maps.tolist(), rows.tolist())
+        ]
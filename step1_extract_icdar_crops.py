@@ -15,12 +15,23 @@ Output Format (PaddleOCR compatible):
   train_data/rec/train_list.txt  ← "path/to/crop.jpg\tword_text"
   train_data/rec/val_list.txt
 
+Maps are extracted in parallel (one map per task: decoded once, its crops
+encoded on a few threads); the label files keep the annotation order, so
+the output does not depend on the number of workers.
+
 Usage:
   python step1_extract_icdar_crops.py
+  python step1_extract_icdar_crops.py --only-changed   # skip maps unchanged since the last run
 """
 
+import argparse
+import contextlib
+import hashlib
 import json
+import multiprocessing as mp
 import os
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 from tqdm import tqdm
@@ -34,6 +45,12 @@ VAL_IMAGES_DIR    = "Rumsey_Map_OCR_Data/rumsey/icdar24-val-png/val_images"
 
 OUTPUT_DIR        = "train_data/rec"
 MIN_CROP_SIZE     = 8   # Minimum width/height in pixels to keep a crop
+JPEG_QUALITY      = 95
+
+NUM_WORKERS       = os.cpu_count() or 1   # Maps extracted in parallel
+ENCODE_THREADS    = os.cpu_count() or 1   # JPEG writers in total, split between the workers
+# Per split record of the last run (hashes + labels of every map), for --only-changed
+STATE_FILE        = "{split}_state.json"
 # ──────────────────────────────────────────────────────────────────────────────
 
 
@@ -54,8 +71,162 @@ def polygon_to_crop(img, vertices):
     return crop
 
 
-def process_split(annotations_path, images_dir, output_images_dir, label_file_path, split_name):
-    """Process one split (train or val) of the ICDAR dataset."""
+def _settings():
+    """Settings the crops depend on: a change invalidates the saved state."""
+    return {"min_crop_size": MIN_CROP_SIZE, "jpeg_quality": JPEG_QUALITY}
+
+
+def load_state(state_path):
+    """Map name -> record of the last run, or {} if there is none (or it is outdated)."""
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if state.get("settings") != _settings():
+        return {}
+    return state["maps"]
+
+
+def save_state(state_path, maps):
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"settings": _settings(), "maps": maps}, f)
+    os.replace(tmp_path, state_path)
+
+
+def _unchanged(previous, record, output_images_dir):
+    return (
+        previous is not None
+        and previous["entry"] == record["entry"]
+        and previous["image"] == record["image"]
+        # a map with crops that could not be written is extracted again
+        and not previous.get("failed", 0)
+        and all(os.path.exists(os.path.join(output_images_dir, name)) for name in previous["files"])
+    )
+
+
+def map_keys(data, images_dir):
+    """
+    (key, n) of every annotation entry, n counting the entries of its image
+    so far: the key is the full path of the image, with a "#<n>" suffix
+    for the n-th entry of an image listed more than once.
+    """
+    counts = {}
+    keys = []
+    for entry in data:
+        path = os.path.normpath(os.path.join(images_dir, entry['image']))
+        n = counts[path] = counts.get(path, 0) + 1
+        keys.append((path if n == 1 else f"{path}#{n}", n))
+    return keys
+
+
+def extract_map(task):
+    """
+    Pool worker: extracts the word crops of one map. Returns (map key,
+    record, reused) where the record holds the hashes of the annotation
+    entry and image, the crop files, the labels and the skip counts.
+    With the record of the previous run, an unchanged map is not decoded.
+    """
+    entry, (key, n), images_dir, output_images_dir, split_name, previous, encode_threads = task
+    image_name = entry['image']
+    record = {
+        "entry": hashlib.sha1(json.dumps(entry, sort_keys=True).encode('utf-8')).hexdigest(),
+        "image": None,
+        "files": [],
+        "labels": [],
+        "illegible": 0,
+        "small": 0,
+        "missing": 0,
+        "failed": 0,
+    }
+
+    # The bytes are hashed, then decoded without reading the file again
+    try:
+        with open(os.path.join(images_dir, image_name), 'rb') as f:
+            raw = f.read()
+    except OSError:
+        record["missing"] = 1
+        return key, record, False
+    record["image"] = hashlib.sha1(raw).hexdigest()
+    if _unchanged(previous, record, output_images_dir):
+        return key, previous, True
+
+    img = cv2.imdecode(np.frombuffer(raw, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        record["missing"] = 1
+        return key, record, False
+
+    # Each entry has 'groups' — a list of text lines
+    # Each group is a list of word dicts with 'vertices', 'text', 'illegible'
+    jobs = []
+    base_name = os.path.splitext(image_name)[0]
+    if n > 1:
+        # an image listed again: its crops must not overwrite the first ones
+        base_name += f"_{n}"
+    for group_idx, group in enumerate(entry['groups']):
+        for word_idx, word in enumerate(group):
+
+            # Skip illegible words (no ground truth text)
+            if word.get('illegible', False):
+                record["illegible"] += 1
+                continue
+
+            text = word.get('text', '').strip()
+            if not text:
+                record["illegible"] += 1
+                continue
+
+            # Extract the crop
+            crop = polygon_to_crop(img, word['vertices'])
+            if crop is None:
+                record["small"] += 1
+                continue
+
+            crop_filename = f"{base_name}_g{group_idx}_w{word_idx}.jpg"
+            # Label relative to OUTPUT_DIR
+            rel_path = os.path.join(split_name, crop_filename).replace("\\", "/")
+            jobs.append((crop_filename, crop, f"{rel_path}\t{text}"))
+
+    # JPEG encoding releases the GIL: save the crops of the map on a few threads
+    params = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY]
+
+    def write(job):
+        try:
+            return cv2.imwrite(os.path.join(output_images_dir, job[0]), job[1], params)
+        except cv2.error:
+            return False
+
+    with ThreadPoolExecutor(max_workers=encode_threads) as executor:
+        written = list(executor.map(write, jobs))
+    # Only the crops on disk are labelled; a failure is retried by the next run
+    for (crop_filename, _, label), ok in zip(jobs, written):
+        if ok:
+            record["files"].append(crop_filename)
+            record["labels"].append(label)
+        else:
+            record["failed"] += 1
+            path = os.path.join(output_images_dir, crop_filename)
+            if os.path.exists(path):
+                os.remove(path)
+
+    # Crops of words that are no longer in the annotations
+    if previous is not None:
+        for name in set(previous["files"]) - set(record["files"]):
+            path = os.path.join(output_images_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+    return key, record, False
+
+
+def process_split(annotations_path, images_dir, output_images_dir, label_file_path, split_name,
+                  pool=None, only_changed=False, encode_threads=ENCODE_THREADS):
+    """
+    Process one split (train or val) of the ICDAR dataset. Maps are
+    extracted on the pool if one is given, each on encode_threads JPEG
+    writers; with only_changed, maps whose annotations and image are the
+    same as in the last run are skipped.
+    """
     print(f"\n{'='*60}")
     print(f"Processing {split_name} split...")
     print(f"{'='*60}")
@@ -65,73 +236,66 @@ def process_split(annotations_path, images_dir, output_images_dir, label_file_pa
     with open(annotations_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
+    state_path = os.path.join(OUTPUT_DIR, STATE_FILE.format(split=split_name))
+    previous = load_state(state_path) if only_changed else {}
+    tasks = (
+        (entry, key, images_dir, output_images_dir, split_name, previous.get(key[0]), encode_threads)
+        for entry, key in zip(data, map_keys(data, images_dir))
+    )
+
+    # imap yields the maps in annotation order: the label file is the same
+    # whatever the number of workers
+    mapper = pool.imap if pool is not None else map
+    maps = {}
     labels = []
     skipped_illegible = 0
     skipped_small = 0
     skipped_missing = 0
-    saved = 0
-
-    for entry in tqdm(data, desc=f"  Extracting {split_name} crops"):
-        image_name = entry['image']
-        img_path = os.path.join(images_dir, image_name)
-
-        if not os.path.exists(img_path):
-            skipped_missing += 1
-            continue
-
-        img = cv2.imread(img_path)
-        if img is None:
-            skipped_missing += 1
-            continue
-
-        # Each entry has 'groups' — a list of text lines
-        # Each group is a list of word dicts with 'vertices', 'text', 'illegible'
-        for group_idx, group in enumerate(entry['groups']):
-            for word_idx, word in enumerate(group):
-
-                # Skip illegible words (no ground truth text)
-                if word.get('illegible', False):
-                    skipped_illegible += 1
-                    continue
-
-                text = word.get('text', '').strip()
-                if not text:
-                    skipped_illegible += 1
-                    continue
-
-                vertices = word['vertices']
-
-                # Extract the crop
-                crop = polygon_to_crop(img, vertices)
-                if crop is None:
-                    skipped_small += 1
-                    continue
-
-                # Save crop
-                base_name = os.path.splitext(image_name)[0]
-                crop_filename = f"{base_name}_g{group_idx}_w{word_idx}.jpg"
-                crop_save_path = os.path.join(output_images_dir, crop_filename)
-                cv2.imwrite(crop_save_path, crop, [cv2.IMWRITE_JPEG_QUALITY, 95])
-
-                # Record label (relative path from OUTPUT_DIR)
-                rel_path = os.path.join(split_name, crop_filename).replace("\\", "/")
-                labels.append(f"{rel_path}\t{text}")
-                saved += 1
+    failed = 0
+    unchanged = 0
+    for key, record, reused in tqdm(mapper(extract_map, tasks), total=len(data),
+                                    desc=f"  Extracting {split_name} crops"):
+        maps[key] = record
+        labels.extend(record["labels"])
+        skipped_illegible += record["illegible"]
+        skipped_small += record["small"]
+        skipped_missing += record["missing"]
+        failed += record.get("failed", 0)
+        unchanged += reused
+
+    # Crops of maps that are no longer in the annotations
+    for key in set(previous) - set(maps):
+        for name in previous[key]["files"]:
+            path = os.path.join(output_images_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
 
     # Write label file
     with open(label_file_path, 'w', encoding='utf-8') as f:
         f.write('\n'.join(labels))
+    save_state(state_path, maps)
 
+    saved = len(labels)
     print(f"\n  ✅ {split_name} Results:")
     print(f"     Saved crops:        {saved:,}")
+    if only_changed:
+        print(f"     Unchanged maps:     {unchanged:,} of {len(data):,}")
     print(f"     Skipped illegible:  {skipped_illegible:,}")
     print(f"     Skipped too small:  {skipped_small:,}")
     print(f"     Skipped missing:    {skipped_missing:,}")
+    if failed:
+        print(f"     ⚠️  Failed writes:   {failed:,} (retried by the next run)")
     print(f"     Label file:         {label_file_path}")
     return saved
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Extract word crops from the ICDAR 2024 annotations.")
+    parser.add_argument("--only-changed", action="store_true",
+                        help="Skip maps whose annotations and image are unchanged since the last run")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="Maps extracted in parallel")
+    args = parser.parse_args()
+
     print("🗺️  ICDAR 2024 Word Crop Extractor")
     print("=" * 60)
     print("This uses OFFICIAL human-labeled ground truth annotations.")
@@ -143,23 +307,38 @@ def main():
     os.makedirs(train_out, exist_ok=True)
     os.makedirs(val_out, exist_ok=True)
 
-    # Process training split
-    train_saved = process_split(
-        annotations_path   = TRAIN_ANNOTATIONS,
-        images_dir         = TRAIN_IMAGES_DIR,
-        output_images_dir  = train_out,
-        label_file_path    = os.path.join(OUTPUT_DIR, "train_list.txt"),
-        split_name         = "train"
-    )
-
-    # Process validation split
-    val_saved = process_split(
-        annotations_path   = VAL_ANNOTATIONS,
-        images_dir         = VAL_IMAGES_DIR,
-        output_images_dir  = val_out,
-        label_file_path    = os.path.join(OUTPUT_DIR, "val_list.txt"),
-        split_name         = "val"
-    )
+    # One pool for both splits; the OpenCV threads are left to the encode
+    # threads, which the maps extracted at the same time share.
+    # A single worker runs in this process.
+    encode_threads = max(1, ENCODE_THREADS // max(1, args.workers))
+    if args.workers > 1:
+        workers = mp.get_context("spawn").Pool(args.workers, initializer=cv2.setNumThreads, initargs=(1,))
+    else:
+        workers = contextlib.nullcontext()
+    with workers as pool:
+        # Process training split
+        train_saved = process_split(
+            annotations_path   = TRAIN_ANNOTATIONS,
+            images_dir         = TRAIN_IMAGES_DIR,
+            output_images_dir  = train_out,
+            label_file_path    = os.path.join(OUTPUT_DIR, "train_list.txt"),
+            split_name         = "train",
+            pool               = pool,
+            only_changed       = args.only_changed,
+            encode_threads     = encode_threads,
+        )
+
+        # Process validation split
+        val_saved = process_split(
+            annotations_path   = VAL_ANNOTATIONS,
+            images_dir         = VAL_IMAGES_DIR,
+            output_images_dir  = val_out,
+            label_file_path    = os.path.join(OUTPUT_DIR, "val_list.txt"),
+            split_name         = "val",
+            pool               = pool,
+            only_changed       = args.only_changed,
+            encode_threads     = encode_threads,
+        )
 
     print(f"\n{'='*60}")
     print(f"🎉 DONE! Total crops extracted:")
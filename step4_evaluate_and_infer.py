@@ -5,7 +5,9 @@ After fine-tuning, this script:
 1. Evaluates the recognition model accuracy on the ICDAR validation set
 2. Runs the full OCR pipeline on your map images using the fine-tuned models
 3. Compares results with the baseline (pre-fine-tuning)
-4. Exports results to CSV
+4. Exports results to the columnar results store (core_pipeline/results_store.py),
+   and to a CSV (image_file, text, confidence, x_min ... bbox_coords) for
+   the dataset tools
 
 Usage:
   python step4_evaluate_and_infer.py
@@ -15,12 +17,12 @@ import os
 import sys
 import cv2
 import json
-import csv
 import numpy as np
 from tqdm import tqdm
 
-# Add PaddleOCR to path
+# Add PaddleOCR and the shared results store to path
 sys.path.insert(0, os.path.abspath("PaddleOCR_Official_Tools"))
+sys.path.insert(0, os.path.abspath("core_pipeline"))
 
 # ─── CONFIGURATION ────────────────────────────────────────────────────────────
 # Fine-tuned models (from step 2 & 3)
@@ -35,11 +37,16 @@ CHAR_DICT_PATH = "./PaddleOCR_Official_Tools/ppocr/utils/en_dict.txt"
 
 # Maps to run inference on
 MAPS_DIR    = "Rumsey_Map_OCR_Data/rumsey/icdar24-train-png/train_images"
+OUTPUT_STORE = "results/map_text_results_finetuned"
 OUTPUT_CSV  = "results/map_text_results_finetuned.csv"
 OUTPUT_VIZ  = "results/visualizations"
 
 # Confidence threshold for final output
 MIN_CONFIDENCE = 0.70
+
+# Detection cache: only the recognition model changes between experiments,
+# so boxes are reused from previous runs (None to disable)
+DET_CACHE_DIR = "cache/det"
 # ──────────────────────────────────────────────────────────────────────────────
 
 
@@ -68,6 +75,7 @@ def load_ocr_engine():
     args.rec_char_dict_path = CHAR_DICT_PATH
     args.use_angle_cls = False
     args.use_gpu = False  # Set to True if GPU available
+    args.det_cache_dir = DET_CACHE_DIR
 
     return TextSystem(args)
 
@@ -130,7 +138,7 @@ def evaluate_on_icdar_val(text_sys):
 
 
 def run_full_inference(text_sys, max_maps=None):
-    """Run OCR on all training maps and save results to CSV."""
+    """Run OCR on all training maps and save results to the results store."""
     print(f"\n🔍 Running full inference on maps in: {MAPS_DIR}")
 
     import glob
@@ -142,10 +150,13 @@ def run_full_inference(text_sys, max_maps=None):
 
     print(f"  Found {len(image_files)} map images")
 
-    os.makedirs(os.path.dirname(OUTPUT_CSV), exist_ok=True)
+    import results_store
+
+    os.makedirs(OUTPUT_STORE, exist_ok=True)
     os.makedirs(OUTPUT_VIZ, exist_ok=True)
+    results_store.clear(OUTPUT_STORE)
 
-    results = []
+    total, conf_sum, num_images = 0, 0.0, 0
 
     for img_path in tqdm(image_files, desc="  Processing maps"):
         img = cv2.imread(img_path)
@@ -153,53 +164,45 @@ def run_full_inference(text_sys, max_maps=None):
             continue
 
         try:
-            preds = text_sys(img)
+            preds = text_sys(img, return_det_scores=True)
             dt_boxes = preds[0]
             rec_res  = preds[1]
+            det_scores = preds[2]
 
             if dt_boxes is None or rec_res is None:
                 continue
 
             img_name = os.path.basename(img_path)
 
-            for box, (text, conf) in zip(dt_boxes, rec_res):
-                if conf < MIN_CONFIDENCE:
-                    continue
-
-                xs = [p[0] for p in box]
-                ys = [p[1] for p in box]
+            confs = np.array([conf for _, conf in rec_res], dtype=np.float32)
+            keep = confs >= MIN_CONFIDENCE
+            if not keep.any():
+                continue
 
-                results.append({
-                    'image_file':  img_name,
-                    'text':        text,
-                    'confidence':  round(float(conf), 4),
-                    'x_min':       int(min(xs)),
-                    'y_min':       int(min(ys)),
-                    'x_max':       int(max(xs)),
-                    'y_max':       int(max(ys)),
-                    'bbox_coords': str([[int(p[0]), int(p[1])] for p in box])
-                })
+            table = results_store.make_table(
+                np.asarray(dt_boxes, dtype=np.float32).reshape(-1, 4, 2)[keep],
+                [text for (text, _), k in zip(rec_res, keep) if k],
+                confs[keep],
+                np.asarray(det_scores, dtype=np.float32)[keep],
+            )
+            results_store.write_map(OUTPUT_STORE, img_name, table)
+            total += table.num_rows
+            conf_sum += float(confs[keep].sum())
+            num_images += 1
 
         except Exception as e:
             continue
 
-    # Save to CSV
-    if results:
-        fieldnames = ['image_file', 'text', 'confidence', 'x_min', 'y_min', 'x_max', 'y_max', 'bbox_coords']
-        with open(OUTPUT_CSV, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(results)
-
-        avg_conf = sum(r['confidence'] for r in results) / len(results)
-        print(f"\n  ✅ Results saved to: {OUTPUT_CSV}")
-        print(f"     Total detections:  {len(results):,}")
-        print(f"     Avg confidence:    {avg_conf:.1%}")
-        print(f"     Unique images:     {len(set(r['image_file'] for r in results))}")
+    if total:
+        results_store.export_box_csv(OUTPUT_STORE, OUTPUT_CSV)
+        print(f"\n  ✅ Results saved to: {OUTPUT_STORE} and {OUTPUT_CSV}")
+        print(f"     Total detections:  {total:,}")
+        print(f"     Avg confidence:    {conf_sum / total:.1%}")
+        print(f"     Unique images:     {num_images}")
     else:
         print("  ⚠️  No results generated")
 
-    return results
+    return total
 
 
 def main():
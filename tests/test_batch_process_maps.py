@@ -0,0 +1,143 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..", "core_pipeline")))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..", "PaddleOCR_Official_Tools")))
+
+import batch_process_maps
+from tools.infer.predict_system import TextSystem
+
+
+class FakeDetector:
+    """One 100x20 box per label painted by _write_map, scored 0.9 and 0.65 in turn."""
+
+    def __call__(self, img, return_scores=False):
+        if img[0, 0, 0] == 255:
+            raise ValueError("unreadable map")
+        num = int(img[0, 0, 0])
+        if num == 0:
+            return None, None, 0.1
+        boxes = np.array(
+            [[[10, y], [110, y], [110, y + 20], [10, y + 20]] for y in 10 + 40 * np.arange(num)],
+            dtype=np.float32,
+        )
+        return boxes, np.where(np.arange(num) % 2, 0.65, 0.9).astype(np.float32), 0.1
+
+
+class FakeRecognizer:
+    """Reads a crop as its pixel value and records the batch sizes."""
+
+    rec_cache = None
+    rec_image_shape = [3, 48, 320]
+    rec_batch_num = 4
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, img_list):
+        self.calls.append(len(img_list))
+        return [("w{}".format(int(round(img.mean()))), 0.9) for img in img_list], 0.01
+
+
+def _engine(gate=0, policy="skip"):
+    text_sys = object.__new__(TextSystem)
+    text_sys.args = SimpleNamespace(
+        use_tiled_det=False,
+        use_pyramid_det=False,
+        det_box_type="quad",
+        save_crop_res=False,
+        rec_pool_size=8,
+    )
+    text_sys.text_detector = FakeDetector()
+    text_sys.det_cache = None
+    text_sys.text_recognizer = FakeRecognizer()
+    text_sys.rec_score_gate = gate
+    text_sys.rec_gate_policy = policy
+    text_sys.gate_stats = {"boxes": 0, "skipped": 0, "deferred": 0, "cheap": 0}
+    text_sys.deferred = []
+    text_sys.use_angle_cls = False
+    text_sys.drop_score = 0.5
+    return text_sys
+
+
+def _write_map(path, num_labels):
+    """A map with num_labels labels; pixel (0, 0) tells the fake detector how many."""
+    img = np.zeros((40 * max(num_labels, 1) + 20, 120, 3), dtype=np.uint8)
+    for k in range(num_labels):
+        img[10 + 40 * k - 2:10 + 40 * k + 22, 8:112] = 20 + 10 * k + num_labels
+    img[0, 0] = num_labels
+    cv2.imwrite(path, img)
+    return path
+
+
+@pytest.fixture
+def maps(tmp_path):
+    files = [_write_map(str(tmp_path / "map_{}.png".format(i)), n) for i, n in enumerate([3, 1, 0, 5, 2])]
+    # unreadable image in the middle of the chunk
+    (tmp_path / "broken.png").write_bytes(b"not a png")
+    files.insert(2, str(tmp_path / "broken.png"))
+    return files
+
+
+def _tables(results):
+    return [(fname, table, error) for fname, table, error, _, _ in results]
+
+
+def test_chunk_matches_maps_run_one_by_one(maps, monkeypatch):
+    monkeypatch.setattr(batch_process_maps, "_text_sys", _engine())
+    one_by_one = [batch_process_maps.process_map(f, with_crops=True) for f in maps]
+    calls_one_by_one = batch_process_maps._text_sys.text_recognizer.calls
+
+    monkeypatch.setattr(batch_process_maps, "_text_sys", _engine())
+    results, stats = batch_process_maps.process_maps(maps, with_crops=True)
+
+    assert [r[0] for r in results] == [os.path.basename(f) for f in maps]
+    for (fname, table, error, crops, _), expected in zip(results, one_by_one):
+        assert error is None
+        if expected[1] is None:
+            assert table is None
+            continue
+        assert table.equals(expected[1])
+        assert crops[0] == expected[3][0]
+    assert results[0][1].column("text").to_pylist() == ["w23", "w33", "w43"]
+    # the 11 crops of the chunk go through in full batches, not one call per map
+    assert sum(calls_one_by_one) == sum(batch_process_maps._text_sys.text_recognizer.calls) == 11
+    assert batch_process_maps._text_sys.text_recognizer.calls == [8, 3]
+    assert stats["rec_gated"] == 0
+
+
+def test_deferred_boxes_are_merged_back(maps, monkeypatch):
+    monkeypatch.setattr(batch_process_maps, "_text_sys", _engine())
+    expected, _ = batch_process_maps.process_maps(maps)
+
+    monkeypatch.setattr(batch_process_maps, "_text_sys", _engine(gate=0.7, policy="defer"))
+    results, stats = batch_process_maps.process_maps(maps)
+    for (_, table, *_), (_, expected_table, *_) in zip(results, expected):
+        assert (table is None and expected_table is None) or table.equals(expected_table)
+    assert stats["rec_gated"] == 4
+    assert batch_process_maps._text_sys.deferred == []
+
+    monkeypatch.setattr(batch_process_maps, "_text_sys", _engine(gate=0.7, policy="skip"))
+    results, stats = batch_process_maps.process_maps(maps)
+    assert results[0][1].column("text").to_pylist() == ["w23", "w43"]
+    assert stats["rec_gated"] == 4
+
+
+def test_failing_map_does_not_cost_its_chunk(maps, tmp_path, monkeypatch):
+    bad = str(tmp_path / "bad.png")
+    img = np.zeros((60, 120, 3), dtype=np.uint8)
+    img[0, 0] = 255
+    cv2.imwrite(bad, img)
+    monkeypatch.setattr(batch_process_maps, "_text_sys", _engine())
+
+    results, _ = batch_process_maps.process_maps(maps[:2] + [bad] + maps[2:])
+    assert results[2][2] == "unreadable map"
+    assert [fname for fname, table, *_ in results if table is not None] == [
+        "map_0.png", "map_1.png", "map_2.png", "map_3.png", "map_4.png"
+    ]
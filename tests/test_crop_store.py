@@ -0,0 +1,121 @@
+import os
+import re
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..", "core_pipeline")))
+
+import crop_store
+from crop_store import CropStore
+
+
+def test_encode_append_and_read(tmp_path):
+    image = np.zeros((200, 300, 3), dtype=np.uint8)
+    image[50:60, 100:180] = 255
+    boxes = [
+        [[100, 50], [180, 50], [180, 60], [100, 60]],
+        [[500, 500], [520, 500], [520, 510], [500, 510]],  # outside the map
+        [[0, 0], [300, 0], [300, 200], [0, 200]],  # taller than THUMB_HEIGHT
+    ]
+    crops, rects = crop_store.encode_crops(image, boxes)
+    assert crops[1] == b""
+    assert rects[0].tolist() == [96, 46, 184, 64]
+
+    root = str(tmp_path / "crops")
+    CropStore(root).append("a.png", crops, rects)
+    CropStore(root).append("b.png", crops[:1], rects[:1])
+    store = CropStore(root)
+
+    thumb = cv2.imdecode(np.frombuffer(store.read("a.png", 0), np.uint8), cv2.IMREAD_COLOR)
+    assert thumb.shape == (18, 88, 3)
+    assert store.read("b.png", 0) == crops[0]
+    assert cv2.imdecode(np.frombuffer(store.read("a.png", 2), np.uint8), cv2.IMREAD_COLOR).shape[0] == crop_store.THUMB_HEIGHT
+    assert store.read("a.png", 1) is None
+    assert store.read("a.png", 3) is None
+    assert store.read("c.png", 0) is None
+
+    # the box ids of a label that have a thumbnail
+    assert store.box_ids("a.png", [0, 1, 2, 7]) == [0, 2]
+    assert store.box_ids("a.png", None) == []
+    assert store.box_ids("c.png", [0]) == []
+
+    # a map written again replaces its entry
+    CropStore(root).append("a.png", [b"new"], [[0, 0, 1, 1]])
+    store.refresh()
+    assert store.read("a.png", 0) == b"new"
+    assert store.read("a.png", 2) is None
+    store.close()
+
+
+def _crops(map_id, generation):
+    # lengths change with the generation, so offsets of another pack are wrong
+    return [
+        "m{}b{}g{}".format(map_id, box_id, generation).encode() * (1 + (generation + box_id) % 3)
+        for box_id in range(20)
+    ]
+
+
+def test_reads_while_the_store_is_cleared_and_rewritten(tmp_path):
+    root = str(tmp_path / "crops")
+    writer = CropStore(root)
+    for map_id in range(4):
+        writer.append(str(map_id), _crops(map_id, 0), np.zeros((20, 4)))
+    store = CropStore(root)
+    stop = threading.Event()
+    errors, reads = [], []
+
+    def rewrite():
+        generation = 0
+        while not stop.is_set():
+            generation += 1
+            crop_store.clear(root)
+            writer.refresh()
+            for map_id in range(4):
+                writer.append(str(map_id), _crops(map_id, generation), np.zeros((20, 4)))
+
+    def refresh():
+        while not stop.is_set():
+            try:
+                store.refresh()
+            except Exception as e:
+                errors.append(e)
+
+    def read(seed):
+        rng = np.random.default_rng(seed)
+        count = 0
+        while not stop.is_set():
+            map_id, box_id = int(rng.integers(4)), int(rng.integers(20))
+            try:
+                data = store.read(str(map_id), box_id)
+            except Exception as e:
+                errors.append(e)
+                continue
+            count += 1
+            if data is None:
+                continue
+            match = re.fullmatch(rb"(m(\d+)b(\d+)g(\d+))+", data)
+            generation = int(match.group(4)) if match else -1
+            if data != _crops(map_id, generation)[box_id]:
+                errors.append(AssertionError("({}, {}) read {!r}".format(map_id, box_id, data)))
+        reads.append(count)
+
+    threads = [threading.Thread(target=rewrite), threading.Thread(target=refresh)]
+    threads += [threading.Thread(target=read, args=(seed,)) for seed in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(2)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sum(reads) > 0
+    store.refresh()
+    assert store.read("0", 0) is not None
+    store.close()
+    writer.close()
@@ -0,0 +1,111 @@
+import json
+import multiprocessing as mp
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+
+import step1_extract_icdar_crops as step1
+
+
+def _word(x, text):
+    return {"vertices": [[x, 10], [x + 40, 10], [x + 40, 40], [x, 40]], "text": text}
+
+
+@pytest.fixture
+def split(tmp_path, monkeypatch):
+    """Two maps, a.png listed twice, and a function running the split."""
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    rng = np.random.default_rng(0)
+    for name in ("a.png", "b.png"):
+        cv2.imwrite(str(images_dir / name), rng.integers(0, 255, (100, 200, 3), dtype=np.uint8))
+    data = [
+        {"image": "a.png", "groups": [[_word(0, "A1"), _word(50, "A2")]]},
+        {"image": "b.png", "groups": [[_word(0, "B1"), {"vertices": [], "text": "", "illegible": True}]]},
+        {"image": "a.png", "groups": [[_word(100, "A3")]]},
+    ]
+    annotations = tmp_path / "annotations.json"
+    annotations.write_text(json.dumps(data))
+    monkeypatch.setattr(step1, "OUTPUT_DIR", str(tmp_path / "rec"))
+
+    decoded = []
+    imdecode = cv2.imdecode
+
+    def counting_imdecode(buf, flags):
+        decoded.append(1)
+        return imdecode(buf, flags)
+    monkeypatch.setattr(step1.cv2, "imdecode", counting_imdecode)
+
+    output_dir = tmp_path / "rec" / "train"
+    label_file = tmp_path / "rec" / "train_list.txt"
+
+    def run(only_changed=False, pool=None):
+        decoded.clear()
+        saved = step1.process_split(
+            str(annotations), str(images_dir), str(output_dir), str(label_file), "train",
+            pool=pool, only_changed=only_changed, encode_threads=2,
+        )
+        return saved, len(decoded), label_file.read_text().split("\n"), sorted(os.listdir(output_dir))
+
+    return run, annotations, data
+
+
+def test_duplicate_entries_are_kept_apart(split):
+    run, _, _ = split
+    saved, decoded, labels, files = run()
+    assert saved == 4
+    assert decoded == 3
+    assert labels == ["train/a_g0_w0.jpg\tA1", "train/a_g0_w1.jpg\tA2", "train/b_g0_w0.jpg\tB1", "train/a_2_g0_w0.jpg\tA3"]
+    assert files == ["a_2_g0_w0.jpg", "a_g0_w0.jpg", "a_g0_w1.jpg", "b_g0_w0.jpg"]
+
+
+def test_only_changed_skips_unchanged_maps(split):
+    run, annotations, data = split
+    first = run()
+
+    assert run(only_changed=True) == (4, 0, first[2], first[3])
+
+    # one word of b.png changes: only b.png is decoded again
+    data[1]["groups"][0][0]["text"] = "B2"
+    annotations.write_text(json.dumps(data))
+    saved, decoded, labels, files = run(only_changed=True)
+    assert decoded == 1
+    assert labels[2] == "train/b_g0_w0.jpg\tB2"
+
+    # a map dropped from the annotations loses its crops
+    annotations.write_text(json.dumps(data[:2]))
+    saved, decoded, labels, files = run(only_changed=True)
+    assert decoded == 0
+    assert files == ["a_g0_w0.jpg", "a_g0_w1.jpg", "b_g0_w0.jpg"]
+
+
+def test_failed_writes_are_not_labelled_and_retried(split, monkeypatch):
+    run, _, _ = split
+    imwrite = cv2.imwrite
+    monkeypatch.setattr(
+        step1.cv2, "imwrite",
+        lambda path, img, params: False if path.endswith("b_g0_w0.jpg") else imwrite(path, img, params),
+    )
+    saved, _, labels, files = run()
+    assert saved == 3
+    assert "train/b_g0_w0.jpg\tB1" not in labels
+    assert "b_g0_w0.jpg" not in files
+
+    monkeypatch.setattr(step1.cv2, "imwrite", imwrite)
+    saved, decoded, labels, files = run(only_changed=True)
+    assert saved == 4
+    assert decoded == 1
+    assert labels[2] == "train/b_g0_w0.jpg\tB1"
+
+
+def test_pool_gives_the_same_output(split):
+    run, _, _ = split
+    serial = run()
+    with mp.Pool(2) as pool:
+        assert run(pool=pool)[::2] == serial[::2]
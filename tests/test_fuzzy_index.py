@@ -0,0 +1,67 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from rapidfuzz.distance import Levenshtein
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..", "tools")))
+
+from fuzzy_index import FuzzyIndex
+
+LETTERS = list("abcdeiloprst")
+
+
+def _texts(count, seed):
+    rng = np.random.default_rng(seed)
+    words = ["".join(rng.choice(LETTERS, size=rng.integers(1, 8))) for _ in range(count)]
+    # some case variants of the same word
+    return [w.upper() if i % 7 == 0 else w for i, w in enumerate(words)]
+
+
+def _brute_force(texts, query, max_distance):
+    return sorted({
+        (Levenshtein.distance(query.lower(), word.lower()), word)
+        for word in texts
+        if Levenshtein.distance(query.lower(), word.lower()) <= max_distance
+    })
+
+
+@pytest.mark.parametrize("max_distance", [1, 2])
+def test_candidates_match_a_scan_of_the_vocabulary(max_distance):
+    texts = _texts(400, seed=0)
+    index = FuzzyIndex(texts, max_distance=max_distance)
+    for query in _texts(60, seed=1) + ["", "Sore", "x"]:
+        assert sorted(index.candidates(query)) == _brute_force(texts, query, max_distance)
+
+
+def test_rows_and_counts_of_words():
+    index = FuzzyIndex(["Lac", "Lac", "lac", 3])
+    assert index.words == ["Lac", "lac", "3"]
+    assert index.counts == {"Lac": 2, "lac": 1, "3": 1}
+    assert index.rows["Lac"].tolist() == [0, 1]
+    # both forms are 0 edits away: the most frequent comes first
+    assert [(word, count) for word, _, count in index.search("lac", limit=2)] == [("Lac", 2), ("lac", 1)]
+
+
+def test_index_built_on_a_previous_one_matches_a_fresh_one():
+    old_texts = _texts(400, seed=0)
+    new_texts = old_texts[100:] + _texts(100, seed=2)
+    base = FuzzyIndex(old_texts)
+    updated = FuzzyIndex(new_texts, base=base)
+    fresh = FuzzyIndex(new_texts)
+
+    assert updated.delete_map is base.delete_map
+    for query in _texts(60, seed=3) + old_texts[:20]:
+        assert sorted(updated.candidates(query)) == sorted(fresh.candidates(query))
+        assert updated.search(query) == fresh.search(query)
+    # the previous index still answers as before
+    for query in old_texts[:20]:
+        assert sorted(base.candidates(query)) == _brute_force(old_texts, query, base.max_distance)
+
+
+def test_dictionary_is_rebuilt_once_stale_words_dominate():
+    base = FuzzyIndex(_texts(400, seed=0))
+    updated = FuzzyIndex(_texts(20, seed=4), base=base)
+    assert updated.delete_map is not base.delete_map
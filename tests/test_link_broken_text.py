@@ -0,0 +1,155 @@
+import ast
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..", "core_pipeline")))
+
+import link_broken_text
+import results_store
+from link_broken_text import get_box_center, get_box_height, merge_boxes
+
+
+def _reference_process_map_data(df):
+    # process_map_data before the NumPy rewrite (pandas rows, full rescans)
+    if isinstance(df.iloc[0]['Box Coordinates'], str):
+        df['Box Coordinates'] = df['Box Coordinates'].apply(ast.literal_eval)
+    df['x_min'] = df['Box Coordinates'].apply(lambda b: min(p[0] for p in b))
+    df = df.sort_values('x_min').reset_index(drop=True)
+
+    merged_data = []
+    used_indices = set()
+    for i in range(len(df)):
+        if i in used_indices:
+            continue
+        current_box = df.iloc[i]['Box Coordinates']
+        current_text = str(df.iloc[i]['Detected Text'])
+        current_conf = float(df.iloc[i]['Confidence'])
+        current_h = get_box_height(current_box)
+        has_merged = True
+        while has_merged:
+            has_merged = False
+            best_merge_idx = -1
+            for j in range(len(df)):
+                if i == j or j in used_indices:
+                    continue
+                next_box = df.iloc[j]['Box Coordinates']
+                next_h = get_box_height(next_box)
+                if abs(current_h - next_h) > (current_h * 0.5):
+                    continue
+                curr_x_max = max(p[0] for p in current_box)
+                next_x_min = min(p[0] for p in next_box)
+                gap = next_x_min - curr_x_max
+                allowed_gap = current_h * link_broken_text.MAX_HORIZONTAL_GAP_RATIO
+                if 0 < gap < allowed_gap:
+                    curr_y = get_box_center(current_box)[1]
+                    next_y = get_box_center(next_box)[1]
+                    if abs(curr_y - next_y) < (current_h * link_broken_text.MAX_VERTICAL_SHIFT_RATIO):
+                        best_merge_idx = j
+                        break
+            if best_merge_idx != -1:
+                target = df.iloc[best_merge_idx]
+                current_text += " " + str(target['Detected Text'])
+                current_conf = (current_conf + float(target['Confidence'])) / 2
+                current_box = merge_boxes(current_box, target['Box Coordinates'])
+                used_indices.add(best_merge_idx)
+                has_merged = True
+        merged_data.append({
+            'Filename': df.iloc[i]['Filename'],
+            'Detected Text': current_text,
+            'Confidence': f"{current_conf:.4f}",
+            'Box Coordinates': current_box
+        })
+        used_indices.add(i)
+    return pd.DataFrame(merged_data)
+
+
+def _rect(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+# a map label broken into letters and syllables, with neighbours the linking
+# must leave alone: too far, too tall, shifted to another line, overlapping
+FIXTURE = [
+    ("Mis", 0.9, _rect(100, 50, 130, 70)),
+    ("sis", 0.8, _rect(138, 51, 166, 71)),
+    ("sip", 0.7, _rect(172, 50, 200, 70)),
+    ("pi", 0.95, _rect(210, 49, 226, 69)),
+    ("River", 0.6, _rect(260, 50, 310, 70)),
+    ("LAKE", 0.9, _rect(320, 40, 380, 90)),
+    ("Town", 0.85, _rect(140, 58, 190, 78)),
+    ("St", 0.75, _rect(20, 200, 36, 216)),
+    ("Louis", 0.65, _rect(44, 201, 90, 217)),
+    ("12", 0.5, _rect(85, 203, 97, 213)),
+    ("N", 0.99, _rect(5, 300, 15, 310)),
+]
+
+
+def _table(rows):
+    texts, confs, boxes = zip(*rows)
+    return results_store.make_table(np.array(boxes, dtype=np.float32), texts, confs)
+
+
+def _linked(table):
+    linked = link_broken_text.process_map_data(table)
+    return (
+        linked.column(results_store.TEXT).to_pylist(),
+        linked.column(results_store.CONFIDENCE).to_pylist(),
+        results_store.boxes(linked).tolist(),
+    )
+
+
+def _reference(rows):
+    df = pd.DataFrame({
+        'Filename': "map.png",
+        'Detected Text': [text for text, _, _ in rows],
+        'Confidence': [conf for _, conf, _ in rows],
+        'Box Coordinates': [str(box) for _, _, box in rows],
+    })
+    expected = _reference_process_map_data(df)
+    return (
+        expected['Detected Text'].tolist(),
+        [float(conf) for conf in expected['Confidence']],
+        expected['Box Coordinates'].tolist(),
+    )
+
+
+def _assert_matches_reference(rows):
+    texts, confs, boxes = _linked(_table(rows))
+    expected_texts, expected_confs, expected_boxes = _reference(rows)
+    assert texts == expected_texts
+    np.testing.assert_allclose(confs, expected_confs, atol=5e-5)
+    assert boxes == expected_boxes
+
+
+def test_fixture_matches_previous_implementation():
+    texts, _, _ = _linked(_table(FIXTURE))
+    assert texts == ["N", "St Louis", "12", "Mis sis sip pi", "Town", "River", "LAKE"]
+    _assert_matches_reference(FIXTURE)
+    # the input order does not matter
+    _assert_matches_reference(FIXTURE[::-1])
+
+
+def test_random_maps_match_previous_implementation():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        rows = []
+        # distinct left edges: the old sort was not stable
+        for k, x in enumerate(rng.choice(400, size=rng.integers(1, 25), replace=False)):
+            y, width, height = rng.integers(0, 60), rng.integers(4, 40), rng.integers(8, 24)
+            rows.append(("w{}".format(k), round(float(rng.uniform(0.5, 1)), 2),
+                         _rect(int(x), int(y), int(x + width), int(y + height))))
+        _assert_matches_reference(rows)
+
+
+def test_missing_texts_add_nothing():
+    rows = [(None, 0.9, _rect(100, 50, 130, 70)), ("sis", 0.8, _rect(138, 51, 166, 71)),
+            (None, 0.7, _rect(172, 50, 200, 70)), (None, 0.9, _rect(20, 200, 36, 216))]
+    texts, confs, boxes = _linked(_table(rows))
+    # the pandas version wrote "nan" for them
+    assert texts == [None, "sis"]
+    np.testing.assert_allclose(confs, [0.9, 0.775])
+    assert boxes[1] == _rect(100, 50, 200, 71)
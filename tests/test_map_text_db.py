@@ -0,0 +1,89 @@
+import os
+import sys
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..", "core_pipeline")))
+
+import map_text_db
+import results_store
+
+
+def _write(root, map_id, texts, offset=0.0):
+    """One label per text, in a row of 100x20 boxes starting at x = offset."""
+    x = offset + 100 * np.arange(len(texts), dtype=np.float32)
+    boxes = np.stack([
+        np.stack([x, np.zeros_like(x)], axis=1),
+        np.stack([x + 90, np.zeros_like(x)], axis=1),
+        np.stack([x + 90, np.full_like(x, 20)], axis=1),
+        np.stack([x, np.full_like(x, 20)], axis=1),
+    ], axis=1)
+    results_store.write_map(root, map_id, results_store.make_table(boxes, texts, [0.9] * len(texts)))
+
+
+def _texts(conn, query, prefix=False):
+    return sorted((label["map"], label["text"]) for label in map_text_db.search_text(conn, query, prefix=prefix))
+
+
+def test_ingest_only_rewrites_the_changed_maps(tmp_path, monkeypatch):
+    monkeypatch.setattr(map_text_db, "BATCH_MAPS", 2)
+    root = str(tmp_path / "store")
+    db_path = str(tmp_path / "map_text.db")
+    _write(root, "a.png", ["Rivière Rouge", "Lac Noir"])
+    _write(root, "b.png", ["Montréal", "Rivière des Prairies"])
+    _write(root, "c.png", ["Québec"])
+
+    assert map_text_db.ingest(db_path, root) == (3, 0, 0)
+    conn = map_text_db.connect(db_path)
+    assert _texts(conn, "riviere") == [("a.png", "Rivière Rouge"), ("b.png", "Rivière des Prairies")]
+    assert _texts(conn, "mont", prefix=True) == [("b.png", "Montréal")]
+    conn.close()
+
+    # a re-run changes one map and drops another
+    _write(root, "a.png", ["Lac Blanc"])
+    os.remove(results_store.map_file(root, "c.png"))
+    assert map_text_db.ingest(db_path, root) == (1, 1, 0)
+    assert map_text_db.ingest(db_path, root, prune=True) == (0, 2, 1)
+
+    conn = map_text_db.connect(db_path)
+    assert _texts(conn, "riviere") == [("b.png", "Rivière des Prairies")]
+    assert _texts(conn, "lac") == [("a.png", "Lac Blanc")]
+    assert _texts(conn, "quebec") == []
+    assert conn.execute("SELECT name, num_labels FROM maps ORDER BY name").fetchall() == [
+        ("a.png", 1), ("b.png", 2)
+    ]
+    # the FTS and R*Tree tables follow the labels
+    assert conn.execute("SELECT count(*) FROM labels_fts").fetchone()[0] == 3
+    assert conn.execute("SELECT count(*) FROM labels_rtree").fetchone()[0] == 3
+    conn.close()
+
+
+def test_forced_ingest_of_one_map(tmp_path):
+    root = str(tmp_path / "store")
+    db_path = str(tmp_path / "map_text.db")
+    _write(root, "a.png", ["Lac Noir"])
+    _write(root, "b.png", ["Lac Blanc"])
+    map_text_db.ingest(db_path, root)
+
+    assert map_text_db.ingest(db_path, root, maps=["b.png"], only_changed=False) == (1, 0, 0)
+    conn = map_text_db.connect(db_path)
+    assert _texts(conn, "lac") == [("a.png", "Lac Noir"), ("b.png", "Lac Blanc")]
+    conn.close()
+
+
+def test_labels_in_window(tmp_path):
+    root = str(tmp_path / "store")
+    db_path = str(tmp_path / "map_text.db")
+    texts = ["w{}".format(i) for i in range(20)]
+    _write(root, "a.png", texts)
+    _write(root, "b.png", texts, offset=50)
+    map_text_db.ingest(db_path, root)
+
+    conn = map_text_db.connect(db_path)
+    # boxes of a.png span [100 i, 100 i + 90] in x
+    labels = map_text_db.labels_in_window(conn, "a.png", 385, 5, 705, 10)
+    assert [label["row"] for label in labels] == [3, 4, 5, 6, 7]
+    assert labels[0]["box"] == [[300, 0], [390, 0], [390, 20], [300, 20]]
+    assert map_text_db.labels_in_window(conn, "a.png", 0, 30, 2000, 40) == []
+    conn.close()
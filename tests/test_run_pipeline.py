@@ -0,0 +1,116 @@
+import csv
+import os
+import sys
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..", "core_pipeline")))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..", "PaddleOCR_Official_Tools")))
+
+import results_store
+import run_pipeline
+
+
+def _rect(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+# raw OCR results: (text, confidence, box) per map
+RAW = {
+    "a.png": [
+        # one label read in three pieces, linked then kept
+        ("Mis", 0.9, _rect(100, 50, 130, 70)),
+        ("sis", 0.8, _rect(138, 51, 166, 71)),
+        ("sip", 0.9, _rect(172, 50, 200, 70)),
+        # a confident compass letter is kept, a doubtful one is not
+        ("N", 0.95, _rect(10, 300, 20, 312)),
+        ("x", 0.85, _rect(400, 300, 410, 312)),
+        # garbage and weak guesses
+        (";;", 0.99, _rect(10, 400, 30, 420)),
+        ("Lake", 0.7, _rect(100, 400, 160, 420)),
+    ],
+    "b.png": [
+        ("Town", 0.95, _rect(10, 10, 60, 30)),
+        ("12", 0.5, _rect(200, 10, 220, 30)),
+    ],
+    "c.png": [
+        ("..", 0.99, _rect(10, 10, 30, 30)),
+    ],
+}
+
+
+def _write_raw(root):
+    for map_id, rows in RAW.items():
+        texts, confs, boxes = zip(*rows)
+        results_store.write_map(root, map_id, results_store.make_table(
+            np.array(boxes, dtype=np.float32), texts, confs, box_ids=[[i] for i in range(len(rows))]))
+
+
+def _labels(root):
+    return {
+        map_id: list(zip(
+            table.column(results_store.TEXT).to_pylist(),
+            [round(conf, 4) for conf in table.column(results_store.CONFIDENCE).to_pylist()],
+            table.column(results_store.BOX_IDS).to_pylist(),
+        ))
+        for map_id, table in results_store.iter_maps(root)
+    }
+
+
+def test_pipeline_links_filters_and_exports(tmp_path, monkeypatch):
+    raw_store = str(tmp_path / "raw")
+    _write_raw(raw_store)
+    # the OCR step yields the raw results map by map
+    monkeypatch.setattr(run_pipeline, "find_images", lambda: list(RAW))
+    monkeypatch.setattr(run_pipeline, "ocr_maps",
+                        lambda image_files, crops: results_store.iter_maps(raw_store))
+    monkeypatch.setattr(run_pipeline, "CROP_STORE", None)
+    monkeypatch.setattr(run_pipeline, "LINKED_STORE", str(tmp_path / "linked"))
+    monkeypatch.setattr(run_pipeline, "OUTPUT_STORE", str(tmp_path / "elite"))
+    monkeypatch.setattr(run_pipeline, "EXPORT_CSV", str(tmp_path / "elite.csv"))
+    run_pipeline.main()
+
+    # every raw label goes through linking...
+    assert _labels(str(tmp_path / "linked")) == {
+        "a.png": [("N", 0.95, [3]), (";;", 0.99, [5]), ("Mis sis sip", 0.875, [0, 1, 2]),
+                  ("Lake", 0.7, [6]), ("x", 0.85, [4])],
+        "b.png": [("Town", 0.95, [0]), ("12", 0.5, [1])],
+        "c.png": [("..", 0.99, [0])],
+    }
+    # ...then the elite filters; a map left without labels is still written
+    assert _labels(str(tmp_path / "elite")) == {
+        "a.png": [("N", 0.95, [3]), ("Mis sis sip", 0.875, [0, 1, 2])],
+        "b.png": [("Town", 0.95, [0])],
+        "c.png": [],
+    }
+    with open(tmp_path / "elite.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == results_store.CSV_HEADER
+    assert [row[:3] for row in rows[1:]] == [
+        ["a.png", "N", "0.9500"], ["a.png", "Mis sis sip", "0.8750"], ["b.png", "Town", "0.9500"],
+    ]
+
+    # step4's layout: integer extents and the box as a list of points
+    results_store.export_box_csv(str(tmp_path / "elite"), str(tmp_path / "boxes.csv"))
+    with open(tmp_path / "boxes.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows == [
+        results_store.BOX_CSV_HEADER,
+        ["a.png", "N", "0.95", "10", "300", "20", "312", str(_rect(10, 300, 20, 312))],
+        ["a.png", "Mis sis sip", "0.875", "100", "50", "200", "71", str(_rect(100, 50, 200, 71))],
+        ["b.png", "Town", "0.95", "10", "10", "60", "30", str(_rect(10, 10, 60, 30))],
+    ]
+
+
+def test_chain_counts_rows_and_keeps_map_order(tmp_path, monkeypatch):
+    raw_store = str(tmp_path / "raw")
+    _write_raw(raw_store)
+    monkeypatch.setattr(run_pipeline, "RAW_STORE", str(tmp_path / "raw_copy"))
+    stats = {"ocr": 0, "linked": 0, "elite": 0}
+
+    chain = run_pipeline.build_chain(results_store.iter_maps(raw_store), stats)
+    assert [map_id for map_id, _ in chain] == ["a.png", "b.png", "c.png"]
+    assert stats == {"ocr": 10, "linked": 8, "elite": 3}
+    # the raw copy is written as the maps stream through
+    assert _labels(str(tmp_path / "raw_copy")) == _labels(raw_store)
@@ -0,0 +1,102 @@
+import json
+import os
+import sys
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..", "core_pipeline")))
+
+import results_store
+import search_server
+from search_server import Indexes, SearchService
+
+
+def _write(root, map_id, texts):
+    boxes = np.array([[[10 * i, 0], [10 * i + 8, 0], [10 * i + 8, 5], [10 * i, 5]] for i in range(len(texts))])
+    results_store.write_map(root, map_id, results_store.make_table(boxes, texts, [0.9] * len(texts)))
+
+
+@pytest.fixture
+def server(tmp_path):
+    root = str(tmp_path / "store")
+    _write(root, "a.png", ["Rivière Rouge", "Lac Noir", None])
+    _write(root, "b.png", ["Rivière des Prairies", "Montréal"])
+    service = SearchService(root, str(tmp_path / "index.npz"))
+    httpd = search_server.make_server(service, port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield service, "http://127.0.0.1:{}".format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _get(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_search_request(server):
+    service, url = server
+    status, body = _get(url + "/search?q=riviere")
+    assert status == 200
+    assert body["total"] == 2
+    assert [(label["map"], label["row"], label["text"]) for label in body["results"]] == [
+        ("a.png", 0, "Rivière Rouge"), ("b.png", 0, "Rivière des Prairies")
+    ]
+    assert body["results"][0]["box"] == [[0, 0], [8, 0], [8, 5], [0, 5]]
+
+    # the second identical request is answered from the cache
+    assert _get(url + "/search?q=riviere")[1] == body
+    assert service.cache.hits == 1
+
+    status, body = _get(url + "/area?map=b.png&window=12,0,30,5")
+    assert status == 200
+    assert [label["text"] for label in body["results"]] == ["Montréal"]
+    status, body = _get(url + "/fuzzy?q=Montreal")
+    assert status == 200
+    assert body["matches"][0]["word"] == "Montréal"
+
+
+def test_errors(server, monkeypatch):
+    _, url = server
+    assert _get(url + "/search")[0] == 400
+    assert _get(url + "/area?map=c.png&window=0,0,1,1")[0] == 404
+    assert _get(url + "/nothing")[0] == 404
+
+    def fail(self, params):
+        raise RuntimeError("broken")
+    monkeypatch.setattr(Indexes, "search", fail)
+    status, body = _get(url + "/search?q=lac")
+    assert status == 500
+    assert body == {"error": "RuntimeError: broken"}
+    # the server keeps serving
+    assert _get(url + "/status")[0] == 200
+
+
+def test_reload_matches_a_fresh_load(server, tmp_path):
+    service, url = server
+    root = service.root
+    previous = service.indexes
+    _write(root, "a.png", ["Lac Blanc", "Rivière Noire"])
+    _write(root, "c.png", ["Québec"])
+
+    assert service.reload()
+    assert _get(url + "/search?q=lac")[1]["results"][0]["text"] == "Lac Blanc"
+    # b.png is unchanged: its words were not read again
+    assert service.indexes.map_words["b.png"] is previous.map_words["b.png"]
+
+    fresh = Indexes(root, str(tmp_path / "fresh.npz"))
+    assert service.indexes.num_rows == fresh.num_rows == 5
+    np.testing.assert_array_equal(service.indexes.word_rows, fresh.word_rows)
+    for query in ("Lac", "Riviere", "Quebec", "Montreal", "Rouge"):
+        assert (service.indexes.fuzzy({"q": query})["matches"]
+                == fresh.fuzzy({"q": query})["matches"])
+    assert not service.reload()
@@ -0,0 +1,93 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import shapely
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..", "core_pipeline")))
+
+import results_store
+import spatial_index
+from spatial_index import SpatialIndex
+
+
+def _boxes(count, seed):
+    """Random rotated rectangles on a 5000x4000 map."""
+    rng = np.random.default_rng(seed)
+    unit = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=np.float64)
+    size = np.stack([rng.uniform(10, 300, count), rng.uniform(5, 40, count)], axis=1)
+    angle = rng.uniform(-0.5, 0.5, count)
+    rotation = np.stack([np.cos(angle), -np.sin(angle), np.sin(angle), np.cos(angle)], axis=1).reshape(-1, 2, 2)
+    corners = (unit[None] * size[:, None]) @ rotation.transpose(0, 2, 1)
+    return (corners + rng.uniform([0, 0], [5000, 4000], size=(count, 1, 2))).astype(np.float32)
+
+
+@pytest.mark.parametrize("count", [0, 1, 15, 1000])
+def test_queries_match_a_scan_of_the_polygons(count):
+    boxes = _boxes(count, seed=count)
+    index = SpatialIndex.build(boxes)
+    polygons = shapely.polygons(boxes)
+    rng = np.random.default_rng(1)
+    allowed = rng.random(count) < 0.5
+
+    for x0, y0 in rng.uniform([0, 0], [4500, 3500], size=(20, 2)):
+        x1, y1 = x0 + rng.uniform(1, 800), y0 + rng.uniform(1, 800)
+        hits = shapely.intersects(polygons, shapely.box(x0, y0, x1, y1))
+        assert index.window(x0, y0, x1, y1).tolist() == np.flatnonzero(hits).tolist()
+        assert index.window(x0, y0, x1, y1, allowed=allowed).tolist() == np.flatnonzero(hits & allowed).tolist()
+
+        triangle = shapely.Polygon([(x0, y0), (x1, y0), (x0, y1)])
+        hits = shapely.intersects(polygons, triangle)
+        assert index.intersecting(triangle).tolist() == np.flatnonzero(hits).tolist()
+
+        for k in (1, 7):
+            distances = shapely.distance(polygons, shapely.Point(x1, y1))
+            nearest = index.nearest(x1, y1, k=k)
+            np.testing.assert_allclose(distances[nearest], np.sort(distances)[:k])
+            nearest = index.nearest(x1, y1, k=k, allowed=allowed)
+            assert allowed[nearest].all()
+            np.testing.assert_allclose(distances[nearest], np.sort(distances[allowed])[:k])
+
+
+def test_saved_index_is_reused_and_rebuilt_when_the_map_changes(tmp_path):
+    root = str(tmp_path / "store")
+    boxes = _boxes(200, seed=0)
+    results_store.write_map(root, "a.png", results_store.make_table(boxes, ["x"] * 200, [1.0] * 200))
+    path = os.path.join(os.path.dirname(results_store.map_file(root, "a.png")), spatial_index.INDEX_FILE)
+
+    index = spatial_index.open_map_index(root, "a.png")
+    assert os.path.exists(path)
+    reloaded = spatial_index.open_map_index(root, "a.png")
+    assert reloaded.source == index.source
+    assert reloaded.window(0, 0, 5000, 4000).tolist() == list(range(200))
+
+    results_store.write_map(root, "a.png", results_store.make_table(boxes[:50], ["x"] * 50, [1.0] * 50))
+    assert spatial_index.open_map_index(root, "a.png").window(0, 0, 5000, 4000).tolist() == list(range(50))
+
+
+def test_truncated_index_is_rebuilt(tmp_path):
+    root = str(tmp_path / "store")
+    boxes = _boxes(200, seed=0)
+    results_store.write_map(root, "a.png", results_store.make_table(boxes, ["x"] * 200, [1.0] * 200))
+    path = os.path.join(os.path.dirname(results_store.map_file(root, "a.png")), spatial_index.INDEX_FILE)
+    spatial_index.open_map_index(root, "a.png")
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) // 2)
+
+    assert spatial_index.open_map_index(root, "a.png").window(0, 0, 5000, 4000).tolist() == list(range(200))
+
+
+def test_query_map_combines_text_and_window(tmp_path):
+    root = str(tmp_path / "store")
+    boxes = _boxes(300, seed=2)
+    texts = ["Rivière {}".format(i) if i % 3 == 0 else "Lac {}".format(i) for i in range(300)]
+    results_store.write_map(root, "a.png", results_store.make_table(boxes, texts, [1.0] * 300))
+
+    window = (1000, 1000, 3000, 2500)
+    result = spatial_index.query_map(root, "a.png", window=window, text="riviere")
+    hits = shapely.intersects(shapely.polygons(boxes), shapely.box(*window))
+    expected = [i for i in np.flatnonzero(hits) if i % 3 == 0]
+    assert result.column("row").to_pylist() == expected
+    assert result.column(results_store.TEXT).to_pylist() == [texts[i] for i in expected]
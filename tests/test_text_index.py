@@ -0,0 +1,94 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..", "core_pipeline")))
+
+import results_store
+from text_index import TextIndex, normalize
+
+WORDS = ["Rivière", "riviere", "Saint", "Laurent", "MONTRÉAL", "Québec", "Lac", "Île", "de", "la"]
+
+
+def _write_store(root, num_maps=5, labels_per_map=40, seed=0):
+    """Random labels of WORDS; returns {map_id: texts}."""
+    rng = np.random.default_rng(seed)
+    maps = {}
+    for m in range(num_maps):
+        texts = [" ".join(rng.choice(WORDS, size=rng.integers(1, 4))) for _ in range(labels_per_map)]
+        boxes = rng.uniform(0, 1000, size=(labels_per_map, 4, 2))
+        results_store.write_map(
+            root, "map {}#.png".format(m),
+            results_store.make_table(boxes, texts, rng.uniform(0.5, 1.0, labels_per_map)),
+        )
+        maps["map {}#.png".format(m)] = texts
+    return maps
+
+
+def test_results_store_round_trip(tmp_path):
+    root = str(tmp_path / "store")
+    boxes = np.arange(3 * 8, dtype=np.float32).reshape(3, 4, 2)
+    table = results_store.make_table(
+        boxes, ["Lac", None, "Île"], [0.9, 0.5, 0.75], det_scores=[0.8, 0.7, 0.6],
+        box_ids=[[0], None, [1, 2]],
+    )
+    results_store.write_map(root, "a/b map.png", table)
+
+    assert results_store.map_ids(root) == ["a/b map.png"]
+    for memory_map in (True, False):
+        read = results_store.read_map(root, "a/b map.png", memory_map=memory_map)
+        assert read.column(results_store.TEXT).to_pylist() == ["Lac", None, "Île"]
+        np.testing.assert_allclose(read.column(results_store.CONFIDENCE).to_pylist(), [0.9, 0.5, 0.75])
+        np.testing.assert_array_equal(results_store.boxes(read), boxes)
+        assert results_store.box_ids(read) == [[0], None, [1, 2]]
+
+    rows = results_store.read_rows(root, [("a/b map.png", 2), ("a/b map.png", 0)], columns=[results_store.TEXT])
+    assert rows.column(results_store.TEXT).to_pylist() == ["Île", "Lac"]
+    assert rows.column(results_store.MAP_ID).to_pylist() == ["a/b map.png"] * 2
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+@pytest.mark.parametrize("query", ["riviere", "RIVIÈRE SAINT", "ont", "la", "e", "quebec lac", "xyz"])
+def test_search_matches_a_scan_of_the_store(tmp_path, mmap, query):
+    root = str(tmp_path / "store")
+    maps = _write_store(root)
+    index = TextIndex.open(root, str(tmp_path / "index.npz"), mmap=mmap)
+
+    for prefix in (False, True):
+        expected = [
+            (map_id, row)
+            for map_id in sorted(maps)
+            for row, text in enumerate(maps[map_id])
+            if (normalize(text).startswith(normalize(query)) if prefix else normalize(query) in normalize(text))
+        ]
+        assert index.search(query, prefix=prefix) == expected
+
+
+def test_index_is_rebuilt_when_the_store_changes(tmp_path):
+    root = str(tmp_path / "store")
+    index_path = str(tmp_path / "index.npz")
+    _write_store(root)
+    assert TextIndex.open(root, index_path).search("nowhere") == []
+
+    results_store.write_map(root, "map 1#.png", results_store.make_table(
+        np.zeros((2, 4, 2)), ["Nowhere", None], [1.0, 1.0],
+    ))
+    index = TextIndex.open(root, index_path)
+    assert index.search("nowhere") == [("map 1#.png", 0)]
+    # a null text matches nothing, not even the string "none"
+    assert index.search("none") == []
+
+
+def test_truncated_index_is_rebuilt(tmp_path):
+    root = str(tmp_path / "store")
+    index_path = str(tmp_path / "index.npz")
+    maps = _write_store(root)
+    TextIndex.open(root, index_path)
+    with open(index_path, "r+b") as f:
+        f.truncate(100)
+
+    index = TextIndex.open(root, index_path, mmap=True)
+    assert len(index.search("lac")) == sum("lac" in normalize(t) for texts in maps.values() for t in texts)
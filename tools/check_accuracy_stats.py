@@ -1,26 +1,33 @@
-import pandas as pd
+import os
+import sys
 import random
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core_pipeline"))
+import results_store
+
 # --- CONFIGURATION ---
-CSV_FILE = "map_text_results_linked.csv"
+RESULTS_STORE = "map_text_results_linked"
 
 def main():
     print("📊 Loading data...")
-    try:
-        df = pd.read_csv(CSV_FILE)
-    except FileNotFoundError:
-        print("❌ CSV not found.")
+    if not results_store.map_ids(RESULTS_STORE):
+        print("❌ Results not found.")
         return
+    # The boxes are not needed: only these three columns are read
+    df = results_store.read_table(
+        RESULTS_STORE,
+        columns=[results_store.MAP_ID, results_store.TEXT, results_store.CONFIDENCE],
+    ).to_pandas()
 
     total_words = len(df)
-    avg_conf = df['Confidence'].mean()
+    avg_conf = df[results_store.CONFIDENCE].mean()
     
     # 1. High Confidence Count
-    high_conf_df = df[df['Confidence'] >= 0.90]
+    high_conf_df = df[df[results_store.CONFIDENCE] >= 0.90]
     high_conf_count = len(high_conf_df)
     
     # 2. Low Confidence Count (Potential Errors)
-    low_conf_df = df[df['Confidence'] < 0.85]
+    low_conf_df = df[df[results_store.CONFIDENCE] < 0.85]
     low_conf_count = len(low_conf_df)
 
     print("-" * 40)
@@ -37,9 +44,9 @@ def main():
     
     sample = df.sample(5)
     for i, row in sample.iterrows():
-        print(f"File: {row['Filename']}")
-        print(f"  AI Read: '{row['Detected Text']}'")
-        print(f"  Certainty: {row['Confidence']*100:.1f}%")
+        print(f"File: {row[results_store.MAP_ID]}")
+        print(f"  AI Read: '{row[results_store.TEXT]}'")
+        print(f"  Certainty: {row[results_store.CONFIDENCE]*100:.1f}%")
         print("")
 
     print("👉 RULE OF THUMB: If 4 out of these 5 are correct, your accuracy is approx 80%.")
@@ -0,0 +1,99 @@
+from collections import defaultdict
+
+import numpy as np
+from rapidfuzz import fuzz, process
+from rapidfuzz.distance import Levenshtein
+
+# Queries are matched against every word within this many edits
+MAX_EDIT_DISTANCE = 2
+
+
+def deletes(word, max_distance=MAX_EDIT_DISTANCE):
+    """The word and every string obtained by deleting up to max_distance characters."""
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        results |= frontier
+    return results
+
+
+class FuzzyIndex:
+    """
+    SymSpell style deletion dictionary over the unique words of a text
+    column, with occurrence counts and the rows of every word.
+
+    Two words are within d edits only if deleting at most d characters
+    from each gives a common string, so a query only looks up its own
+    deletes instead of comparing against the whole vocabulary. Words are
+    matched case-insensitively.
+
+    An index of updated texts can be built from a previous one (base):
+    the deletion dictionary is shared and only the new words get their
+    deletes computed. Words that are gone stay in it but are never
+    returned; the dictionary is built afresh once they are the majority.
+    """
+
+    def __init__(self, texts, max_distance=MAX_EDIT_DISTANCE, base=None):
+        self.max_distance = max_distance
+        texts = [str(t) for t in texts]
+
+        # word -> rows, in row order (the first row is the first occurrence)
+        rows = defaultdict(list)
+        for i, text in enumerate(texts):
+            rows[text].append(i)
+        self.words = list(rows)
+        self.rows = {word: np.array(r, dtype=np.int64) for word, r in rows.items()}
+        self.counts = {word: len(r) for word, r in rows.items()}
+
+        # lower case form -> words, and delete -> lower case forms
+        if (base is not None and base.max_distance == max_distance
+                and len(base.forms) <= 2 * len(self.words)):
+            self.forms, self.delete_map = base.forms, base.delete_map
+        else:
+            self.forms, self.delete_map = defaultdict(list), defaultdict(list)
+        for word in self.words:
+            form = word.lower()
+            if form not in self.forms:
+                # deletes first: a reader sharing the dictionary may meet the
+                # form before its words are added (it then finds none)
+                for delete in deletes(form, max_distance):
+                    self.delete_map[delete].append(form)
+                self.forms[form] = []
+            if word not in self.forms[form]:
+                self.forms[form].append(word)
+
+    def candidates(self, query):
+        """(distance, word) for every word within max_distance edits of query."""
+        query_form = query.lower()
+        seen = set()
+        results = []
+        for delete in deletes(query_form, self.max_distance):
+            for form in self.delete_map.get(delete, ()):
+                if form in seen:
+                    continue
+                seen.add(form)
+                distance = Levenshtein.distance(query_form, form, score_cutoff=self.max_distance)
+                if distance <= self.max_distance:
+                    # words of a shared dictionary that are not in this index are skipped
+                    results.extend(
+                        (distance, word) for word in self.forms.get(form, ()) if word in self.counts
+                    )
+        return results
+
+    def search(self, query, limit=5):
+        """
+        Best matches as (word, score, count), closest and most frequent
+        first. score is the rapidfuzz WRatio of the match. Queries further
+        than max_distance edits from every word fall back to a linear
+        WRatio search over the vocabulary.
+        """
+        found = self.candidates(query)
+        if not found:
+            matches = process.extract(query, self.words, scorer=fuzz.WRatio, limit=limit)
+            return [(word, score, self.counts[word]) for word, score, _ in matches]
+        found.sort(key=lambda match: (match[0], -self.counts[match[1]], match[1]))
+        return [
+            (word, fuzz.WRatio(query, word), self.counts[word])
+            for _, word in found[:limit]
+        ]